@@ -1,21 +1,66 @@
 import boto3
+import functools
+import hashlib
 import json
 import base64
 import os
+from botocore.config import Config
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Concurrent runtime calls of the multi-image mode; the shared client pools this many connections.
+MAX_CONCURRENT_CALLS = int(os.environ.get("MAX_CONCURRENT_CALLS") or 8)
+
+
+@functools.cache
+def get_client():
+    """Shared bedrock-agentcore client: cached on first use, reused by every call and thread (boto3 clients are thread-safe)"""
+    return boto3.session.Session().client(
+        "bedrock-agentcore",
+        region_name=os.environ.get("DEFAULT_REGION", "us-east-1"),
+        config=Config(max_pool_connections=max(10, MAX_CONCURRENT_CALLS), read_timeout=300),
+    )
+
+
+# With a bucket set, images are uploaded once as raw bytes and requests carry only an s3:// reference.
+IMAGE_UPLOAD_BUCKET = os.environ.get("IMAGE_UPLOAD_BUCKET", "")
+IMAGE_UPLOAD_PREFIX = os.environ.get("IMAGE_UPLOAD_PREFIX", "alt-text/")
+
+
+@functools.cache
+def get_s3_client():
+    """Shared S3 client for image uploads; S3_ENDPOINT_URL points it at a local S3 stand-in"""
+    return boto3.session.Session().client(
+        "s3",
+        region_name=os.environ.get("DEFAULT_REGION", "us-east-1"),
+        endpoint_url=os.environ.get("S3_ENDPOINT_URL") or None,
+        config=Config(max_pool_connections=max(10, MAX_CONCURRENT_CALLS)),
+    )
+
+
+def upload_image(image_bytes, content_type):
+    """Upload raw image bytes under a content-addressed key; returns the s3:// reference"""
+    key = f"{IMAGE_UPLOAD_PREFIX}{hashlib.sha256(image_bytes).hexdigest()}"
+    get_s3_client().put_object(Bucket=IMAGE_UPLOAD_BUCKET, Key=key, Body=image_bytes, ContentType=content_type)
+    return f"s3://{IMAGE_UPLOAD_BUCKET}/{key}"
+
+
+def session_kwargs(request):
+    """Route every call of a session to the same runtime session, where its workflow state is kept"""
+    return {"runtimeSessionId": request["session_id"]} if request.get("session_id") else {}
+
 
 def invoke_agent_runtime(request):
-    print(f"Invoking agent runtime with request: {request}")
-    client = boto3.client("bedrock-agentcore", region_name=os.environ.get("DEFAULT_REGION", "us-east-1"))
+    client = get_client()
+    session = session_kwargs(request)
     request = json.dumps(request).encode("utf-8")
     
     response = client.invoke_agent_runtime(
         agentRuntimeArn=os.environ.get("AGENT_RUNTIME_ARN"),
         qualifier=os.environ.get("AGENT_API", "DEFAULT"),
         payload=request,
+        **session,
     )
     stream = response["response"]
 
@@ -28,9 +73,7 @@ def invoke_agent_runtime(request):
 
     if response_content:
         try:
-            response_json = json.loads(response_content)
-            print(f"Final response content: {response_json}")
-            return response_json
+            return json.loads(response_content)
         except Exception as e:
             print(f"Error parsing JSON response: {str(e)}")
             return {
@@ -43,4 +86,35 @@ def invoke_agent_runtime(request):
                 "waiting_for_feedback": True,
             }
     else:
-        return {"error": "No content in response chunks"}
\ No newline at end of file
+        return {"error": "No content in response chunks"}
+
+
+def invoke_agent_runtime_stream(request):
+    """Invoke the agent with streaming enabled and yield its events as they arrive.
+
+    Yields {"event": "stage" | "token" | "result", ...} dicts; a runtime that answers
+    with plain JSON instead of server-sent events produces a single result event.
+    """
+    client = get_client()
+    session = session_kwargs(request)
+    request = json.dumps({**request, "stream": True}).encode("utf-8")
+
+    response = client.invoke_agent_runtime(
+        agentRuntimeArn=os.environ.get("AGENT_RUNTIME_ARN"),
+        qualifier=os.environ.get("AGENT_API", "DEFAULT"),
+        payload=request,
+        **session,
+    )
+
+    if "text/event-stream" not in response.get("contentType", ""):
+        yield {"event": "result", "state": json.loads(response["response"].read())}
+        return
+
+    for line in response["response"].iter_lines():
+        line = line.decode("utf-8") if isinstance(line, (bytes, bytearray)) else line
+        if not line.startswith("data: "):
+            continue
+        event = json.loads(line[len("data: "):])
+        if "error" in event:
+            raise RuntimeError(event.get("error"))
+        yield event
@@ -4,7 +4,16 @@ import base64
 from PIL import Image
 import io
 import json
-from agent_core_runtime import invoke_agent_runtime
+import os
+import uuid
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from agent_core_runtime import (IMAGE_UPLOAD_BUCKET, MAX_CONCURRENT_CALLS, invoke_agent_runtime,
+                                invoke_agent_runtime_stream, upload_image)
+
+# Longest edge and byte budget of images sent to the model; larger uploads are downscaled
+MAX_IMAGE_DIMENSION = int(os.environ.get("MAX_IMAGE_DIMENSION") or 1568)
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES") or 3_750_000)
 
 st.set_page_config(
     page_title="Alt-Text Generator with Feedback",
@@ -21,42 +30,216 @@ def init_session_state():
         st.session_state.feedback_given = False
     if 'feedback_text' not in st.session_state:
         st.session_state.feedback_text = ""
+    if 'encoded_images' not in st.session_state:
+        st.session_state.encoded_images = {}
+    if 'batch' not in st.session_state:
+        st.session_state.batch = {}
 
-def image_to_base64(image_file):
-    """Convert uploaded image to base64 string with original format and data URI prefix"""
-    try:
-        image = Image.open(image_file)
-        format = image.format  # e.g., 'PNG', 'JPEG'
-        mime_type = f"image/{format.lower()}" if format else "image/jpeg"
+def file_key(uploaded_file):
+    """Identity of an upload that is stable across reruns, without re-reading or hashing its bytes"""
+    return getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
 
-        # Convert to RGB only if needed for JPEG
-        if format == 'JPEG' and image.mode in ('RGBA', 'LA', 'P'):
-            image = image.convert('RGB')
+def prepare_upload(image_bytes):
+    """Image bytes and MIME type to send, downscaled to the model's size budget (no Streamlit calls, safe in worker threads)"""
+    image = Image.open(io.BytesIO(image_bytes))
+    format = image.format  # e.g., 'PNG', 'JPEG'
+    mime_type = f"image/{format.lower()}" if format else "image/jpeg"
 
+    # Images that already fit are sent as uploaded, without re-encoding
+    if max(image.size) > MAX_IMAGE_DIMENSION or len(image_bytes) > MAX_IMAGE_BYTES:
+        image.draft("RGB", (MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION))
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        image.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.BICUBIC, reducing_gap=2.0)
+
+        # Graphics stay lossless PNG, photos are re-encoded as JPEG
+        format = 'PNG' if has_alpha or format == 'PNG' else 'JPEG'
+        mime_type = f"image/{format.lower()}"
         buffer = io.BytesIO()
-        image.save(buffer, format=format)
-        buffer.seek(0)
+        image.save(buffer, format=format, quality=85)
+        image_bytes = buffer.getvalue()
 
-        img_base64 = base64.b64encode(buffer.getvalue()).decode()
-        return f"data:{mime_type};base64,{img_base64}"
-    except Exception as e:
-        st.error(f"Error processing image: {str(e)}")
-        return None
+    return image_bytes, mime_type
+
+def encode_image(image_bytes):
+    """Image fields of a request: an s3:// reference to the uploaded bytes when IMAGE_UPLOAD_BUCKET is set
+    (falling back to inline if the upload fails), else an inline base64 data URI"""
+    image_bytes, mime_type = prepare_upload(image_bytes)
+    if IMAGE_UPLOAD_BUCKET:
+        try:
+            return {"image_ref": upload_image(image_bytes, mime_type)}
+        except Exception as e:
+            print(f"Image upload failed, sending the image inline: {str(e)}")
+    img_base64 = base64.b64encode(image_bytes).decode()
+    return {"image_data": f"data:{mime_type};base64,{img_base64}"}
+
+def image_fields(image_file):
+    """Request fields carrying the uploaded image, prepared once per upload"""
+    key = file_key(image_file)
+    if key not in st.session_state.encoded_images:
+        try:
+            st.session_state.encoded_images[key] = encode_image(image_file.getvalue())
+        except Exception as e:
+            st.error(f"Error processing image: {str(e)}")
+            return None
+    return st.session_state.encoded_images[key]
         
-def make_api_call(payload):
-    """Make API call to alt-text generation service"""
+# Stage events arrive as each workflow node finishes; show what runs next
+STAGE_LABELS = {
+    "routing": "Processing image...",
+    "preprocess": "Analyzing complexity...",
+    "complexity_analysis": "Writing alt-text...",
+}
+
+def make_streaming_api_call(payload, placeholder):
+    """Call the alt-text service with streaming, rendering the alt-text in placeholder as it arrives"""
     try:
-        return invoke_agent_runtime(payload)
+        alt_text = ""
+        for event in invoke_agent_runtime_stream(payload):
+            if event.get("event") == "token":
+                alt_text += event["text"]
+                placeholder.success(alt_text + " ▌")
+            elif event.get("event") == "stage" and not alt_text:
+                placeholder.info(STAGE_LABELS.get(event.get("node"), "Generating alt-text..."))
+            elif event.get("event") == "result":
+                placeholder.empty()
+                return event["state"]
     except Exception as e:
+        placeholder.empty()
         st.error(f"Agent Runtime call failed: {str(e)}")
         print(f"Error details: {str(e)}")
-        return None
+    return None
 
 def reset_state_for_new_image():
     """Reset session state when a new image is uploaded"""
     st.session_state.api_response = None
     st.session_state.feedback_given = False
 
+def generate_for_image(image_bytes, fields, user_input):
+    """Worker thread: encode (or upload) the image unless already cached, then run a generation session for it"""
+    fields = fields or encode_image(image_bytes)
+    session_id = str(uuid.uuid4())
+    state = invoke_agent_runtime({"session_id": session_id, **fields, "user_input": user_input, "max_revisions": 3})
+    if "error" in state:
+        raise RuntimeError(state["error"])
+    return fields, {**state, "session_id": session_id}
+
+def row_status(state):
+    if not state.get("waiting_for_feedback"):
+        return "approved"
+    if state.get("revision_count", 0) >= state.get("max_revisions", 3):
+        return "max revisions"
+    return "ready"
+
+def results_table(files):
+    rows = []
+    for uploaded_file in files:
+        row = st.session_state.batch.get(file_key(uploaded_file), {})
+        state = row.get("state") or {}
+        rows.append({
+            "Image": uploaded_file.name,
+            "Status": row.get("status", "not started"),
+            "Complexity": state.get("complexity_level", ""),
+            "Alt-text": state.get("generated_alt_text") or row.get("error", ""),
+            "Revisions": state.get("revision_count", ""),
+        })
+    return pd.DataFrame(rows)
+
+def generate_batch(files, user_input, table, progress):
+    """Submit every image without a result through a bounded thread pool; update the table as each one finishes"""
+    batch = st.session_state.batch
+    pending = [f for f in files if batch.get(file_key(f), {}).get("status") in (None, "error")]
+    if not pending:
+        return
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CALLS) as pool:
+        futures = {}
+        for uploaded_file in pending:
+            key = file_key(uploaded_file)
+            batch[key] = {"status": "generating"}
+            futures[pool.submit(generate_for_image, uploaded_file.getvalue(),
+                                st.session_state.encoded_images.get(key), user_input)] = key
+        table.dataframe(results_table(files), use_container_width=True, hide_index=True)
+        for finished, future in enumerate(as_completed(futures), 1):
+            key = futures[future]
+            try:
+                fields, state = future.result()
+                st.session_state.encoded_images[key] = fields
+                batch[key] = {"status": row_status(state), "state": state}
+            except Exception as e:
+                batch[key] = {"status": "error", "error": str(e)}
+            table.dataframe(results_table(files), use_container_width=True, hide_index=True)
+            progress.progress(finished / len(futures), text=f"{finished}/{len(futures)} images done")
+
+def send_feedback(key, feedback):
+    """Revise or approve one image of the batch through its session"""
+    row = st.session_state.batch[key]
+    try:
+        state = invoke_agent_runtime({"session_id": row["state"]["session_id"], "feedback": feedback})
+        if "error" in state:
+            raise RuntimeError(state["error"])
+        row["state"] = {**state, "session_id": row["state"]["session_id"]}
+        row["status"] = row_status(row["state"])
+    except Exception as e:
+        st.error(f"Agent Runtime call failed: {str(e)}")
+
+def render_image_actions(uploaded_file):
+    key = file_key(uploaded_file)
+    row = st.session_state.batch.get(key)
+    if not row or not row.get("state"):
+        return
+    state = row["state"]
+    with st.expander(f"{uploaded_file.name} ({row['status']})"):
+        col_image, col_text = st.columns([1, 2])
+        with col_image:
+            st.image(uploaded_file, use_column_width=True)
+        with col_text:
+            st.success(state.get("generated_alt_text", ""))
+            st.caption(f"Complexity: {state.get('complexity_level', 'Unknown')} | "
+                       f"Revisions: {state.get('revision_count', 0)}/{state.get('max_revisions', 3)}")
+            if row["status"] != "ready":
+                return
+            feedback = st.text_input("Feedback", key=f"feedback-{key}")
+            col_revise, col_approve = st.columns(2)
+            with col_revise:
+                if st.button("✅ Revise", key=f"revise-{key}"):
+                    if feedback.strip():
+                        with st.spinner("Revising..."):
+                            send_feedback(key, feedback.strip())
+                        st.rerun()
+                    else:
+                        st.error("Please provide feedback before submitting!")
+            with col_approve:
+                if st.button("👍 Approve", key=f"approve-{key}"):
+                    send_feedback(key, "approve")
+                    st.rerun()
+
+def render_multi_image_mode():
+    """Many images at once: generated concurrently, then revised or approved one by one"""
+    files = st.file_uploader(
+        "Choose images...",
+        type=['png', 'jpg', 'jpeg'],
+        accept_multiple_files=True,
+        help="Upload PNG or JPEG images"
+    )
+    user_input = st.text_area(
+        "Context for all images (Optional)",
+        height=80,
+        help="Shared context, e.g. the article the images belong to"
+    )
+    if not files:
+        st.info("Upload images to get started!")
+        return
+
+    if st.button(f"🚀 Generate Alt-Text for {len(files)} images", type="primary"):
+        progress = st.progress(0.0, text="Generating...")
+        table = st.empty()
+        generate_batch(files, user_input.strip() if user_input else "", table, progress)
+        st.rerun()
+
+    st.dataframe(results_table(files), use_container_width=True, hide_index=True)
+    for uploaded_file in files:
+        render_image_actions(uploaded_file)
+
 def main():
     init_session_state()
     
@@ -71,9 +254,19 @@ def main():
         3. Provide feedback to improve the result
         4. Continue until you're satisfied (max 3 revisions)
         """)
+        mode = st.radio("Mode", ["Single image", "Multiple images"])
+
+    if mode == "Multiple images":
+        render_multi_image_mode()
+        render_footer()
+        return
     
     col1, col2 = st.columns([1, 1])
     
+    with col2:
+        st.header("📤 Results")
+        live_output = st.empty()
+    
     with col1:
         st.header("📤 Input")
         
@@ -84,7 +277,7 @@ def main():
         )
         
         if uploaded_file is not None:
-            current_hash = hash(uploaded_file.getvalue())
+            current_hash = file_key(uploaded_file)
             if st.session_state.current_image_hash != current_hash:
                 st.session_state.current_image_hash = current_hash
                 reset_state_for_new_image()
@@ -101,34 +294,30 @@ def main():
             if uploaded_file is None and not user_input.strip():
                 st.error("Please upload an image or provide a description!")
             else:
+                # The backend keeps the workflow state for this session; feedback only sends the id
                 payload = {
+                    "session_id": str(uuid.uuid4()),
                     "image_data": None,
                     "user_input": user_input.strip() if user_input else "",
-                    "feedback_history": [],
-                    "revision_count": 0,
-                    "max_revisions": 3,
-                    "waiting_for_feedback": False
+                    "max_revisions": 3
                 }
                 
                 if uploaded_file is not None:
                     with st.spinner("Processing image..."):
-                        base64_image = image_to_base64(uploaded_file)
-                        if base64_image:
-                            payload["image_data"] = base64_image
+                        fields = image_fields(uploaded_file)
+                        if fields:
+                            payload.update(fields)
                         else:
                             st.error("Failed to process image")
                             return
                 
-                with st.spinner("Generating alt-text..."):
-                    response = make_api_call(payload)
-                    if response:
-                        st.session_state.api_response = response
-                        st.session_state.feedback_given = False
+                response = make_streaming_api_call(payload, live_output)
+                if response:
+                    st.session_state.api_response = response
+                    st.session_state.feedback_given = False
                         
     
     with col2:
-        st.header("📤 Results")
-        
         if st.session_state.api_response:
             response = st.session_state.api_response
             
@@ -171,36 +360,41 @@ def main():
                     if st.button("✅ Submit Feedback", type="primary"):
                         if feedback_text.strip():
                             feedback_payload = {
-                                "image_data": response.get("image_data"),
-                                "user_input": feedback_text.strip(),
-                                "complexity_level": response.get("complexity_level"),
-                                "complexity_reasoning": response.get("complexity_reasoning"),
-                                "generated_alt_text": response.get("generated_alt_text"),
-                                "feedback_history": response.get("feedback_history", []),
-                                "revision_count": response.get("revision_count", 0),
-                                "max_revisions": response.get("max_revisions", 3),
-                                "waiting_for_feedback": True
+                                "session_id": response.get("session_id"),
+                                "feedback": feedback_text.strip()
                             }
                             
-                            with st.spinner("Processing feedback..."):
-                                new_response = None
-                                if st.session_state.feedback_text != feedback_text.strip():
-                                    new_response = make_api_call(feedback_payload)
-                                if new_response:
-                                    st.session_state.api_response = new_response
-                                    st.session_state.feedback_given = True
-                                    st.session_state.feedback_text = feedback_text.strip()
-                                    st.rerun()
+                            new_response = None
+                            if st.session_state.feedback_text != feedback_text.strip():
+                                new_response = make_streaming_api_call(feedback_payload, st.empty())
+                            if new_response:
+                                st.session_state.api_response = new_response
+                                st.session_state.feedback_given = True
+                                st.session_state.feedback_text = feedback_text.strip()
+                                st.rerun()
                                     
                         else:
                             st.error("Please provide feedback before submitting!")
+                
+                with col_feedback2:
+                    if st.button("👍 Approve"):
+                        approved = make_streaming_api_call({"session_id": response.get("session_id"), "feedback": "approve"}, st.empty())
+                        if approved:
+                            st.session_state.api_response = approved
+                            st.rerun()
             
             elif response.get("revision_count", 0) >= response.get("max_revisions", 3):
                 st.info("Maximum revisions reached. You can start over with a new image.")
+            
+            elif not response.get("waiting_for_feedback", False):
+                st.info("Alt-text approved. You can start over with a new image.")
         
         else:
             st.info("Upload an image or provide a description to get started!")
     
+    render_footer()
+
+def render_footer():
     st.markdown("---")
     st.markdown(
         "<div style='text-align: center; color: gray;'>"
@@ -1,29 +1,62 @@
 from typing import TypedDict, Literal, Optional, List
+from functools import lru_cache
 from langgraph.graph import StateGraph, END
-from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
+from langgraph.config import get_stream_writer
+import logging
 import os
-from dotenv import load_dotenv
-import uuid
-from models import call_claude
+from models import call_claude, acall_claude, stream_claude, astream_claude, run_blocking
+from langchain_core.runnables import RunnableLambda
+from result_cache import get_result_cache, make_key
+from single_flight import get_single_flight
+from instrumentation import instrument_node
+from model_tiers import get_tier
+from speculation import get_speculator, predict_level
+import json
+import asyncio
 import base64 
+import hashlib
+import time
 
-load_dotenv()
+logger = logging.getLogger("alt_text")
 
 complexity_model = os.getenv("LIGHT_WEIGHT_MODEL", "")
 generation_model = os.getenv("DEFAULT_MODEL", "")
+fused_model = os.getenv("FUSED_MODEL") or generation_model
+
+# Part of every result-cache key: bump it whenever a prompt changes so cached
+# responses produced by the old wording are no longer served.
+PROMPT_VERSION = "2"
 
 
 class AltTextState(TypedDict):
     image_data: Optional[str] = None
+    image_ref: Optional[str] = None
+    image_bytes: Optional[bytes] = None
+    image_format: Optional[str] = None
+    image_hash: Optional[str] = None
+    image_phash: Optional[str] = None
+    image_fine_hash: Optional[str] = None
+    image_description: Optional[str] = None
     user_input: Optional[str] = None
     complexity_level: Optional[Literal["Simple", "Moderate", "Complex"]] = None
     complexity_reasoning: Optional[str] = None
+    complexity_source: Optional[Literal["local", "model", "index"]] = None
+    similar_alt_text: Optional[str] = None
+    similar_distance: Optional[int] = None
     generated_alt_text: Optional[str] = None
     feedback_history: Optional[List[str]] = None
     revision_count: Optional[int] = 0
     max_revisions: Optional[int] = 3
     waiting_for_feedback: Optional[bool] = None
+    bypass_cache: Optional[bool] = None
+    generation_mode: Optional[Literal["two_stage", "fused", "speculative"]] = None
+    speculation: Optional[Literal["hit", "miss", "skipped"]] = None
+    stream: Optional[bool] = None
+    session_id: Optional[str] = None
+    include_metrics: Optional[bool] = None
+    model_tier: Optional[Literal["Simple", "Moderate", "Complex"]] = None
+    tier_model: Optional[str] = None
+    metrics: Optional[dict] = None
 
 
 def ensure_state_defaults(state: AltTextState) -> AltTextState:
@@ -37,40 +70,102 @@ def ensure_state_defaults(state: AltTextState) -> AltTextState:
 
 def routing_node(state: AltTextState) -> AltTextState:
     """ Dummy node """
+    # Metrics describe the current invocation only.
+    state["metrics"] = None
     return ensure_state_defaults(state)
 
-def get_messages(state: AltTextState, complexity_prompt: str) -> list[dict]:
-    messages = []
+def preprocess_node(state: AltTextState) -> AltTextState:
+    """Decode and size-cap the uploaded image once, for every downstream node"""
+    state["generation_mode"] = state.get("generation_mode") or os.getenv("ALT_TEXT_MODE") or "two_stage"
+    state["image_phash"] = None
+    state["image_fine_hash"] = None
+    state["image_description"] = None
+    state["similar_alt_text"] = None
+    state["similar_distance"] = None
+    state["speculation"] = None
+    image_data = state.get("image_data")
+    prepared = None
+    if state.get("image_ref"):
+        # Raw bytes read from the object store: no base64 payload to decode.
+        from image_preprocessing import preprocess_image_reference
+        prepared = preprocess_image_reference(state["image_ref"])
+    elif image_data and image_data.startswith("data:image"):
+        from image_preprocessing import preprocess_image_data
+        prepared = preprocess_image_data(image_data)
+    elif state.get("image_bytes") is not None:
+        # Raw bytes from a local caller (bulk_alt_text): nothing to decode.
+        from image_preprocessing import preprocess_image_bytes
+        prepared = preprocess_image_bytes(state["image_bytes"], state.get("image_format"))
+    if prepared is not None:
+        state["image_bytes"] = prepared["bytes"]
+        state["image_format"] = prepared["format"]
+        state["image_hash"] = prepared["sha256"]
+        # Release the base64 payload as soon as it has been decoded.
+        state["image_data"] = None
+        logger.info("🖼️  Image prepared: %s -> %s bytes, %sx%s%s", prepared["original_bytes"], len(prepared["bytes"]),
+                    prepared["size"][0], prepared["size"][1], " (resized)" if prepared["resized"] else "")
+        # numpy and the near-duplicate index load with the first image, not at cold start.
+        from near_duplicates import fingerprint, get_near_duplicate_index, informative, reusable
+        index = get_near_duplicate_index()
+        hashes = fingerprint(prepared["bytes"]) if index is not None else None
+        # Flat and low-detail images hash alike whatever they show: they stay out of the index.
+        if hashes is not None and informative(hashes):
+            state["image_phash"] = f"{hashes['dhash']:016x}"
+            state["image_fine_hash"] = hashes["fine_hash"].hex()
+            state["image_description"] = state.get("user_input")
+            match = index.lookup(hashes["dhash"])
+            if match is not None:
+                apply_near_duplicate(state, match, reusable(match, hashes, state.get("user_input")))
+    return state
+
+def apply_near_duplicate(state: AltTextState, match: dict, reuse: bool = True) -> AltTextState:
+    """Take the complexity of an approved near-duplicate and, in reuse mode, its alt-text too
+    when `reuse` (see near_duplicates.reusable); otherwise it only seeds generation"""
+    state["complexity_level"] = match["complexity_level"]
+    state["complexity_reasoning"] = match["complexity_reasoning"]
+    state["complexity_source"] = "index"
+    state["similar_alt_text"] = match["alt_text"]
+    state["similar_distance"] = match["distance"]
+    logger.info("♻️  Near-duplicate of an approved image (distance %s): %s", match["distance"], match["alt_text"])
+    from near_duplicates import near_duplicate_mode
+    if near_duplicate_mode() == "reuse" and reuse:
+        state["model_tier"] = None
+        state["tier_model"] = None
+        apply_generation_response(state, match["alt_text"])
+    return state
+
+async def apreprocess_node(state: AltTextState) -> AltTextState:
+    return await run_blocking(preprocess_node, state)
+
+def decode_image(state: AltTextState) -> tuple[Optional[bytes], Optional[str]]:
+    """Image bytes and format: the preprocessed ones, else decoded from image_data"""
+    if state.get("image_bytes") is not None:
+        return state["image_bytes"], state.get("image_format")
     image_data = state.get("image_data")
     if image_data and image_data.startswith("data:image"):
-        image_base64 = image_data.split(",")[1]
-        image_bytes = base64.b64decode(image_base64)
+        return base64.b64decode(image_data.split(",")[1]), image_data.split(";")[0].split("/")[1]
+    return None, None
 
-        messages.append({
-            "role": "user",
-            "content": [{
+def get_messages(state: AltTextState, request_text: str = "") -> list[dict]:
+    """User message with the per-request content only: the image, request_text and the description.
+    The static instructions go in the system prompt, so they form a cacheable prefix."""
+    text = f"Image description: {state.get('user_input', 'No image description provided')}"
+    if request_text:
+        text = f"{request_text}\n\n{text}"
+    content = [{"text": text}]
+    image_bytes, image_format = decode_image(state)
+    if image_bytes is not None:
+        content.insert(0, {
             "image": {
-                "format": image_data.split(";")[0].split("/")[1],
+                "format": image_format,
                 "source": {
                     "bytes": image_bytes
                 }
             }
-        }, {
-                    "text": f"{complexity_prompt}\n\nImage description: {state.get('user_input', 'No image description provided')}"
-                }],
-        })
-    else:
-        messages.append({
-            "role": "user",
-            "content": [{"text": f"{complexity_prompt}\n\nImage description: {state.get('user_input', 'No image description provided')}"}],
         })
-    return messages
+    return [{"role": "user", "content": content}]
 
-def complexity_analysis_node(state: AltTextState) -> AltTextState:
-    """Stage 1: Analyze the complexity of the image content"""
-    print("🔍 Stage 1: Analyzing image complexity...")
-    
-    complexity_prompt = """
+COMPLEXITY_PROMPT = """
     You are a lightweight model specialized in categorizing image complexity for alt-text generation.
     
     Analyze the provided content and categorize it into one of three complexity levels:
@@ -84,50 +179,24 @@ def complexity_analysis_node(state: AltTextState) -> AltTextState:
     REASONING: [Brief explanation of why this complexity level was chosen]
     """
 
-    messages = get_messages(state, complexity_prompt)
-
-    response_text = call_claude(complexity_model, messages)
-    print(f"Complexity Response: {response_text}")
-    lines = response_text.split('\n')
-    complexity_level = None
-    reasoning = None
-    
-    for line in lines:
-        if line.startswith('COMPLEXITY:'):
-            complexity_level = line.split(':', 1)[1].strip()
-        elif line.startswith('REASONING:'):
-            reasoning = line.split(':', 1)[1].strip()
-    
-    state["complexity_level"] = complexity_level
-    state["complexity_reasoning"] = reasoning
-    
-    print(f"   Complexity Level: {complexity_level}")
-    print(f"   Reasoning: {reasoning}")
-    
-    return state
-
-def alt_text_generation_node(state: AltTextState) -> AltTextState:
-    """Stage 2: Generate alt-text based on complexity level"""
-    print(f"✏️  Stage 2: Generating alt-text for {state['complexity_level']} complexity...")
-    
-    complexity_guidelines = {
-        "Simple": """
+COMPLEXITY_GUIDELINES = {
+    "Simple": """
         For SIMPLE images, create concise alt-text (1-2 sentences, max 125 characters):
         - Focus on the main subject/object
         - Use clear, direct language
         - Avoid unnecessary details
         - Example: "A red apple on a white plate"
         """,
-        
-        "Moderate": """
+    
+    "Moderate": """
         For MODERATE images, create descriptive alt-text (2-3 sentences, max 200 characters):
         - Describe main elements and their relationships
         - Include relevant context
         - Maintain logical flow
         - Example: "Three business people in suits reviewing documents at a conference table in a modern office"
         """,
-        
-        "Complex": """
+    
+    "Complex": """
         For COMPLEX images, create comprehensive alt-text (3-4 sentences, max 300 characters):
         - Describe the overall scene first
         - Detail key elements and their interactions
@@ -135,13 +204,14 @@ def alt_text_generation_node(state: AltTextState) -> AltTextState:
         - Prioritize information hierarchy
         - Example: "A bustling farmers market with multiple vendor stalls displaying colorful produce. Customers browse vegetables in the foreground while vendors arrange items in the background under white canopy tents"
         """
-    }
-    
-    generation_prompt = f"""
+}
+
+
+GENERATION_PROMPT = f"""
     You are an expert alt-text generator specializing in creating accessible image descriptions.
     
-    {complexity_guidelines.get(state['complexity_level'], complexity_guidelines['Moderate'])}
-    
+    The complexity level of the image is given with it. Follow the guidelines for that level:
+    {"".join(COMPLEXITY_GUIDELINES.values())}
     ACCESSIBILITY GUIDELINES:
     - Start with the most important information
     - Use specific, concrete language
@@ -153,64 +223,118 @@ def alt_text_generation_node(state: AltTextState) -> AltTextState:
     ALT-TEXT: [Your generated alt-text here]
     """
 
-    messages = get_messages(state, generation_prompt)
 
-    alt_text = call_claude(generation_model, messages)
-    print(f"Alt-text Response: {alt_text}")
-    
-    if alt_text.startswith('ALT-TEXT:'):
-        alt_text = alt_text.split(':', 1)[1].strip()
-    
-    if alt_text:
-        alt_text = alt_text[0].upper() + alt_text[1:]
+def generation_request(complexity_level: Optional[str], similar_alt_text: Optional[str] = None) -> str:
+    request = f"COMPLEXITY LEVEL: {complexity_level if complexity_level in COMPLEXITY_GUIDELINES else 'Moderate'}"
+    if similar_alt_text:
+        request += (f'\nA near-identical image was previously described as: "{similar_alt_text}"'
+                    "\nStart from that alt-text and change it only where this image differs.")
+    return request
+
+
+FUSED_PROMPT = f"""
+    You are an expert alt-text generator specializing in creating accessible image descriptions.
     
-    state["generated_alt_text"] = alt_text
-    state["waiting_for_feedback"] = True
-    state["image_data"] = None
+    First categorize the provided content into one of three complexity levels:
     
-    print(f"   Generated Alt-text: {alt_text}")
-    print(f"   Character count: {len(alt_text)}")
-    print("👤 Ready for user feedback...")
+    **Simple**: Basic images with minimal elements (e.g., single object, simple scene, clear subject)
+    **Moderate**: Images with multiple elements but clear structure (e.g., 2-3 main objects, straightforward relationships)
+    **Complex**: Images with many elements, intricate details, or complex relationships (e.g., detailed scenes, multiple people, complex data visualizations)
     
-    return state
+    Then write alt-text following the guidelines for the level you chose:
+    {"".join(COMPLEXITY_GUIDELINES.values())}
+    ACCESSIBILITY GUIDELINES:
+    - Start with the most important information
+    - Use specific, concrete language
+    - Avoid subjective interpretations
+    - Don't start with "Image of" or "Picture of"
+    - Consider the context and purpose
 
-def revision_node(state: AltTextState) -> AltTextState:
-    """Handle revision based on user feedback"""
-    print(f"🔄 Revision #{state['revision_count'] + 1}: Incorporating user feedback...")
+    Provide your answer strictly in below format:
+    COMPLEXITY: [Simple/Moderate/Complex]
+    REASONING: [Brief explanation of why this complexity level was chosen]
+    ALT-TEXT: [Your generated alt-text here]
+    """
+
+
+REVISION_PROMPT = """
+    Revise the alt-text based on the user feedback.
     
+    REQUIREMENTS:
+    - Address the specific feedback provided
+    - Maintain accessibility standards
+    - Keep appropriate for the given complexity level
+    - Ensure clarity and usefulness for screen readers
+
+    Provide your revised alt-text strictly in below format:
+    ALT-TEXT: [Your improved alt-text here]
+    """
+
+
+def revision_messages(state: AltTextState) -> list[dict]:
     feedback_context = ""
     if state.get("feedback_history"):
         feedback_context = "\n".join([f"- {fb}" for fb in state["feedback_history"]])
     
-    revision_prompt = f"""
-    Revise the alt-text based on the user feedback:
-    
+    text = f"""
     ORIGINAL ALT-TEXT: "{state['generated_alt_text']}"
     COMPLEXITY LEVEL: {state['complexity_level']}
     USER FEEDBACK: "{state['user_input']}"
     
     Previous feedback (if any):
     {feedback_context}
+    """
+    return [{"role": "user", "content": [{"text": text}]}]
+
+
+def parse_alt_text(response_text: str) -> str:
+    alt_text = response_text.strip()
+    if alt_text.startswith('ALT-TEXT:'):
+        alt_text = alt_text.split(':', 1)[1].strip()
     
-    REQUIREMENTS:
-    - Address the specific feedback provided
-    - Maintain accessibility standards
-    - Keep appropriate for {state['complexity_level']} complexity level
-    - Ensure clarity and usefulness for screen readers
+    if alt_text:
+        alt_text = alt_text[0].upper() + alt_text[1:]
+    return alt_text
 
-    Provide your revised alt-text strictly in below format:
-    ALT-TEXT: [Your improved alt-text here]
-    """
+def apply_complexity_response(state: AltTextState, response_text: str) -> AltTextState:
+    logger.debug("Complexity Response: %s", response_text)
+    lines = response_text.split('\n')
+    complexity_level = None
+    reasoning = None
     
-    response = call_claude(generation_model, [{"role": "user", "content": [{"text": revision_prompt}]}])
-    print(f"Revision Response: {response}")
-    revised_text = response.strip()
+    for line in lines:
+        if line.startswith('COMPLEXITY:'):
+            complexity_level = line.split(':', 1)[1].strip()
+        elif line.startswith('REASONING:'):
+            reasoning = line.split(':', 1)[1].strip()
+    
+    state["complexity_level"] = complexity_level
+    state["complexity_reasoning"] = reasoning
+    state["complexity_source"] = "model"
+    
+    logger.info("   Complexity Level: %s", complexity_level)
+    logger.info("   Reasoning: %s", reasoning)
+    
+    return state
 
-    if revised_text.startswith('ALT-TEXT:'):
-        revised_text = revised_text.split(':', 1)[1].strip()
+def apply_generation_response(state: AltTextState, response_text: str) -> AltTextState:
+    logger.debug("Alt-text Response: %s", response_text)
+    alt_text = parse_alt_text(response_text)
     
-    if revised_text:
-        revised_text = revised_text[0].upper() + revised_text[1:]
+    state["generated_alt_text"] = alt_text
+    state["waiting_for_feedback"] = True
+    state["image_data"] = None
+    state["image_bytes"] = None
+    
+    logger.info("   Generated Alt-text: %s", alt_text)
+    logger.info("   Character count: %s", len(alt_text))
+    logger.info("👤 Ready for user feedback...")
+    
+    return state
+
+def apply_revision_response(state: AltTextState, response_text: str) -> AltTextState:
+    logger.debug("Revision Response: %s", response_text)
+    revised_text = parse_alt_text(response_text)
     
     feedback_history = state.get("feedback_history", [])
     feedback_history.append(state["user_input"])
@@ -221,15 +345,369 @@ def revision_node(state: AltTextState) -> AltTextState:
     state["user_input"] = None
     state["waiting_for_feedback"] = True
     
-    print(f"   Revised Alt-text: {revised_text}")
-    print(f"   Character count: {len(revised_text)}")
-    print("👤 Ready for user feedback...")
+    logger.info("   Revised Alt-text: %s", revised_text)
+    logger.info("   Character count: %s", len(revised_text))
+    logger.info("👤 Ready for user feedback...")
     
     return state
 
+def visible_alt_text(response_text: str, require_marker: bool = False) -> str:
+    """The part of a partial model response that will end up as the alt-text"""
+    _, marker, alt_text = response_text.partition("ALT-TEXT:")
+    if not marker:
+        pending = response_text.lstrip()
+        # Hold back while the marker may still be arriving; show everything if the model skipped it.
+        if require_marker or "ALT-TEXT:".startswith(pending[:len("ALT-TEXT:")]):
+            return ""
+        alt_text = pending
+    alt_text = alt_text.lstrip()
+    return alt_text[:1].upper() + alt_text[1:]
+
+def run_model(state: AltTextState, model_id: str, system: str, messages: list[dict], require_marker: bool = False,
+              inference_config: dict = None) -> str:
+    """call_claude, streaming the alt-text to the caller as token events when the request asked for it"""
+    if not state.get("stream"):
+        return call_claude(model_id, messages, system, inference_config)
+    writer = get_stream_writer()
+    response_text, sent = "", 0
+    for delta in stream_claude(model_id, messages, system, inference_config):
+        response_text += delta
+        visible = visible_alt_text(response_text, require_marker)
+        if len(visible) > sent:
+            writer({"event": "token", "text": visible[sent:]})
+            sent = len(visible)
+    return response_text
+
+async def arun_model(state: AltTextState, model_id: str, system: str, messages: list[dict], require_marker: bool = False,
+                     inference_config: dict = None) -> str:
+    """Async run_model"""
+    if not state.get("stream"):
+        return await acall_claude(model_id, messages, system, inference_config)
+    writer = get_stream_writer()
+    response_text, sent = "", 0
+    async for delta in astream_claude(model_id, messages, system, inference_config):
+        response_text += delta
+        visible = visible_alt_text(response_text, require_marker)
+        if len(visible) > sent:
+            writer({"event": "token", "text": visible[sent:]})
+            sent = len(visible)
+    return response_text
+
+def response_key(state: AltTextState, stage: str, model_id: str, *extra: str) -> str:
+    """Key of a model response over the decoded image, description, model and prompt version,
+    for the result cache and for coalescing identical in-flight requests"""
+    image_hash = state.get("image_hash")
+    if not image_hash:
+        image_bytes, _ = decode_image(state)
+        image_hash = hashlib.sha256(image_bytes).hexdigest() if image_bytes is not None else ""
+    return make_key(stage, PROMPT_VERSION, model_id, image_hash, state.get("user_input"), *extra)
+
+def cached_response(state: AltTextState, key: str) -> Optional[str]:
+    cache = get_result_cache()
+    if cache is None:
+        return None
+    if state.get("bypass_cache"):
+        cache.record_bypass()
+        return None
+    return cache.get(key)
+
+def store_response(key: str, response_text: str) -> None:
+    cache = get_result_cache()
+    if cache is not None and response_text:
+        cache.set(key, response_text)
+
+def replay_shared(state: AltTextState, response_text: str, require_marker: bool = False) -> None:
+    """A streaming request that joined another request's model call gets the alt-text as one token event"""
+    if state.get("stream"):
+        get_stream_writer()({"event": "token", "text": visible_alt_text(response_text, require_marker)})
+
+def fetch_response(state: AltTextState, stage: str, key: str, call, streamed: bool = False,
+                   require_marker: bool = False) -> str:
+    """Cached response, else call(). Identical requests in flight at the same time share one
+    call (see single_flight.py); its response is kept afterwards only by the result cache."""
+    response_text = cached_response(state, key)
+    if response_text is not None:
+        return response_text
+
+    def fetch():
+        response_text = call()
+        store_response(key, response_text)
+        return response_text
+
+    flights = get_single_flight()
+    if flights is None:
+        return fetch()
+    response_text, shared = flights.do(stage, key, fetch)
+    if shared and streamed:
+        replay_shared(state, response_text, require_marker)
+    return response_text
+
+async def afetch_response(state: AltTextState, stage: str, key: str, call, streamed: bool = False,
+                          require_marker: bool = False) -> str:
+    """Async fetch_response: `call()` returns an awaitable"""
+    response_text = cached_response(state, key)
+    if response_text is not None:
+        return response_text
+
+    async def fetch():
+        response_text = await call()
+        store_response(key, response_text)
+        return response_text
+
+    flights = get_single_flight()
+    if flights is None:
+        return await fetch()
+    response_text, shared = await flights.ado(stage, key, fetch)
+    if shared and streamed:
+        replay_shared(state, response_text, require_marker)
+    return response_text
+
+def local_complexity(state: AltTextState) -> Optional[dict]:
+    """Confident CPU-only classification of the image, when LOCAL_COMPLEXITY_CLASSIFIER=on"""
+    if os.getenv("LOCAL_COMPLEXITY_CLASSIFIER", "off").lower() != "on":
+        return None
+    from complexity_classifier import classify_if_confident
+    image_bytes, _ = decode_image(state)
+    return classify_if_confident(image_bytes)
+
+def apply_local_complexity(state: AltTextState, result: dict) -> AltTextState:
+    features = result["features"]
+    state["complexity_level"] = result["complexity_level"]
+    state["complexity_reasoning"] = (
+        f"Local classifier (confidence {result['confidence']:.2f}): edge density {features['edge_density']:.2f}, "
+        f"colour entropy {features['colour_entropy']:.2f}, {features['region_count']} regions, "
+        f"{features['megapixels']:.1f} MP"
+    )
+    state["complexity_source"] = "local"
+    
+    logger.info("   Complexity Level: %s (local, %.1f ms)", state["complexity_level"], result["elapsed_ms"])
+    
+    return state
+
+def apply_fused_response(state: AltTextState, response_text: str) -> AltTextState:
+    analysis, marker, alt_text = response_text.partition("ALT-TEXT:")
+    state = apply_complexity_response(state, analysis.strip())
+    if not marker:
+        # No marker: the alt-text is what remains once the analysis lines are taken out.
+        alt_text = "\n".join(line for line in response_text.split("\n")
+                             if not line.startswith(("COMPLEXITY:", "REASONING:")))
+    return apply_generation_response(state, marker + alt_text)
+
+def analyse_complexity(state: AltTextState) -> str:
+    """Complexity model response for the image"""
+    key = response_key(state, "complexity", complexity_model)
+    return fetch_response(state, "complexity", key,
+                          lambda: call_claude(complexity_model, get_messages(state), COMPLEXITY_PROMPT))
+
+async def aanalyse_complexity(state: AltTextState) -> str:
+    key = response_key(state, "complexity", complexity_model)
+    return await afetch_response(state, "complexity", key,
+                                 lambda: acall_claude(complexity_model, get_messages(state), COMPLEXITY_PROMPT))
+
+def complexity_analysis_node(state: AltTextState) -> AltTextState:
+    """Stage 1: Analyze the complexity of the image content"""
+    logger.info("🔍 Stage 1: Analyzing image complexity...")
+    local = local_complexity(state)
+    if local is not None:
+        return apply_local_complexity(state, local)
+    return apply_complexity_response(state, analyse_complexity(state))
+
+async def acomplexity_analysis_node(state: AltTextState) -> AltTextState:
+    """Stage 1 (async): Analyze the complexity of the image content"""
+    logger.info("🔍 Stage 1: Analyzing image complexity...")
+    local = await run_blocking(local_complexity, state)
+    if local is not None:
+        return apply_local_complexity(state, local)
+    return apply_complexity_response(state, await aanalyse_complexity(state))
+
+def select_tier(state: AltTextState) -> dict:
+    """Model and inference settings for the image's complexity level, recorded in the state"""
+    tier = get_tier(state.get("complexity_level"))
+    state["model_tier"] = tier["name"]
+    state["tier_model"] = tier["model"]
+    logger.info("   Tier: %s -> %s %s", tier["name"], tier["model"], tier["inference_config"])
+    return tier
+
+def generate(state: AltTextState, complexity_level: Optional[str]) -> str:
+    """Generation response for the image at the given complexity level, on that level's tier"""
+    tier = get_tier(complexity_level)
+    request = generation_request(complexity_level, state.get("similar_alt_text"))
+    key = response_key(state, "generation", tier["model"], request, json.dumps(tier["inference_config"]))
+    return fetch_response(state, "generation", key,
+                          lambda: run_model(state, tier["model"], GENERATION_PROMPT, get_messages(state, request),
+                                            inference_config=tier["inference_config"]),
+                          streamed=True)
+
+async def agenerate(state: AltTextState, complexity_level: Optional[str]) -> str:
+    tier = get_tier(complexity_level)
+    request = generation_request(complexity_level, state.get("similar_alt_text"))
+    key = response_key(state, "generation", tier["model"], request, json.dumps(tier["inference_config"]))
+    return await afetch_response(state, "generation", key,
+                                 lambda: arun_model(state, tier["model"], GENERATION_PROMPT, get_messages(state, request),
+                                                    inference_config=tier["inference_config"]),
+                                 streamed=True)
+
+def alt_text_generation_node(state: AltTextState) -> AltTextState:
+    """Stage 2: Generate alt-text based on complexity level"""
+    logger.info("✏️  Stage 2: Generating alt-text for %s complexity...", state["complexity_level"])
+    select_tier(state)
+    return apply_generation_response(state, generate(state, state["complexity_level"]))
+
+async def aalt_text_generation_node(state: AltTextState) -> AltTextState:
+    """Stage 2 (async): Generate alt-text based on complexity level"""
+    logger.info("✏️  Stage 2: Generating alt-text for %s complexity...", state["complexity_level"])
+    select_tier(state)
+    return apply_generation_response(state, await agenerate(state, state["complexity_level"]))
+
+def fused_generation_node(state: AltTextState) -> AltTextState:
+    """Single call: classify complexity and generate the matching alt-text together"""
+    local = local_complexity(state)
+    if local is not None:
+        return alt_text_generation_node(apply_local_complexity(state, local))
+    logger.info("⚡ Fused: Analyzing complexity and generating alt-text in one call...")
+    key = response_key(state, "fused", fused_model)
+    response_text = fetch_response(state, "fused", key,
+                                   lambda: run_model(state, fused_model, FUSED_PROMPT, get_messages(state), require_marker=True),
+                                   streamed=True, require_marker=True)
+    state["tier_model"] = fused_model
+    return apply_fused_response(state, response_text)
+
+async def afused_generation_node(state: AltTextState) -> AltTextState:
+    """Single call (async): classify complexity and generate the matching alt-text together"""
+    local = await run_blocking(local_complexity, state)
+    if local is not None:
+        return await aalt_text_generation_node(apply_local_complexity(state, local))
+    logger.info("⚡ Fused: Analyzing complexity and generating alt-text in one call...")
+    key = response_key(state, "fused", fused_model)
+    response_text = await afetch_response(state, "fused", key,
+                                          lambda: arun_model(state, fused_model, FUSED_PROMPT, get_messages(state),
+                                                             require_marker=True),
+                                          streamed=True, require_marker=True)
+    state["tier_model"] = fused_model
+    return apply_fused_response(state, response_text)
+
+def timed(call, *args) -> tuple[object, float]:
+    started = time.perf_counter()
+    return call(*args), (time.perf_counter() - started) * 1000
+
+async def atimed(call, *args) -> tuple[object, float]:
+    """Await call(*args); the coroutine is only created once the timer starts"""
+    started = time.perf_counter()
+    return await call(*args), (time.perf_counter() - started) * 1000
+
+def speculation_hit(state: AltTextState, predicted: str) -> bool:
+    """Same level, same generation request: the speculative response is the one two-stage would produce"""
+    return generation_request(state["complexity_level"]) == generation_request(predicted)
+
+def settle_speculation(state: AltTextState, predicted: str, hit: bool, started: float, complexity_ms: float,
+                       generation_ms: float) -> None:
+    """Record the outcome; latency saved is the sequential time of the two calls used minus the elapsed time"""
+    saved_ms = complexity_ms + generation_ms - (time.perf_counter() - started) * 1000
+    get_speculator().record(hit, saved_ms)
+    state["speculation"] = "hit" if hit else "miss"
+    logger.info("   Speculation on %s %s (%.0f ms saved)", predicted, "hit" if hit else "missed", saved_ms)
+
+def speculative_generation_node(state: AltTextState) -> AltTextState:
+    """Complexity analysis and a generation for the predicted level at the same time; a
+    wrong prediction is followed by the generation for the actual level.
+
+    A miss is only cancelled if its call has not started yet: a running thread cannot be
+    stopped, so it completes in the background and its response is dropped. The async
+    node cancels the speculative call itself.
+    """
+    local = local_complexity(state)
+    if local is not None:
+        return alt_text_generation_node(apply_local_complexity(state, local))
+    if not get_speculator().admit():
+        state["speculation"] = "skipped"
+        return alt_text_generation_node(complexity_analysis_node(state))
+    predicted = predict_level(decode_image(state)[0])
+    logger.info("🔮 Speculative: Analyzing complexity while generating alt-text for %s...", predicted)
+    started = time.perf_counter()
+    # Not streamed: tokens of a wrong guess must not reach the caller.
+    speculative = get_speculator().submit(lambda: timed(generate, {**state, "stream": False}, predicted))
+    hit = False
+    try:
+        complexity_text, complexity_ms = timed(analyse_complexity, state)
+        apply_complexity_response(state, complexity_text)
+        hit = speculation_hit(state, predicted)
+        if hit:
+            response_text, generation_ms = speculative.result()
+            replay_shared(state, response_text)
+        else:
+            speculative.cancel()
+            response_text, generation_ms = timed(generate, state, state["complexity_level"])
+    except BaseException:
+        speculative.cancel()
+        get_speculator().record(hit, 0.0)
+        raise
+    settle_speculation(state, predicted, hit, started, complexity_ms, generation_ms)
+    select_tier(state)
+    return apply_generation_response(state, response_text)
+
+async def aspeculative_generation_node(state: AltTextState) -> AltTextState:
+    """Async speculative generation: the speculative call is cancelled on a miss"""
+    local = await run_blocking(local_complexity, state)
+    if local is not None:
+        return await aalt_text_generation_node(apply_local_complexity(state, local))
+    if not get_speculator().admit():
+        state["speculation"] = "skipped"
+        return await aalt_text_generation_node(await acomplexity_analysis_node(state))
+    predicted = predict_level(decode_image(state)[0])
+    logger.info("🔮 Speculative: Analyzing complexity while generating alt-text for %s...", predicted)
+    started = time.perf_counter()
+    speculative = asyncio.ensure_future(atimed(agenerate, {**state, "stream": False}, predicted))
+    # A cancelled or failed speculation is never awaited: retrieve its outcome so it is not logged.
+    speculative.add_done_callback(lambda task: task.cancelled() or task.exception())
+    hit = False
+    try:
+        complexity_text, complexity_ms = await atimed(aanalyse_complexity, state)
+        apply_complexity_response(state, complexity_text)
+        hit = speculation_hit(state, predicted)
+        if hit:
+            response_text, generation_ms = await speculative
+            replay_shared(state, response_text)
+        else:
+            speculative.cancel()
+            response_text, generation_ms = await atimed(agenerate, state, state["complexity_level"])
+    except BaseException:
+        speculative.cancel()
+        get_speculator().record(hit, 0.0)
+        raise
+    settle_speculation(state, predicted, hit, started, complexity_ms, generation_ms)
+    select_tier(state)
+    return apply_generation_response(state, response_text)
+
+def revision_node(state: AltTextState) -> AltTextState:
+    """Handle revision based on user feedback (never served from the result cache)"""
+    logger.info("🔄 Revision #%s: Incorporating user feedback...", state["revision_count"] + 1)
+    tier = select_tier(state)
+    response_text = run_model(state, tier["model"], REVISION_PROMPT, revision_messages(state),
+                              inference_config=tier["inference_config"])
+    return apply_revision_response(state, response_text)
+
+async def arevision_node(state: AltTextState) -> AltTextState:
+    """Handle revision (async) based on user feedback"""
+    logger.info("🔄 Revision #%s: Incorporating user feedback...", state["revision_count"] + 1)
+    tier = select_tier(state)
+    response_text = await arun_model(state, tier["model"], REVISION_PROMPT, revision_messages(state),
+                                     inference_config=tier["inference_config"])
+    return apply_revision_response(state, response_text)
+
 def completed_node(state: AltTextState) -> AltTextState:
     state["user_input"] = None
     state["waiting_for_feedback"] = False
+    index = None
+    # image_phash is only set while the near-duplicate index is on.
+    if state.get("image_phash") and state.get("generated_alt_text"):
+        from near_duplicates import get_near_duplicate_index
+        index = get_near_duplicate_index()
+    if index is not None:
+        # Approved alt-text becomes reusable for near-duplicates of this image.
+        fine_hash = state.get("image_fine_hash")
+        index.add(int(state["image_phash"], 16), state["generated_alt_text"], state.get("complexity_level"),
+                  state.get("complexity_reasoning"), bytes.fromhex(fine_hash) if fine_hash else None,
+                  state.get("image_description"))
     
     return state
 
@@ -239,23 +717,42 @@ def feedback_routing(state: AltTextState) -> Literal["complexity_analysis", "rev
         return "complexity_analysis"
 
     if state.get("waiting_for_feedback") and state.get("user_input", "") == "approve":
-        print(f"✅ User approved the alt-text.")
+        logger.info("✅ User approved the alt-text.")
         return "complete"
     
     if state["revision_count"] >= state["max_revisions"]:
-        print(f"⚠️ Maximum revisions ({state['max_revisions']}) reached. Can't review now")
+        logger.warning("⚠️ Maximum revisions (%s) reached. Can't review now", state["max_revisions"])
         return "complete"
 
     return "revision"
 
-def create_alt_text_workflow():
+def generation_mode_routing(state: AltTextState) -> Literal["two_stage", "fused", "speculative", "seeded", "reused"]:
+    """Two model calls (complexity, then generation), a single fused call, or both calls at
+    once on a predicted level (speculative). A near-duplicate match skips the complexity
+    call (seeded) or every model call (reused)."""
+    if state.get("similar_alt_text"):
+        return "reused" if state.get("waiting_for_feedback") else "seeded"
+    mode = state.get("generation_mode")
+    return mode if mode in ("fused", "speculative") else "two_stage"
+
+def add_node(workflow: StateGraph, name: str, func, afunc=None) -> None:
+    """Add a node, timed by the instrumentation (see instrumentation.instrument_node)"""
+    func, afunc = instrument_node(name, func, afunc)
+    workflow.add_node(name, RunnableLambda(func, afunc=afunc) if afunc else func)
+
+def create_alt_text_workflow(checkpointer=None):
     workflow = StateGraph(AltTextState)
     
-    workflow.add_node("routing", routing_node)
-    workflow.add_node("complexity_analysis", complexity_analysis_node)
-    workflow.add_node("alt_text_generation", alt_text_generation_node)
-    workflow.add_node("revision", revision_node)
-    workflow.add_node("complete", completed_node)
+    add_node(workflow, "routing", routing_node)
+    add_node(workflow, "preprocess", preprocess_node, apreprocess_node)
+    # Model-calling nodes carry both variants: invoke() runs the sync node and
+    # ainvoke() awaits the async one, so a single compiled graph serves both.
+    add_node(workflow, "complexity_analysis", complexity_analysis_node, acomplexity_analysis_node)
+    add_node(workflow, "alt_text_generation", alt_text_generation_node, aalt_text_generation_node)
+    add_node(workflow, "fused_generation", fused_generation_node, afused_generation_node)
+    add_node(workflow, "speculative_generation", speculative_generation_node, aspeculative_generation_node)
+    add_node(workflow, "revision", revision_node, arevision_node)
+    add_node(workflow, "complete", completed_node)
 
     workflow.set_entry_point("routing")
 
@@ -263,15 +760,40 @@ def create_alt_text_workflow():
         "routing",
         feedback_routing,
         {
-            "complexity_analysis": "complexity_analysis",
+            "complexity_analysis": "preprocess",
             "revision": "revision",
             "complete": "complete",}
     )
 
+    workflow.add_conditional_edges(
+        "preprocess",
+        generation_mode_routing,
+        {
+            "two_stage": "complexity_analysis",
+            "fused": "fused_generation",
+            "speculative": "speculative_generation",
+            "seeded": "alt_text_generation",
+            "reused": END,}
+    )
+
     workflow.add_edge("complexity_analysis", "alt_text_generation")
     workflow.add_edge("alt_text_generation", END)
+    workflow.add_edge("fused_generation", END)
+    workflow.add_edge("speculative_generation", END)
     workflow.add_edge("revision", END)
     workflow.add_edge("complete", END)
 
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
+
+
+@lru_cache(maxsize=1)
+def get_alt_text_workflow():
+    """Compiled workflow shared by every invocation in this process"""
+    return create_alt_text_workflow()
+
 
+@lru_cache(maxsize=1)
+def get_session_workflow():
+    """Compiled workflow whose state is kept server-side, per session_id"""
+    from sessions import get_checkpointer
+    return create_alt_text_workflow(checkpointer=get_checkpointer())
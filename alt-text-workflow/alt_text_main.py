@@ -1,12 +1,122 @@
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import logging
+import os
 from bedrock_agentcore.runtime import BedrockAgentCoreApp
-from alt_text_langgraph import create_alt_text_workflow
+from starlette.responses import PlainTextResponse
+from alt_text_langgraph import get_alt_text_workflow, get_session_workflow, complexity_model, fused_model
+from model_tiers import load_tiers
+from models import get_client, render_prometheus as render_blocking_threads
+from batch import arun_batch
+from sessions import session_config
+from instrumentation import PrometheusSink, get_sink
+from rate_limiter import render_prometheus as render_rate_limits
+from regions import render_prometheus as render_regions
+from result_cache import render_prometheus as render_result_cache
+from single_flight import render_prometheus as render_single_flight
+from speculation import render_prometheus as render_speculation
+
+# Progress lines and JSON metrics go through logging; LOG_LEVEL=WARNING silences them.
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+
+
+def warm_up():
+    """Compile the shared workflow and build the model clients before the first request"""
+    get_alt_text_workflow()
+    for model_id in {complexity_model, fused_model, *(tier.get("model") for tier in load_tiers().values())}:
+        if model_id:
+            get_client(model_id)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if os.getenv("WARM_UP_ON_START", "false").lower() == "true":
+        warm_up()
+    yield
+
+
+def server_options() -> dict:
+    """uvicorn settings: PORT (default 8080), SERVER_LIMIT_CONCURRENCY (connections and requests
+    beyond it are answered with 503) and SERVER_BACKLOG"""
+    options = {"port": int(os.getenv("PORT") or 8080)}
+    if os.getenv("SERVER_LIMIT_CONCURRENCY"):
+        options["limit_concurrency"] = int(os.getenv("SERVER_LIMIT_CONCURRENCY"))
+    if os.getenv("SERVER_BACKLOG"):
+        options["backlog"] = int(os.getenv("SERVER_BACKLOG"))
+    return options
+
+
+app = BedrockAgentCoreApp(lifespan=lifespan)
+
+if isinstance(get_sink(), PrometheusSink):
+    app.add_route("/metrics", lambda request: PlainTextResponse(get_sink().render() + render_rate_limits()
+                                                                + render_single_flight() + render_speculation()
+                                                                + render_regions() + render_result_cache()
+                                                                + render_blocking_threads()),
+                  methods=["GET"])
+
+async def session_request(payload):
+    """Workflow, input and config for a request on a server-side session.
+
+    A request with "feedback" revises (or approves) the session's alt-text, so
+    the client only sends the session id and the feedback. Any other request
+    starts the session over from its payload.
+    """
+    workflow = get_session_workflow()
+    config = session_config(payload["session_id"])
+    # Per-request flags are always set, so they never carry over from an earlier call.
+    flags = {"stream": bool(payload.get("stream")), "bypass_cache": bool(payload.get("bypass_cache")),
+             "include_metrics": bool(payload.get("include_metrics"))}
+    if "feedback" in payload:
+        snapshot = await workflow.aget_state(config)
+        if not snapshot.values.get("waiting_for_feedback"):
+            raise ValueError(f"Unknown or expired session, or no alt-text awaiting feedback: {payload['session_id']}")
+        return workflow, {"user_input": payload["feedback"], **flags}, config
+    await workflow.checkpointer.adelete_thread(payload["session_id"])
+    return workflow, {**payload, **flags}, config
+
+
+def durability(workflow):
+    """Sessions are checkpointed once per call, when the run finishes"""
+    return "exit" if workflow.checkpointer else None
+
+
+async def stream_invocation(workflow, graph_input, config=None):
+    """Server-sent events: a stage event per finished node, token events while the alt-text
+    is generated, then the final state as a result event"""
+    final_state = None
+    async for mode, chunk in workflow.astream(graph_input, config, stream_mode=["updates", "custom", "values"],
+                                              durability=durability(workflow)):
+        if mode == "custom":
+            yield chunk
+        elif mode == "updates":
+            for node in chunk:
+                yield {"event": "stage", "node": node}
+        else:
+            final_state = chunk
+    yield {"event": "result", "state": final_state}
 
-app = BedrockAgentCoreApp()
 
 @app.entrypoint
-def agent_invocation(payload, context):
-    response = create_alt_text_workflow().invoke(payload)
+async def agent_invocation(payload, context):
+    if "items" in payload:
+        try:
+            return {"results": await arun_batch(payload["items"], payload.get("max_concurrency"))}
+        except ValueError as e:
+            return {"status": "error", "error": str(e), "error_type": type(e).__name__}
+    workflow, graph_input, config = get_alt_text_workflow(), payload, None
+    if payload.get("session_id"):
+        try:
+            workflow, graph_input, config = await session_request(payload)
+        except ValueError as e:
+            return {"status": "error", "error": str(e), "error_type": type(e).__name__}
+    if payload.get("stream"):
+        return stream_invocation(workflow, graph_input, config)
+    response = await workflow.ainvoke(graph_input, config, durability=durability(workflow))
     return response
 
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    app.run(**server_options())
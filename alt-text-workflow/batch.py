@@ -0,0 +1,102 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from alt_text_langgraph import get_alt_text_workflow
+from singletons import Lazy, LazyMap
+
+
+def max_batch_concurrency() -> int:
+    return max(1, int(os.getenv("BATCH_MAX_CONCURRENCY") or 8))
+
+
+def batch_limit(max_concurrency: int = None) -> int:
+    """Items of one batch in flight: max_concurrency capped by BATCH_MAX_CONCURRENCY"""
+    if max_concurrency is None:
+        return max_batch_concurrency()
+    if isinstance(max_concurrency, bool) or not isinstance(max_concurrency, int) or max_concurrency < 1:
+        raise ValueError(f"max_concurrency must be a positive integer, got {max_concurrency!r}")
+    return min(max_concurrency, max_batch_concurrency())
+
+
+# Worker threads shared by all batch requests in the process, so concurrent
+# batches cannot multiply the number of in-flight model calls.
+_executor = Lazy(lambda: ThreadPoolExecutor(max_workers=max_batch_concurrency(), thread_name_prefix="alt-text-batch"))
+# The async counterpart: one semaphore of BATCH_MAX_CONCURRENCY slots per event loop.
+_loop_slots = LazyMap(lambda loop: asyncio.Semaphore(max_batch_concurrency()), weak_keys=True)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    return _executor.get()
+
+
+def loop_slots() -> asyncio.Semaphore:
+    """BATCH_MAX_CONCURRENCY slots shared by every async batch on the running event loop"""
+    return _loop_slots.get(asyncio.get_running_loop())
+
+
+def initial_state(item: dict) -> dict:
+    """Workflow input for an item; local callers may pass raw `image_bytes` instead of image_data"""
+    if not isinstance(item, dict) or not (item.get("image_data") or item.get("image_ref") or item.get("image_bytes")
+                                          or item.get("user_input")):
+        raise ValueError("Each batch item needs image_data or image_ref, and/or user_input")
+    state = {"image_data": item.get("image_data"), "image_ref": item.get("image_ref"), "user_input": item.get("user_input") or ""}
+    if item.get("image_bytes"):
+        state["image_bytes"] = item["image_bytes"]
+    return state
+
+
+def process_item(item: dict) -> dict:
+    """Run one new image/description through complexity analysis and generation"""
+    return get_alt_text_workflow().invoke(initial_state(item))
+
+
+async def aprocess_item(item: dict) -> dict:
+    return await get_alt_text_workflow().ainvoke(initial_state(item))
+
+
+def _item_error(index: int, error: Exception) -> dict:
+    return {"index": index, "status": "error", "error": str(error), "error_type": type(error).__name__}
+
+
+def _run_item(index: int, item: dict) -> dict:
+    try:
+        return {"index": index, "status": "ok", "result": process_item(item)}
+    except Exception as e:
+        return _item_error(index, e)
+
+
+def run_batch(items: list[dict], max_concurrency: int = None) -> list[dict]:
+    """Process items concurrently and return per-item results in input order.
+
+    `max_concurrency` limits how many items of this batch are in flight at once;
+    it is capped by BATCH_MAX_CONCURRENCY, the size of the shared worker pool.
+    A failing item is reported in its own result and does not affect the others.
+    Raises ValueError when max_concurrency is not a positive integer.
+    """
+    slots = threading.BoundedSemaphore(batch_limit(max_concurrency))
+    executor = get_executor()
+
+    futures = []
+    for index, item in enumerate(items):
+        slots.acquire()
+        future = executor.submit(_run_item, index, item)
+        future.add_done_callback(lambda _: slots.release())
+        futures.append(future)
+    return [future.result() for future in futures]
+
+
+async def arun_batch(items: list[dict], max_concurrency: int = None) -> list[dict]:
+    """Async run_batch: up to `max_concurrency` items of this batch in flight, and at most
+    BATCH_MAX_CONCURRENCY across all batches on the running event loop"""
+    slots = asyncio.Semaphore(batch_limit(max_concurrency))
+    shared = loop_slots()
+
+    async def run(index: int, item: dict) -> dict:
+        async with slots, shared:
+            try:
+                return {"index": index, "status": "ok", "result": await aprocess_item(item)}
+            except Exception as e:
+                return _item_error(index, e)
+
+    return list(await asyncio.gather(*(run(index, item) for index, item in enumerate(items))))
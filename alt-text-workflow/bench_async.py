@@ -0,0 +1,99 @@
+"""Compare sync and async workflow throughput against a slow fake Bedrock backend.
+
+    python3 bench_async.py --requests 1000 --concurrency 500 --latency-ms 200
+
+The sync run pushes requests through `invoke()` on a thread pool (one blocked
+thread per in-flight request, capped at --threads); the async run keeps up to
+--concurrency requests in flight with `ainvoke()` on a single event loop.
+
+--blocking-client removes the fake's native async methods, like boto3 without
+aiobotocore: async calls then wait on models.blocking_executor() threads
+(BLOCKING_THREADS), and async throughput should match the sync run, not drop below it.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import models
+from alt_text_langgraph import get_alt_text_workflow
+from fake_bedrock import FakeBedrockClient
+
+
+class BlockingClient(FakeBedrockClient):
+    """Only the blocking boto3-style methods"""
+
+    def __getattribute__(self, name):
+        if name in ("aconverse", "aconverse_stream"):
+            raise AttributeError(name)
+        return super().__getattribute__(name)
+
+
+def payload(index: int) -> dict:
+    return {"user_input": f"Request {index}: a cyclist crossing a bridge at sunset"}
+
+
+def run_sync(requests: int, threads: int) -> dict:
+    workflow = get_alt_text_workflow()
+    peak_threads = threading.active_count()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(workflow.invoke, payload(i)) for i in range(requests)]
+        peak_threads = max(peak_threads, threading.active_count())
+        for future in futures:
+            future.result()
+    return summarize("sync", requests, time.perf_counter() - started, threads, peak_threads)
+
+
+async def run_async(requests: int, concurrency: int) -> dict:
+    workflow = get_alt_text_workflow()
+    slots = asyncio.Semaphore(concurrency)
+    peak_threads = threading.active_count()
+
+    async def one(index: int):
+        async with slots:
+            return await workflow.ainvoke(payload(index))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    peak_threads = max(peak_threads, threading.active_count())
+    return summarize("async", requests, time.perf_counter() - started, concurrency, peak_threads)
+
+
+def summarize(mode: str, requests: int, elapsed: float, concurrency: int, peak_threads: int) -> dict:
+    return {"mode": mode, "requests": requests, "concurrency": concurrency, "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(requests / elapsed, 1), "peak_threads": peak_threads}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=500, help="in-flight requests for the async run")
+    parser.add_argument("--threads", type=int, default=32, help="worker threads for the sync run")
+    parser.add_argument("--latency-ms", type=float, default=200, help="simulated latency of every model call")
+    parser.add_argument("--blocking-client", action="store_true", help="fake client without native async methods")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    args = parser.parse_args()
+
+    fake = (BlockingClient if args.blocking_client else FakeBedrockClient)(latency_ms=args.latency_ms)
+    models.set_client_factory(lambda region_name, model_id: fake)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = [run_sync(args.requests, args.threads), asyncio.run(run_async(args.requests, args.concurrency))]
+
+    for result in results:
+        print(f"{result['mode']:<6} concurrency={result['concurrency']:<5} {result['elapsed_s']:>8.2f}s "
+              f"{result['throughput_rps']:>8.1f} req/s  peak threads={result['peak_threads']}")
+    print(f"async speed-up: {results[1]['throughput_rps'] / results[0]['throughput_rps']:.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"latency_ms": args.latency_ms, "blocking_client": args.blocking_client, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
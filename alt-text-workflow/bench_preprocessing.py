@@ -0,0 +1,94 @@
+"""Measure payload size and latency of the image preprocessing stage.
+
+    python3 bench_preprocessing.py --bandwidth-mbps 50 --output preprocessing.json
+
+For synthetic photos of increasing resolution this compares the previous
+pipeline (full-resolution re-save in the UI, base64 decode in each of the two
+model-calling nodes) with the current one (downscale before upload, decode once
+in the preprocess node). Transfer time is estimated from --bandwidth-mbps.
+"""
+import argparse
+import base64
+import io
+import json
+import time
+
+from PIL import Image
+
+from image_preprocessing import preprocess_image_data, prepare_image
+from sample_images import synthetic_image
+
+SIZES = [(640, 480), (1920, 1080), (4000, 3000), (6000, 4000)]
+NODES_DECODING_IMAGE = 2  # complexity_analysis and alt_text_generation
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def data_uri(image_bytes: bytes, image_format: str) -> str:
+    return f"data:image/{image_format};base64,{base64.b64encode(image_bytes).decode()}"
+
+
+def legacy_client_encode(image_bytes: bytes) -> str:
+    image = Image.open(io.BytesIO(image_bytes))
+    buffer = io.BytesIO()
+    image.save(buffer, format=image.format)
+    return data_uri(buffer.getvalue(), image.format.lower())
+
+
+def current_client_encode(image_bytes: bytes) -> str:
+    prepared = prepare_image(image_bytes)
+    return data_uri(prepared["bytes"], prepared["format"])
+
+
+def legacy_backend_decode(payload: str):
+    for _ in range(NODES_DECODING_IMAGE):
+        base64.b64decode(payload.split(",")[1])
+
+
+def measure(image_bytes: bytes, encode, decode, bandwidth_mbps: float) -> dict:
+    payload, encode_ms = timed(encode, image_bytes)
+    request_body, serialize_ms = timed(lambda: json.dumps({"image_data": payload, "user_input": ""}).encode("utf-8"))
+    _, decode_ms = timed(decode, payload)
+    transfer_ms = len(request_body) * 8 / (bandwidth_mbps * 1e6) * 1000
+    return {"payload_bytes": len(request_body), "client_encode_ms": round(encode_ms, 1),
+            "serialize_ms": round(serialize_ms, 1), "backend_decode_ms": round(decode_ms, 1),
+            "transfer_ms": round(transfer_ms, 1),
+            "total_ms": round(encode_ms + serialize_ms + decode_ms + transfer_ms, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bandwidth-mbps", type=float, default=50, help="uplink used to estimate transfer time")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    args = parser.parse_args()
+
+    results = []
+    for size in SIZES:
+        # Noisy photos as JPEG, flat graphics (screenshots, diagrams) as PNG.
+        for complexity, image_format in (("Complex", "JPEG"), ("Moderate", "PNG")):
+            image_bytes = synthetic_image(complexity, size, seed=1, image_format=image_format)
+            before = measure(image_bytes, legacy_client_encode, legacy_backend_decode, args.bandwidth_mbps)
+            after = measure(image_bytes, current_client_encode, preprocess_image_data, args.bandwidth_mbps)
+            results.append({"size": list(size), "format": image_format, "upload_bytes": len(image_bytes),
+                            "before": before, "after": after,
+                            "payload_reduction": round(1 - after["payload_bytes"] / before["payload_bytes"], 3),
+                            "latency_reduction": round(1 - after["total_ms"] / before["total_ms"], 3)})
+
+    print(f"{'image':<16}{'payload before':>16}{'after':>12}{'saved':>8}{'ms before':>12}{'after':>10}{'saved':>8}")
+    for row in results:
+        label = f"{row['size'][0]}x{row['size'][1]} {row['format']}"
+        print(f"{label:<16}{row['before']['payload_bytes']:>16,}{row['after']['payload_bytes']:>12,}"
+              f"{row['payload_reduction']:>8.0%}{row['before']['total_ms']:>12.1f}{row['after']['total_ms']:>10.1f}"
+              f"{row['latency_reduction']:>8.0%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"bandwidth_mbps": args.bandwidth_mbps, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Offline benchmark of the alt-text workflow, stage by stage.
+
+    python3 bench_workflow.py --requests 50 --concurrency 8 --latency-ms 300 --output bench.json
+    python3 bench_workflow.py --output bench_new.json --compare bench.json
+
+Builds the graph with `create_alt_text_workflow()` and runs it against the fake
+Bedrock backend (no network, result cache off). Inputs are a description-only
+request, the sample images under images/ and synthetic images of several sizes.
+Every request is generated and then revised once, in each --modes mode.
+
+Reported per scenario: per-node latency, end-to-end p50/p95/p99 of the
+generation and the revision call (also per model tier), throughput, request /
+response / model payload bytes and peak traced memory. --compare prints the change against a previous
+--output file, e.g. one written on another commit.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import time
+import tracemalloc
+
+import models
+from alt_text_langgraph import create_alt_text_workflow
+from fake_bedrock import FakeBedrockClient
+from result_cache import set_result_cache
+from sample_images import DEFAULT_IMAGE_DIR, iter_image_files, synthetic_image, to_data_uri
+
+FEEDBACK = "Mention the colours and keep it shorter"
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+    return {"p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99),
+            "mean": round(sum(ordered) / len(ordered), 2), "max": round(ordered[-1], 2)}
+
+
+def build_inputs(image_paths: list[str], sizes: list[tuple[int, int]]) -> list[tuple[str, str]]:
+    """(scenario name, image data-URI or None) pairs"""
+    inputs = [("text", None)]
+    for path in iter_image_files(image_paths):
+        with open(path, "rb") as f:
+            inputs.append((f"sample:{os.path.basename(path)}", to_data_uri(f.read())))
+    for width, height in sizes:
+        inputs.append((f"synthetic:{width}x{height}", to_data_uri(synthetic_image("Complex", (width, height), seed=width))))
+    return inputs
+
+
+async def timed_run(workflow, payload: dict) -> tuple[dict, float, dict]:
+    """Final state, end-to-end ms and per-node ms of one workflow run"""
+    nodes = {}
+    state = None
+    started = last = time.perf_counter()
+    async for mode, chunk in workflow.astream(payload, stream_mode=["updates", "values"]):
+        if mode == "updates":
+            now = time.perf_counter()
+            for node in chunk:
+                nodes[node] = (now - last) * 1000
+            last = now
+        else:
+            state = chunk
+    return state, (time.perf_counter() - started) * 1000, nodes
+
+
+async def run_scenario(workflow, fake: FakeBedrockClient, image_data: str, mode: str, requests: int, concurrency: int) -> dict:
+    slots = asyncio.Semaphore(concurrency)
+    samples = {"generation_ms": [], "revision_ms": [], "request_bytes": [], "revision_request_bytes": [], "response_bytes": []}
+    node_ms = {}
+    tier_ms = {}
+
+    async def one(index: int):
+        payload = {"image_data": image_data, "user_input": f"Request {index}: a cyclist crossing a bridge at sunset",
+                   "generation_mode": mode}
+        async with slots:
+            state, generation_ms, nodes = await timed_run(workflow, payload)
+            revision_payload = {**state, "user_input": FEEDBACK}
+            revised, revision_ms, revision_nodes = await timed_run(workflow, revision_payload)
+        samples["generation_ms"].append(generation_ms)
+        samples["revision_ms"].append(revision_ms)
+        samples["request_bytes"].append(len(json.dumps(payload)))
+        samples["revision_request_bytes"].append(len(json.dumps(revision_payload, default=str)))
+        samples["response_bytes"].append(len(json.dumps(revised, default=str)))
+        for node, ms in [*nodes.items(), *revision_nodes.items()]:
+            node_ms.setdefault(node, []).append(ms)
+        tier_ms.setdefault(state.get("model_tier") or "untiered", []).append(generation_ms)
+
+    model_bytes = fake.request_bytes
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "generation_ms": percentiles(samples["generation_ms"]),
+        "revision_ms": percentiles(samples["revision_ms"]),
+        "nodes_ms": {node: percentiles(values) for node, values in node_ms.items()},
+        "tiers_ms": {tier: {"requests": len(values), **percentiles(values)} for tier, values in sorted(tier_ms.items())},
+        "request_bytes": round(sum(samples["request_bytes"]) / requests),
+        "revision_request_bytes": round(sum(samples["revision_request_bytes"]) / requests),
+        "response_bytes": round(sum(samples["response_bytes"]) / requests),
+        "model_request_bytes": round((fake.request_bytes - model_bytes) / requests),
+    }
+
+
+async def peak_memory_kb(workflow, image_data: str, mode: str, requests: int) -> float:
+    """Peak Python heap while running a few requests one after another"""
+    tracemalloc.start()
+    try:
+        for index in range(requests):
+            state, _, _ = await timed_run(workflow, {"image_data": image_data, "user_input": f"Memory {index}",
+                                                     "generation_mode": mode})
+            await timed_run(workflow, {**state, "user_input": FEEDBACK})
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(results: list[dict], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {(row["scenario"], row["mode"]): row for row in json.load(f)["results"]}
+    print(f"\nChange against {baseline_path}:")
+    print(f"{'scenario':<28}{'mode':<11}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}")
+    for row in results:
+        before = baseline.get((row["scenario"], row["mode"]))
+        if before is None:
+            continue
+        change = [row["generation_ms"][q] / before["generation_ms"][q] - 1 for q in ("p50", "p95", "p99")]
+        change.append(row["throughput_rps"] / before["throughput_rps"] - 1)
+        print(f"{row['scenario']:<28}{row['mode']:<11}" + "".join(f"{value:>+9.1%}" for value in change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20, help="requests per scenario and mode")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=200, help="median latency of a model call")
+    parser.add_argument("--latency-jitter", type=float, default=0.3, help="log-normal sigma of the latency, 0 for constant")
+    parser.add_argument("--complexity-weights", default="1,1,1", help="share of Simple,Moderate,Complex responses")
+    parser.add_argument("--modes", default="two_stage,fused")
+    parser.add_argument("--images", nargs="*", default=[DEFAULT_IMAGE_DIR], help="image files or directories")
+    parser.add_argument("--sizes", default="640x480,1920x1080,4000x3000", help="synthetic image sizes")
+    parser.add_argument("--memory-requests", type=int, default=3, help="requests per scenario traced for peak memory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    parser.add_argument("--compare", help="previous --output file to compare against")
+    args = parser.parse_args()
+
+    weights = [float(weight) for weight in args.complexity_weights.split(",")]
+    fake = FakeBedrockClient(latency_ms=args.latency_ms, latency_jitter=args.latency_jitter,
+                             complexity_weights=weights, seed=args.seed)
+    models.set_client_factory(lambda region_name, model_id: fake)
+    set_result_cache(None)
+    workflow = create_alt_text_workflow()
+    sizes = [tuple(int(part) for part in size.split("x")) for size in args.sizes.split(",") if size]
+
+    results = []
+    for name, image_data in build_inputs(args.images, sizes):
+        for mode in args.modes.split(","):
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                row = asyncio.run(run_scenario(workflow, fake, image_data, mode, args.requests, args.concurrency))
+                row["peak_memory_kb"] = asyncio.run(peak_memory_kb(workflow, image_data, mode, args.memory_requests))
+            results.append({"scenario": name, "mode": mode, **row})
+
+    print(f"{'scenario':<28}{'mode':<11}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}{'req/s':>8}"
+          f"{'req bytes':>11}{'model bytes':>13}{'peak KiB':>10}")
+    for row in results:
+        latency = row["generation_ms"]
+        print(f"{row['scenario']:<28}{row['mode']:<11}{latency['p50']:>8.0f}{latency['p95']:>8.0f}{latency['p99']:>8.0f}"
+              f"{row['throughput_rps']:>8.1f}{row['request_bytes']:>11,}{row['model_request_bytes']:>13,}"
+              f"{row['peak_memory_kb']:>10,.0f}")
+    print("\nPer-node p50 / p95 ms:")
+    for row in results:
+        nodes = "  ".join(f"{node} {ms['p50']:.0f}/{ms['p95']:.0f}" for node, ms in row["nodes_ms"].items())
+        print(f"{row['scenario']:<28}{row['mode']:<11}{nodes}")
+
+    report = {
+        "commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
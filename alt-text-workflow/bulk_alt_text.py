@@ -0,0 +1,189 @@
+"""Generate alt-text for many images, from a directory or a manifest, into JSONL.
+
+    python3 bulk_alt_text.py path/to/images --output alt_text.jsonl --workers 16
+    python3 bulk_alt_text.py manifest.csv --output alt_text.jsonl
+
+A manifest is CSV (with a header row) or JSONL, one item per row. The columns are
+`image` (a path, relative to the manifest), `description` (or `user_input`) and
+an optional `id`. Each item needs an image and/or a description. Items without
+an id are identified by their image path, or otherwise by their row number.
+
+Inputs are read lazily and results are appended to --output as each item
+finishes (one JSON object per line, in completion order). The output file is
+also the checkpoint: when it already exists, items recorded there as "ok" are
+skipped, so an interrupted run picks up where it stopped. Failed items are
+retried on the next run unless --skip-failed is given. The last row for an id
+wins: the failed rows a retry supersedes are compacted away when a run starts
+and when it ends, so the file holds one row per item.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from alt_text_langgraph import get_alt_text_workflow
+from batch import initial_state
+from models import run_blocking
+from sample_images import IMAGE_EXTENSIONS
+
+RESULT_FIELDS = ("generated_alt_text", "complexity_level", "complexity_source", "model_tier", "generation_mode")
+
+
+def iter_directory(root: str):
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(directory, name)
+                yield {"id": os.path.relpath(path, root), "image": path, "user_input": ""}
+
+
+def iter_manifest(path: str):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="") as f:
+        rows = csv.DictReader(f) if path.lower().endswith(".csv") else (json.loads(line) for line in f if line.strip())
+        for number, row in enumerate(rows, 1):
+            image = row.get("image") or None
+            yield {
+                "id": str(row.get("id") or image or f"row-{number}"),
+                "image": os.path.join(base, image) if image else None,
+                "user_input": row.get("description") or row.get("user_input") or "",
+            }
+
+
+def iter_items(source: str):
+    """Items of a directory or CSV/JSONL manifest, read one at a time"""
+    return iter_directory(source) if os.path.isdir(source) else iter_manifest(source)
+
+
+def compact_output(output_path: str) -> dict:
+    """Status of each id in the output file, from its last row. A partial last line
+    (left by a crash mid-write) is cut off so the file can be appended to, and rows
+    superseded by a later one for the same id are dropped."""
+    last = {}
+    rows = 0
+    if not os.path.exists(output_path):
+        return {}
+    with open(output_path, "r+b") as f:
+        complete_bytes = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            record = json.loads(line)
+            last[record["id"]] = (complete_bytes, record["status"])
+            complete_bytes += len(line)
+            rows += 1
+        f.truncate(complete_bytes)
+    if rows > len(last):
+        # Only offsets are kept in memory: the rows themselves are copied across.
+        keep = {offset for offset, _ in last.values()}
+        with open(output_path, "rb") as f, open(output_path + ".tmp", "wb") as compacted:
+            offset = 0
+            for line in f:
+                if offset in keep:
+                    compacted.write(line)
+                offset += len(line)
+        os.replace(output_path + ".tmp", output_path)
+    return {record_id: status for record_id, (_, status) in last.items()}
+
+
+def load_completed(output_path: str, skip_failed: bool) -> set:
+    """Ids already processed according to the output file, after compacting it"""
+    return {record_id for record_id, status in compact_output(output_path).items() if status == "ok" or skip_failed}
+
+
+def read_state(item: dict, generation_mode: str) -> dict:
+    image_bytes = None
+    if item["image"]:
+        # Raw bytes go straight to preprocessing: no base64 data-URI round trip.
+        with open(item["image"], "rb") as f:
+            image_bytes = f.read()
+    state = initial_state({"image_bytes": image_bytes, "user_input": item["user_input"]})
+    if generation_mode:
+        state["generation_mode"] = generation_mode
+    return state
+
+
+async def process(workflow, item: dict, generation_mode: str) -> dict:
+    record = {"id": item["id"], "image": item["image"]}
+    started = time.perf_counter()
+    try:
+        state = await run_blocking(read_state, item, generation_mode)
+        result = await workflow.ainvoke(state)
+        record.update(status="ok", **{field: result.get(field) for field in RESULT_FIELDS})
+    except Exception as e:
+        record.update(status="error", error=str(e), error_type=type(e).__name__)
+    record["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return record
+
+
+async def run(items, completed: set, output, workers: int, generation_mode: str, limit: int, progress_every: int) -> dict:
+    workflow = get_alt_text_workflow()
+    # Bounded, so the reader never gets more than a few items ahead of the workers.
+    queue = asyncio.Queue(maxsize=workers * 2)
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    started = time.perf_counter()
+
+    async def worker():
+        while (item := await queue.get()) is not None:
+            record = await process(workflow, item, generation_mode)
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            counts[record["status"]] += 1
+            finished = counts["ok"] + counts["error"]
+            if progress_every and finished % progress_every == 0:
+                rate = finished / (time.perf_counter() - started)
+                print(f"{finished} done ({counts['error']} failed, {counts['skipped']} skipped), {rate:.1f} items/s",
+                      file=sys.stderr)
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    queued = 0
+    for item in items:
+        if item["id"] in completed:
+            counts["skipped"] += 1
+            continue
+        if limit and queued >= limit:
+            break
+        await queue.put(item)
+        queued += 1
+    for _ in tasks:
+        await queue.put(None)
+    await asyncio.gather(*tasks)
+    counts["elapsed_s"] = round(time.perf_counter() - started, 1)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="image directory, or CSV / JSONL manifest")
+    parser.add_argument("--output", required=True, help="JSONL results file, also used to resume")
+    parser.add_argument("--workers", type=int, default=8, help="items processed concurrently")
+    parser.add_argument("--mode", choices=("two_stage", "fused", "speculative"), help="generation mode (default ALT_TEXT_MODE)")
+    parser.add_argument("--limit", type=int, default=0, help="process at most this many new items")
+    parser.add_argument("--skip-failed", action="store_true", help="do not retry items that failed in an earlier run")
+    parser.add_argument("--progress-every", type=int, default=100, help="print progress every N items, 0 to disable")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper(), format="%(message)s")
+    completed = load_completed(args.output, args.skip_failed)
+    if completed:
+        print(f"Resuming: {len(completed)} items already in {args.output}", file=sys.stderr)
+
+    with open(args.output, "a") as output:
+        counts = asyncio.run(run(iter_items(args.source), completed, output, max(1, args.workers), args.mode,
+                                 args.limit, args.progress_every))
+    compact_output(args.output)
+    print(f"{counts['ok']} ok, {counts['error']} failed, {counts['skipped']} skipped in {counts['elapsed_s']}s",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
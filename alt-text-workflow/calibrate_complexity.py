@@ -0,0 +1,142 @@
+"""Calibrate the local complexity classifier against the LLM's labels.
+
+    python3 calibrate_complexity.py path/to/images --labels llm_labels.jsonl --output calibration.json
+
+Each image is labelled once by the Stage 1 model (LIGHT_WEIGHT_MODEL) and the
+label is appended to --labels, so reruns only call Bedrock for new images. The
+report covers agreement between the local classifier and the LLM, the share of
+LLM calls avoided at each confidence threshold, and the score thresholds
+(LOCAL_COMPLEXITY_THRESHOLDS) that best reproduce the LLM labels.
+
+Use --synthetic N to add generated images, and MODEL_BACKEND=fake to try the
+script offline.
+"""
+import argparse
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from alt_text_langgraph import COMPLEXITY_PROMPT, apply_complexity_response, complexity_model, get_messages
+from complexity_classifier import LEVELS, classify_image, classify_score, score_thresholds
+from image_preprocessing import prepare_image
+from models import call_claude
+from sample_images import DEFAULT_IMAGE_DIR, iter_image_files, synthetic_image, to_data_uri
+
+CONFIDENCE_SWEEP = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+
+
+def load_labels(path: str) -> dict:
+    labels = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    labels[row["image"]] = row["complexity_level"]
+    return labels
+
+
+def llm_label(image_bytes: bytes) -> str:
+    state = {"image_data": to_data_uri(image_bytes), "user_input": ""}
+    response_text = call_claude(complexity_model, get_messages(state), COMPLEXITY_PROMPT)
+    return apply_complexity_response({}, response_text)["complexity_level"]
+
+
+def collect_images(paths: list[str], synthetic: int):
+    for path in iter_image_files(paths):
+        with open(path, "rb") as f:
+            yield path, f.read()
+    for index in range(synthetic):
+        level = LEVELS[index % len(LEVELS)]
+        yield f"synthetic:{level}:{index}", synthetic_image(level, seed=index)
+
+
+def agreement(rows: list[dict], thresholds: tuple[float, float]) -> float:
+    matches = sum(classify_score(row["score"], thresholds)[0] == row["llm"] for row in rows)
+    return matches / len(rows) if rows else 0.0
+
+
+def fit_thresholds(rows: list[dict]) -> tuple[tuple[float, float], float]:
+    """Grid search for the score boundaries that best agree with the LLM labels"""
+    grid = [step / 100 for step in range(0, 101, 2)]
+    best = (score_thresholds(), agreement(rows, score_thresholds()))
+    for low in grid:
+        for high in grid:
+            if high > low:
+                candidate = agreement(rows, (low, high))
+                if candidate > best[1]:
+                    best = ((low, high), candidate)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_IMAGE_DIR], help="image files or directories")
+    parser.add_argument("--labels", default="llm_complexity_labels.jsonl", help="JSONL cache of LLM labels")
+    parser.add_argument("--synthetic", type=int, default=0, help="number of generated images to add")
+    parser.add_argument("--output", help="write the report as JSON to this path")
+    args = parser.parse_args()
+
+    labels = load_labels(args.labels)
+    rows = []
+    with open(args.labels, "a") as label_file:
+        for name, image_bytes in collect_images(args.paths, args.synthetic):
+            # Classify exactly what the workflow would send to the model.
+            image_bytes = prepare_image(image_bytes)["bytes"]
+            if name not in labels:
+                started = time.perf_counter()
+                labels[name] = llm_label(image_bytes)
+                label_file.write(json.dumps({"image": name, "complexity_level": labels[name],
+                                             "llm_ms": round((time.perf_counter() - started) * 1000, 1)}) + "\n")
+            result = classify_image(image_bytes)
+            rows.append({"image": name, "llm": labels[name], "local": result["complexity_level"],
+                         "confidence": round(result["confidence"], 3), "score": round(result["score"], 4),
+                         "local_ms": round(result["elapsed_ms"], 2)})
+
+    if not rows:
+        parser.error("no images found")
+
+    confusion = {llm: {local: 0 for local in LEVELS} for llm in LEVELS}
+    for row in rows:
+        if row["llm"] in confusion:
+            confusion[row["llm"]][row["local"]] += 1
+
+    sweep = []
+    for threshold in CONFIDENCE_SWEEP:
+        confident = [row for row in rows if row["confidence"] >= threshold]
+        sweep.append({"min_confidence": threshold, "llm_calls_avoided": len(confident),
+                      "avoided_share": round(len(confident) / len(rows), 3),
+                      "agreement_when_skipped": round(agreement(confident, score_thresholds()), 3) if confident else None})
+
+    (low, high), fitted_agreement = fit_thresholds(rows)
+    report = {
+        "images": len(rows),
+        "agreement": round(agreement(rows, score_thresholds()), 3),
+        "thresholds": list(score_thresholds()),
+        "suggested_thresholds": [low, high],
+        "suggested_agreement": round(fitted_agreement, 3),
+        "mean_local_ms": round(sum(row["local_ms"] for row in rows) / len(rows), 2),
+        "confusion_llm_vs_local": confusion,
+        "confidence_sweep": sweep,
+        "rows": rows,
+    }
+
+    print(f"Images: {report['images']}   agreement with LLM: {report['agreement']:.1%}   "
+          f"mean local latency: {report['mean_local_ms']:.1f} ms")
+    print(f"Suggested LOCAL_COMPLEXITY_THRESHOLDS={low},{high} (agreement {fitted_agreement:.1%})")
+    print("min_confidence  LLM calls avoided  agreement when skipped")
+    for row in sweep:
+        skipped = "-" if row["agreement_when_skipped"] is None else f"{row['agreement_when_skipped']:.1%}"
+        print(f"{row['min_confidence']:>14}  {row['llm_calls_avoided']:>8} ({row['avoided_share']:.0%})  {skipped:>14}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
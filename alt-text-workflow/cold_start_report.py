@@ -0,0 +1,110 @@
+"""Measure container cold-start cost of the AgentCore entrypoint.
+
+Every run happens in a fresh interpreter so module caches are cold:
+
+    python3 cold_start_report.py --runs 5 --output cold_start.json
+
+Reports the median time for each start-up phase (importing alt_text_main,
+compiling the workflow, warming the model clients, first and second invocation
+against the fake backend) plus the heaviest imports from `python -X importtime`.
+The result cache is off in the child, so the second invocation runs the whole
+workflow warm instead of returning the first one's cached responses.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PAYLOAD = {"user_input": "A group of four engineers in hard hats and safety vests discuss blueprints at a construction site."}
+
+
+def measure_phases() -> dict:
+    timings = {}
+    started = time.perf_counter()
+    import alt_text_main
+    timings["import_main_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    alt_text_main.get_alt_text_workflow()
+    timings["compile_workflow_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    alt_text_main.warm_up()
+    timings["warm_up_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    asyncio.run(alt_text_main.agent_invocation(dict(PAYLOAD), None))
+    timings["first_invocation_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    asyncio.run(alt_text_main.agent_invocation(dict(PAYLOAD), None))
+    timings["second_invocation_ms"] = (time.perf_counter() - started) * 1000
+    return timings
+
+
+def child_env() -> dict:
+    return {**os.environ, "MODEL_BACKEND": "fake", "RESULT_CACHE": "off"}
+
+
+def run_phases(runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, __file__, "--child"], cwd=HERE, env=child_env(),
+                                capture_output=True, text=True, check=True).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        timings["process_total_ms"] = (time.perf_counter() - started) * 1000
+        samples.append(timings)
+    return {phase: round(statistics.median(s[phase] for s in samples), 1) for phase in samples[0]}
+
+
+def import_profile(top: int) -> list[dict]:
+    """Heaviest imports pulled in directly by alt_text_main, by cumulative time"""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import alt_text_main"], cwd=HERE,
+                            env=child_env(), capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        # Nesting is shown by indentation: one space for alt_text_main itself,
+        # three for the modules it imports directly.
+        if len(name) - len(name.lstrip()) in (1, 3):
+            rows.append({"module": name.strip(), "cumulative_ms": round(int(cumulative_us) / 1000, 1),
+                         "self_ms": round(int(self_us) / 1000, 1)})
+    return sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters to sample per phase")
+    parser.add_argument("--top", type=int, default=10, help="number of heaviest imports to list")
+    parser.add_argument("--output", help="write the report as JSON to this path")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_phases()))
+        return
+
+    report = {"python": sys.version.split()[0], "runs": args.runs,
+              "phases_ms": run_phases(args.runs), "heaviest_imports": import_profile(args.top)}
+
+    for phase, value in report["phases_ms"].items():
+        print(f"{phase:<24}{value:>10.1f}")
+    print("\nHeaviest imports (cumulative ms):")
+    for row in report["heaviest_imports"]:
+        print(f"  {row['module']:<40}{row['cumulative_ms']:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
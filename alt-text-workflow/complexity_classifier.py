@@ -0,0 +1,130 @@
+import io
+import os
+import time
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+LEVELS = ("Simple", "Moderate", "Complex")
+
+# Relative weight of each normalised feature in the complexity score. The
+# defaults were picked by hand; calibrate_complexity.py fits the thresholds.
+FEATURE_WEIGHTS = {"edge_density": 0.4, "colour_entropy": 0.3, "region_count": 0.2, "megapixels": 0.1}
+
+ANALYSIS_SIZE = 256
+REGION_GRID = 64
+
+
+def load_pixels(image_bytes: bytes) -> tuple[np.ndarray, float]:
+    """RGB pixels downscaled for analysis, plus the original resolution in megapixels"""
+    image = Image.open(io.BytesIO(image_bytes))
+    megapixels = image.width * image.height / 1e6
+    # For JPEG, draft() lets the decoder skip work by decoding at a reduced scale.
+    image.draft("RGB", (ANALYSIS_SIZE, ANALYSIS_SIZE))
+    image = image.convert("RGB")
+    image.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE))
+    return np.asarray(image, dtype=np.float32), megapixels
+
+
+def edge_density(gray: np.ndarray, threshold: float = 24.0) -> float:
+    gx = np.abs(np.diff(gray, axis=1))[:-1, :]
+    gy = np.abs(np.diff(gray, axis=0))[:, :-1]
+    return float(np.mean((gx + gy) > threshold))
+
+
+def colour_entropy(pixels: np.ndarray) -> float:
+    """Shannon entropy of the 12-bit colour histogram, normalised to [0, 1]"""
+    quantised = pixels.astype(np.uint16) >> 4
+    codes = (quantised[..., 0] << 8) | (quantised[..., 1] << 4) | quantised[..., 2]
+    counts = np.bincount(codes.ravel(), minlength=4096)
+    p = counts[counts > 0] / codes.size
+    return float(-(p * np.log2(p)).sum() / 12.0)
+
+
+def region_count(pixels: np.ndarray, min_fraction: float = 0.002) -> int:
+    """Connected regions of similar colour on a coarse grid, ignoring specks"""
+    image = Image.fromarray(pixels.astype(np.uint8)).resize((REGION_GRID, REGION_GRID), Image.BILINEAR)
+    quantised = np.asarray(image, dtype=np.uint8) >> 6
+    colours = (quantised[..., 0].astype(np.int32) << 4) | (quantised[..., 1] << 2) | quantised[..., 2]
+
+    # Vectorised label propagation: every pixel repeatedly takes the smallest
+    # label among its same-coloured 4-neighbours until nothing changes.
+    labels = np.arange(colours.size, dtype=np.int32).reshape(colours.shape)
+    same_right = colours[:, 1:] == colours[:, :-1]
+    same_down = colours[1:, :] == colours[:-1, :]
+    while True:
+        merged = labels.copy()
+        across = np.minimum(labels[:, 1:], labels[:, :-1])
+        merged[:, 1:] = np.where(same_right, np.minimum(merged[:, 1:], across), merged[:, 1:])
+        merged[:, :-1] = np.where(same_right, np.minimum(merged[:, :-1], across), merged[:, :-1])
+        across = np.minimum(labels[1:, :], labels[:-1, :])
+        merged[1:, :] = np.where(same_down, np.minimum(merged[1:, :], across), merged[1:, :])
+        merged[:-1, :] = np.where(same_down, np.minimum(merged[:-1, :], across), merged[:-1, :])
+        flat = merged.ravel()
+        merged = flat[flat].reshape(labels.shape)  # pointer jumping speeds up convergence
+        if np.array_equal(merged, labels):
+            break
+        labels = merged
+
+    sizes = np.bincount(labels.ravel())
+    return int(np.count_nonzero(sizes >= max(1, min_fraction * colours.size)))
+
+
+def extract_features(image_bytes: bytes) -> dict:
+    pixels, megapixels = load_pixels(image_bytes)
+    gray = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return {
+        "edge_density": edge_density(gray),
+        "colour_entropy": colour_entropy(pixels),
+        "region_count": region_count(pixels),
+        "megapixels": megapixels,
+    }
+
+
+def complexity_score(features: dict) -> float:
+    normalised = {
+        "edge_density": min(features["edge_density"] / 0.25, 1.0),
+        "colour_entropy": features["colour_entropy"],
+        "region_count": min(features["region_count"] / 60.0, 1.0),
+        "megapixels": min(features["megapixels"] / 4.0, 1.0),
+    }
+    return sum(FEATURE_WEIGHTS[name] * value for name, value in normalised.items())
+
+
+def score_thresholds() -> tuple[float, float]:
+    """Score boundaries Simple|Moderate and Moderate|Complex, from LOCAL_COMPLEXITY_THRESHOLDS"""
+    low, high = (os.getenv("LOCAL_COMPLEXITY_THRESHOLDS") or "0.15,0.45").split(",")
+    return float(low), float(high)
+
+
+def classify_score(score: float, thresholds: tuple[float, float] = None, margin: float = 0.1) -> tuple[str, float]:
+    """Complexity level for a score, with a confidence that drops near the boundaries"""
+    low, high = thresholds or score_thresholds()
+    level = LEVELS[0] if score < low else LEVELS[1] if score < high else LEVELS[2]
+    distance = min(abs(score - low), abs(score - high))
+    return level, min(1.0, 0.5 + distance / (2 * margin))
+
+
+def classify_image(image_bytes: bytes) -> dict:
+    started = time.perf_counter()
+    features = extract_features(image_bytes)
+    score = complexity_score(features)
+    level, confidence = classify_score(score)
+    return {"complexity_level": level, "confidence": confidence, "score": score, "features": features,
+            "elapsed_ms": (time.perf_counter() - started) * 1000}
+
+
+def min_confidence() -> float:
+    return float(os.getenv("LOCAL_COMPLEXITY_MIN_CONFIDENCE") or 0.8)
+
+
+def classify_if_confident(image_bytes: Optional[bytes]) -> Optional[dict]:
+    """Local classification when it is confident enough to skip the LLM, otherwise None"""
+    if image_bytes is None:
+        return None
+    try:
+        result = classify_image(image_bytes)
+    except Exception:
+        return None
+    return result if result["confidence"] >= min_confidence() else None
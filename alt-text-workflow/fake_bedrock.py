@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+COMPLEXITY_LEVELS = ["Simple", "Moderate", "Complex"]
+
+
+class FakeBedrockClient:
+    """In-process stand-in for the bedrock-runtime client.
+
+    Answers `converse` with well-formed complexity / alt-text responses so the
+    workflow can run without network access or AWS credentials. The most recent
+    requests are kept in `calls` for inspection and `call_count` counts them all.
+    System blocks ending in a cachePoint are treated like Bedrock prompt caching:
+    when the prefix reaches the model's minimum (models.prompt_cache_min_tokens,
+    else PROMPT_CACHE_MIN_TOKENS or 1,024), the first request with it reports
+    cache-write tokens and later ones cache-read tokens; a shorter prefix is
+    billed as input like an uncached one.
+
+    Latency is `latency_ms` per call, or log-normally distributed around it
+    (median `latency_ms`, sigma `latency_jitter`). `complexity_weights` sets the
+    share of Simple / Moderate / Complex labels, assigned deterministically per
+    request content.
+
+    With `throttle_rps` set, requests beyond that many in any one-second window
+    fail with a ThrottlingException, like Bedrock over its quota; `throttled`
+    counts them.
+
+    Faults for testing hedging and failover: a `slow_rate` share of calls takes
+    `slow_ms` instead, and an `error_rate` share fails with an
+    InternalServerException (`errors` counts them).
+    """
+
+    def __init__(self, latency_ms: float = 0.0, latency_jitter: float = 0.0, complexity_weights=None, seed=None,
+                 throttle_rps: float = 0, slow_rate: float = 0.0, slow_ms: float = 0.0, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.latency_jitter = latency_jitter
+        self.complexity_weights = complexity_weights
+        self.calls = deque(maxlen=1000)
+        self.call_count = 0
+        self.request_bytes = 0
+        self.throttle_rps = throttle_rps
+        self.throttled = 0
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        self.errors = 0
+        self._accepted = deque()
+        self._cached_prefixes = set()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, region_name: str = None):
+        """Settings from FAKE_BEDROCK_* env vars; FAKE_BEDROCK_REGIONS (JSON object of region
+        -> constructor arguments) overrides them per region, to simulate a degraded region"""
+        weights = os.getenv("FAKE_BEDROCK_COMPLEXITY_WEIGHTS")
+        settings = dict(latency_ms=float(os.getenv("FAKE_BEDROCK_LATENCY_MS") or 0),
+                        latency_jitter=float(os.getenv("FAKE_BEDROCK_LATENCY_JITTER") or 0),
+                        complexity_weights=[float(w) for w in weights.split(",")] if weights else None,
+                        throttle_rps=float(os.getenv("FAKE_BEDROCK_THROTTLE_RPS") or 0),
+                        slow_rate=float(os.getenv("FAKE_BEDROCK_SLOW_RATE") or 0),
+                        slow_ms=float(os.getenv("FAKE_BEDROCK_SLOW_MS") or 0),
+                        error_rate=float(os.getenv("FAKE_BEDROCK_ERROR_RATE") or 0))
+        regions = json.loads(os.getenv("FAKE_BEDROCK_REGIONS") or "{}")
+        return cls(**{**settings, **regions.get(region_name, {})})
+
+    def sample_latency_ms(self) -> float:
+        with self._lock:
+            if self.slow_rate and self._random.random() < self.slow_rate:
+                return self.slow_ms
+            if not self.latency_ms or not self.latency_jitter:
+                return self.latency_ms
+            return self._random.lognormvariate(0, self.latency_jitter) * self.latency_ms
+
+    def converse(self, modelId: str, messages: list[dict], **kwargs) -> dict:
+        started = time.perf_counter()
+        self._record(modelId, messages, kwargs)
+        latency_ms = self.sample_latency_ms()
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        return self._response(modelId, messages, kwargs, started)
+
+    async def aconverse(self, modelId: str, messages: list[dict], **kwargs) -> dict:
+        started = time.perf_counter()
+        self._record(modelId, messages, kwargs)
+        latency_ms = self.sample_latency_ms()
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        return self._response(modelId, messages, kwargs, started)
+
+    def converse_stream(self, modelId: str, messages: list[dict], **kwargs) -> dict:
+        self._record(modelId, messages, kwargs)
+        text, stop_reason = self.generate(messages, kwargs)
+        usage = self._usage(modelId, messages, kwargs.get("system"), text)
+        chunks = _chunks(text)
+        latency_ms = self.sample_latency_ms()
+
+        def events():
+            for index, chunk in enumerate(chunks):
+                delay = self._chunk_delay(index, len(chunks), latency_ms)
+                if delay:
+                    time.sleep(delay)
+                yield {"contentBlockDelta": {"delta": {"text": chunk}, "contentBlockIndex": 0}}
+            yield {"messageStop": {"stopReason": stop_reason}}
+            yield {"metadata": {"usage": usage, "metrics": {"latencyMs": int(latency_ms)}}}
+
+        return {"stream": events()}
+
+    async def aconverse_stream(self, modelId: str, messages: list[dict], **kwargs) -> dict:
+        self._record(modelId, messages, kwargs)
+        text, stop_reason = self.generate(messages, kwargs)
+        usage = self._usage(modelId, messages, kwargs.get("system"), text)
+        chunks = _chunks(text)
+        latency_ms = self.sample_latency_ms()
+
+        async def events():
+            for index, chunk in enumerate(chunks):
+                delay = self._chunk_delay(index, len(chunks), latency_ms)
+                if delay:
+                    await asyncio.sleep(delay)
+                yield {"contentBlockDelta": {"delta": {"text": chunk}, "contentBlockIndex": 0}}
+            yield {"messageStop": {"stopReason": stop_reason}}
+            yield {"metadata": {"usage": usage, "metrics": {"latencyMs": int(latency_ms)}}}
+
+        return {"stream": events()}
+
+    def _chunk_delay(self, index: int, count: int, latency_ms: float) -> float:
+        """Seconds before chunk `index`: a quarter of the latency to the first token, the rest spread evenly"""
+        if not latency_ms:
+            return 0.0
+        first_token = latency_ms / 4
+        return (first_token if index == 0 else (latency_ms - first_token) / max(count - 1, 1)) / 1000
+
+    def _record(self, model_id: str, messages: list[dict], kwargs: dict) -> None:
+        with self._lock:
+            if self.throttle_rps:
+                now = time.monotonic()
+                while self._accepted and self._accepted[0] <= now - 1:
+                    self._accepted.popleft()
+                if len(self._accepted) >= self.throttle_rps:
+                    self.throttled += 1
+                    raise throttling_error("Converse")
+                self._accepted.append(now)
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors += 1
+                raise server_error("Converse")
+            self.calls.append({"modelId": model_id, "messages": messages, **kwargs})
+            self.call_count += 1
+            self.request_bytes += _request_bytes(messages, kwargs.get("system"))
+
+    def _response(self, model_id: str, messages: list[dict], kwargs: dict, started: float) -> dict:
+        text, stop_reason = self.generate(messages, kwargs)
+        return {
+            "output": {"message": {"role": "assistant", "content": [{"text": text}]}},
+            "stopReason": stop_reason,
+            "usage": self._usage(model_id, messages, kwargs.get("system"), text),
+            "metrics": {"latencyMs": int((time.perf_counter() - started) * 1000)},
+        }
+
+    def _usage(self, model_id: str, messages: list[dict], system: list[dict], text: str) -> dict:
+        usage = {"inputTokens": _count_tokens(messages), "outputTokens": len(text.split()),
+                 "cacheReadInputTokens": 0, "cacheWriteInputTokens": 0}
+        system_tokens = len(_system_text(system).split())
+        if system and "cachePoint" in system[-1] and _cacheable_prefix(model_id, _system_text(system)):
+            prefix = hashlib.sha256(f"{model_id}\n{_system_text(system)}".encode()).hexdigest()
+            with self._lock:
+                cached = prefix in self._cached_prefixes
+                self._cached_prefixes.add(prefix)
+            usage["cacheReadInputTokens" if cached else "cacheWriteInputTokens"] = system_tokens
+        else:
+            usage["inputTokens"] += system_tokens
+        usage["totalTokens"] = (usage["inputTokens"] + usage["outputTokens"]
+                                + usage["cacheReadInputTokens"] + usage["cacheWriteInputTokens"])
+        return usage
+
+    def generate(self, messages: list[dict], kwargs: dict) -> tuple[str, str]:
+        """Response text and stop reason, honouring inferenceConfig stopSequences and maxTokens (one word per token)"""
+        text = self.respond(messages, kwargs.get("system"))
+        config = kwargs.get("inferenceConfig") or {}
+        for stop in config.get("stopSequences") or []:
+            if stop in text:
+                return text.split(stop, 1)[0], "stop_sequence"
+        words = text.split(" ")
+        if config.get("maxTokens") and len(words) > config["maxTokens"]:
+            return " ".join(words[:config["maxTokens"]]), "max_tokens"
+        return text, "end_turn"
+
+    def respond(self, messages: list[dict], system: list[dict] = None) -> str:
+        prompt = _system_text(system) + "\n" + _prompt_text(messages)
+        description = prompt.rsplit("Image description:", 1)[-1].strip() if "Image description:" in prompt else ""
+        if "COMPLEXITY:" in prompt and "ALT-TEXT:" in prompt:
+            level = pick_complexity(messages, self.complexity_weights)
+            return (f"COMPLEXITY: {level}\nREASONING: Fake backend classified the content as {level.lower()}.\n"
+                    f"ALT-TEXT: {description or 'A placeholder description generated offline'}")
+        if "COMPLEXITY:" in prompt:
+            level = pick_complexity(messages, self.complexity_weights)
+            return f"COMPLEXITY: {level}\nREASONING: Fake backend classified the content as {level.lower()}."
+        if 'ORIGINAL ALT-TEXT: "' in prompt:
+            original = prompt.split('ORIGINAL ALT-TEXT: "', 1)[1].split('"', 1)[0]
+            return f"ALT-TEXT: {original.rstrip('.')}, revised per feedback."
+        return f"ALT-TEXT: {description or 'A placeholder description generated offline'}"
+
+
+def throttling_error(operation: str) -> Exception:
+    """The error botocore raises when Bedrock throttles a request"""
+    from botocore.exceptions import ClientError
+
+    return ClientError({"Error": {"Code": "ThrottlingException", "Message": "Too many requests, please wait before trying again."},
+                        "ResponseMetadata": {"HTTPStatusCode": 429}}, operation)
+
+
+def server_error(operation: str) -> Exception:
+    """The error botocore raises when Bedrock fails a request on its side"""
+    from botocore.exceptions import ClientError
+    return ClientError({"Error": {"Code": "InternalServerException", "Message": "The server encountered an internal error."},
+                        "ResponseMetadata": {"HTTPStatusCode": 500}}, operation)
+
+
+def pick_complexity(messages: list[dict], weights=None) -> str:
+    """Deterministic complexity label derived from the request content, distributed by weights"""
+    digest = hashlib.sha256()
+    for message in messages:
+        for block in message.get("content", []):
+            if "image" in block:
+                digest.update(bytes(block["image"]["source"].get("bytes", b"")))
+            elif "text" in block:
+                digest.update(block["text"].rsplit("Image description:", 1)[-1].encode())
+    weights = weights or [1] * len(COMPLEXITY_LEVELS)
+    point = int.from_bytes(digest.digest()[:8], "big") / 2 ** 64 * sum(weights)
+    for level, weight in zip(COMPLEXITY_LEVELS, weights):
+        point -= weight
+        if point < 0:
+            return level
+    return COMPLEXITY_LEVELS[-1]
+
+
+def _chunks(text: str) -> list[str]:
+    """Split a response into word-sized stream deltas"""
+    words = text.split(" ")
+    return [word if index == 0 else " " + word for index, word in enumerate(words)]
+
+
+def _prompt_text(messages: list[dict]) -> str:
+    return "\n".join(block["text"] for message in messages for block in message.get("content", []) if "text" in block)
+
+
+def _system_text(system: list[dict]) -> str:
+    return "\n".join(block["text"] for block in system or [] if "text" in block)
+
+
+def _cacheable_prefix(model_id: str, text: str) -> bool:
+    """Bedrock caches nothing below the model's minimum prefix length"""
+    from models import prompt_cache_min_tokens
+
+    minimum = prompt_cache_min_tokens(model_id) or int(os.getenv("PROMPT_CACHE_MIN_TOKENS") or 1024)
+    return len(text) // 4 >= minimum
+
+
+def _request_bytes(messages: list[dict], system: list[dict]) -> int:
+    """Approximate request size: image bytes plus UTF-8 text"""
+    size = len(_system_text(system).encode())
+    for message in messages:
+        for block in message.get("content", []):
+            if "image" in block:
+                size += len(block["image"]["source"].get("bytes", b""))
+            elif "text" in block:
+                size += len(block["text"].encode())
+    return size
+
+
+def _count_tokens(messages: list[dict]) -> int:
+    return len(_prompt_text(messages).split())
@@ -0,0 +1,58 @@
+import hashlib
+import io
+import os
+import threading
+import time
+
+
+class FakeS3Client:
+    """In-process stand-in for the S3 client, enough for image references:
+    put_object, get_object and head_object on an in-memory bucket map.
+
+    `latency_ms` is added to every call. `bytes_in` / `bytes_out` count the object
+    bytes uploaded and downloaded.
+    """
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.objects = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(latency_ms=float(os.getenv("FAKE_S3_LATENCY_MS") or 0))
+
+    def _wait(self) -> None:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def _get(self, bucket: str, key: str) -> tuple[bytes, str]:
+        with self._lock:
+            found = self.objects.get((bucket, key))
+        if found is None:
+            from botocore.exceptions import ClientError
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "The specified key does not exist."},
+                               "ResponseMetadata": {"HTTPStatusCode": 404}}, "GetObject")
+        return found
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, ContentType: str = "binary/octet-stream", **kwargs) -> dict:
+        self._wait()
+        body = bytes(Body)
+        with self._lock:
+            self.objects[(Bucket, Key)] = (body, ContentType)
+            self.bytes_in += len(body)
+        return {"ETag": f'"{hashlib.md5(body).hexdigest()}"'}
+
+    def head_object(self, Bucket: str, Key: str, **kwargs) -> dict:
+        self._wait()
+        body, content_type = self._get(Bucket, Key)
+        return {"ContentLength": len(body), "ContentType": content_type}
+
+    def get_object(self, Bucket: str, Key: str, **kwargs) -> dict:
+        self._wait()
+        body, content_type = self._get(Bucket, Key)
+        with self._lock:
+            self.bytes_out += len(body)
+        return {"Body": io.BytesIO(body), "ContentLength": len(body), "ContentType": content_type}
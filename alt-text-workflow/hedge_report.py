@@ -0,0 +1,223 @@
+"""Measure hedged requests and multi-region failover against fake regional endpoints.
+
+    python3 hedge_report.py --calls 400 --concurrency 16 --latency-ms 200 --slow-rate 0.03 --slow-ms 2000
+
+Two fake Bedrock regions answer model calls with log-normal latency around
+--latency-ms; the primary also sends a --slow-rate share of calls to --slow-ms,
+like a degraded region. Runs:
+- single region: every call to the primary (no BEDROCK_REGIONS);
+- hedged: a call still open past the primary's p95 (--hedge-percentile) gets a
+  duplicate in the secondary region, first response wins (acall_claude, then
+  call_claude on a thread pool, and stream_claude hedged on time to first token);
+- saturated: sync calls with router threads for half --concurrency and at most
+  --max-hedges hedges in flight, so some calls run unhedged on their own thread;
+- failover: the primary fails every call; the router takes it out of rotation
+  after --failure-threshold errors and serves from the secondary.
+Reports p50/p95/p99 per run, the extra calls hedging cost and the p99 change.
+Exits non-zero when hedging does not lower p99, a failover run loses calls, a
+run leaves rate-limiter slots in flight once its calls have ended (a cancelled
+hedge that kept its slot), or the saturated run fails calls, starts more pool
+threads than it has or sends more hedges than it is allowed in flight.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import models
+from fake_bedrock import FakeBedrockClient
+from rate_limiter import rate_limiter_stats, reset_rate_limiters
+from regions import RegionRouter, set_router
+
+PRIMARY, SECONDARY = "us-east-1", "us-west-2"
+MODEL_ID = "fake.model"
+CONVERSATION = [{"role": "user", "content": [{"text": "Image description: A red bicycle against a brick wall"}]}]
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1) if ordered else None
+
+
+def timed_sync(call) -> tuple[float, bool]:
+    started = time.perf_counter()
+    try:
+        call()
+        return (time.perf_counter() - started) * 1000, True
+    except Exception:
+        return (time.perf_counter() - started) * 1000, False
+
+
+def track_in_flight(fake: FakeBedrockClient) -> dict:
+    """Wrap fake.converse to record the most calls it had in flight at once"""
+    counts = {"in_flight": 0, "peak": 0}
+    lock = threading.Lock()
+    converse = fake.converse
+
+    def tracked(**kwargs):
+        with lock:
+            counts["in_flight"] += 1
+            counts["peak"] = max(counts["peak"], counts["in_flight"])
+        try:
+            return converse(**kwargs)
+        finally:
+            with lock:
+                counts["in_flight"] -= 1
+
+    fake.converse = tracked
+    return counts
+
+
+def settled_in_flight(timeout_s: float) -> int:
+    """Rate-limiter slots in flight once losing attempts left running (sync hedges) have had time to end"""
+    deadline = time.monotonic() + timeout_s
+    while True:
+        in_flight = sum(limiter["in_flight"] for limiter in rate_limiter_stats().values())
+        if not in_flight or time.monotonic() > deadline:
+            return in_flight
+        time.sleep(0.01)
+
+
+def stream_text() -> str:
+    return "".join(models.stream_claude(MODEL_ID, CONVERSATION))
+
+
+async def run_async(calls: int, concurrency: int) -> list[tuple[float, bool]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await models.acall_claude(MODEL_ID, CONVERSATION)
+                return (time.perf_counter() - started) * 1000, True
+            except Exception:
+                return (time.perf_counter() - started) * 1000, False
+
+    return await asyncio.gather(*(one() for _ in range(calls)))
+
+
+def run(name: str, args, kind: str = "async", routed: bool = True, primary_errors: float = 0.0,
+        max_workers: int = 64, max_hedges: int = 16) -> dict:
+    fakes = {
+        PRIMARY: FakeBedrockClient(latency_ms=args.latency_ms, latency_jitter=args.latency_jitter, seed=1,
+                                   slow_rate=args.slow_rate, slow_ms=args.slow_ms, error_rate=primary_errors),
+        SECONDARY: FakeBedrockClient(latency_ms=args.latency_ms, latency_jitter=args.latency_jitter, seed=2),
+    }
+    secondary_calls = track_in_flight(fakes[SECONDARY])
+    reset_rate_limiters()
+    models.set_client_factory(lambda region_name, model_id: fakes[region_name or PRIMARY])
+    router = None
+    if routed:
+        router = RegionRouter([PRIMARY, SECONDARY], hedge_percentile=args.hedge_percentile, min_samples=20,
+                              hedge_delay_s=args.slow_ms / 2000, failure_threshold=args.failure_threshold,
+                              max_workers=max_workers, max_hedges=max_hedges)
+    set_router(router)
+    if kind == "async":
+        results = asyncio.run(run_async(args.calls, args.concurrency))
+    else:
+        call = stream_text if kind == "stream" else lambda: models.call_claude(MODEL_ID, CONVERSATION)
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda _: timed_sync(call), range(args.calls)))
+    latencies = sorted(ms for ms, ok in results if ok)
+    pool = router._executor if router else None
+    model_calls = sum(fake.call_count + fake.errors for fake in fakes.values())
+    return {"run": name, "calls": args.calls, "failed": sum(not ok for _, ok in results),
+            "p50_ms": percentile(latencies, 0.5), "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99), "model_calls": model_calls,
+            "extra_calls": round(model_calls / args.calls - 1, 3), "regions": router.stats() if router else None,
+            "pool_threads": len(pool._threads) if pool else 0, "max_workers": max_workers,
+            "peak_secondary_in_flight": secondary_calls["peak"], "max_hedges": max_hedges,
+            "limiter_in_flight": settled_in_flight(1 + 2 * args.slow_ms / 1000)}
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=200, help="median latency of both regions")
+    parser.add_argument("--latency-jitter", type=float, default=0.3, help="log-normal sigma of the latency")
+    parser.add_argument("--slow-rate", type=float, default=0.03, help="share of primary calls that are slow")
+    parser.add_argument("--slow-ms", type=float, default=2000, help="latency of a slow primary call")
+    parser.add_argument("--hedge-percentile", type=float, default=95)
+    parser.add_argument("--failure-threshold", type=int, default=3)
+    parser.add_argument("--max-hedges", type=int, default=2, help="hedges in flight of the saturated run")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    return parser.parse_args(argv)
+
+
+def run_all(args) -> list[dict]:
+    models.reset_usage_stats()
+    try:
+        return [
+            run("single region", args, routed=False),
+            run("hedged async", args),
+            run("hedged sync", args, kind="sync"),
+            run("hedged stream", args, kind="stream"),
+            run("failover unrouted", args, routed=False, primary_errors=1.0),
+            run("failover async", args, primary_errors=1.0),
+            run("failover sync", args, kind="sync", primary_errors=1.0),
+            run("saturated sync", args, kind="sync", max_workers=max(1, args.concurrency // 2),
+                max_hedges=args.max_hedges),
+        ]
+    finally:
+        set_router(None)
+        models.set_client_factory(None)
+
+
+def find_problems(results: list[dict]) -> list[str]:
+    baseline = results[0]
+    problems = []
+    for result in results[1:4]:
+        if result["p99_ms"] >= baseline["p99_ms"] or result["failed"]:
+            problems.append(f"{result['run']}: p99 {result['p99_ms']} ms, {result['failed']} failed")
+    for result in results[5:]:
+        if result["failed"]:
+            problems.append(f"{result['run']}: {result['failed']} calls failed")
+    for result in results:
+        if result["limiter_in_flight"]:
+            problems.append(f"{result['run']}: {result['limiter_in_flight']} rate-limiter slots still in flight")
+    saturated = results[7]
+    pool_size = saturated["max_workers"] + saturated["max_hedges"]
+    if saturated["pool_threads"] > pool_size:
+        problems.append(f"{saturated['run']}: {saturated['pool_threads']} pool threads, over {pool_size}")
+    if saturated["peak_secondary_in_flight"] > saturated["max_hedges"]:
+        problems.append(f"{saturated['run']}: {saturated['peak_secondary_in_flight']} hedges in flight, "
+                        f"over {saturated['max_hedges']}")
+    return problems
+
+
+def main():
+    args = parse_args()
+    results = run_all(args)
+
+    print(f"{'run':<20}{'failed':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'extra calls':>13}")
+    for result in results:
+        print(f"{result['run']:<20}{result['failed']:>7}{result['p50_ms']!s:>9}{result['p95_ms']!s:>9}{result['p99_ms']!s:>9}"
+              f"{result['extra_calls']:>13.1%}")
+    baseline = results[0]
+    for result in results[1:4]:
+        print(f"{result['run']}: p99 {baseline['p99_ms']} -> {result['p99_ms']} ms "
+              f"({1 - result['p99_ms'] / baseline['p99_ms']:.0%} lower)")
+    for result in results[5:7]:
+        primary = result["regions"].get(f"{PRIMARY}/{MODEL_ID}", {})
+        print(f"{result['run']}: {primary.get('calls')} calls to the failing primary, healthy={primary.get('healthy')}")
+    saturated = results[7]
+    secondary = saturated["regions"].get(f"{SECONDARY}/{MODEL_ID}", {})
+    print(f"{saturated['run']}: {saturated['pool_threads']} of {saturated['max_workers']} + {saturated['max_hedges']} pool threads, "
+          f"{secondary.get('hedges', 0)} hedges sent, {secondary.get('hedges_skipped', 0)} skipped, "
+          f"at most {saturated['peak_secondary_in_flight']} in flight (limit {saturated['max_hedges']})")
+
+    problems = find_problems(results)
+    for problem in problems:
+        print(f"FAIL {problem}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results, "problems": problems}, f, indent=2)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
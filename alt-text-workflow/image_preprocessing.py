@@ -0,0 +1,104 @@
+import base64
+import hashlib
+import io
+import os
+
+from PIL import Image
+
+# Formats the Bedrock Converse API accepts as image blocks.
+SUPPORTED_FORMATS = {"png", "jpeg", "gif", "webp"}
+
+
+def max_image_dimension() -> int:
+    """Longest edge sent to the model; larger images are downscaled"""
+    return int(os.getenv("MAX_IMAGE_DIMENSION") or 1568)
+
+
+def max_image_bytes() -> int:
+    """Byte budget of the encoded image sent to the model"""
+    return int(os.getenv("MAX_IMAGE_BYTES") or 3_750_000)
+
+
+def max_input_bytes() -> int:
+    """Hard limit on the decoded upload; larger payloads are rejected before decoding"""
+    return int(os.getenv("MAX_INPUT_IMAGE_BYTES") or 20_000_000)
+
+
+def max_input_pixels() -> int:
+    """Hard limit on the decoded pixel count, guarding against decompression bombs"""
+    return int(os.getenv("MAX_INPUT_IMAGE_PIXELS") or 40_000_000)
+
+
+def decode_data_uri(image_data: str) -> tuple[bytes, str]:
+    header, _, encoded = image_data.partition(",")
+    if len(encoded) * 3 // 4 > max_input_bytes():
+        raise ValueError(f"Image exceeds the {max_input_bytes()} byte upload limit")
+    image_format = header.split(";")[0].split("/")[1].lower()
+    return base64.b64decode(encoded), "jpeg" if image_format == "jpg" else image_format
+
+
+def prepare_image(image_bytes: bytes, image_format: str = None) -> dict:
+    """Fit an encoded image to the model's dimension and byte budget.
+
+    Images that already fit are passed through untouched; others are decoded
+    once, downscaled and re-encoded.
+    """
+    if len(image_bytes) > max_input_bytes():
+        raise ValueError(f"Image exceeds the {max_input_bytes()} byte upload limit")
+
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    if width * height > max_input_pixels():
+        raise ValueError(f"Image exceeds the {max_input_pixels()} pixel limit")
+
+    detected = (image.format or image_format or "").lower()
+    info = {"original_bytes": len(image_bytes), "original_size": [width, height]}
+    limit = max_image_dimension()
+    if detected in SUPPORTED_FORMATS and max(width, height) <= limit and len(image_bytes) <= max_image_bytes():
+        return {"bytes": image_bytes, "format": detected, "size": [width, height], "resized": False, **info}
+
+    # draft() lets the JPEG decoder skip straight to a reduced scale.
+    image.draft("RGB", (limit, limit))
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    image.thumbnail((limit, limit), Image.BICUBIC, reducing_gap=2.0)
+
+    # Graphics stay lossless PNG; photos (and PNGs too big for the budget) become JPEG.
+    output_format = "png" if has_alpha or detected == "png" else "jpeg"
+    quality = 85
+    while True:
+        buffer = io.BytesIO()
+        if output_format == "png":
+            image.save(buffer, format="PNG")
+        else:
+            image.save(buffer, format="JPEG", quality=quality)
+        if buffer.tell() <= max_image_bytes() or min(image.size) <= 64:
+            break
+        if output_format == "png" and not has_alpha:
+            output_format = "jpeg"
+        elif output_format == "jpeg" and quality > 55:
+            quality -= 15
+        else:
+            image.thumbnail((int(max(image.size) * 0.75),) * 2, Image.BICUBIC)
+
+    return {"bytes": buffer.getvalue(), "format": output_format, "size": list(image.size),
+            "resized": True, **info}
+
+
+def preprocess_image_bytes(image_bytes: bytes, image_format: str = None) -> dict:
+    """Fit raw image bytes to the model, adding a content hash of the result"""
+    prepared = prepare_image(image_bytes, image_format)
+    prepared["sha256"] = hashlib.sha256(prepared["bytes"]).hexdigest()
+    return prepared
+
+
+def preprocess_image_data(image_data: str) -> dict:
+    """Decode a data-URI once and fit it to the model, adding a content hash of the result"""
+    image_bytes, image_format = decode_data_uri(image_data)
+    return preprocess_image_bytes(image_bytes, image_format)
+
+
+def preprocess_image_reference(image_ref: str) -> dict:
+    """Read a referenced image (s3://bucket/key) once and fit it to the model, adding a content hash of the result"""
+    from image_store import read_image_reference
+    return preprocess_image_bytes(read_image_reference(image_ref, max_input_bytes()))
@@ -0,0 +1,77 @@
+import hashlib
+import os
+from typing import Optional
+
+from singletons import Lazy
+
+# Image references are S3 URIs: the client uploads the raw bytes once and sends
+# only "s3://bucket/key", instead of a base64 data-URI inside the JSON payload.
+
+
+def parse_s3_uri(uri: str) -> tuple[str, str]:
+    """(bucket, key) of an s3://bucket/key URI"""
+    if not uri.startswith("s3://"):
+        raise ValueError(f"Image reference must be an s3:// URI: {uri!r}")
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    if not bucket or not key:
+        raise ValueError(f"Image reference needs a bucket and a key: {uri!r}")
+    return bucket, key
+
+
+def allowed_buckets() -> set[str]:
+    """Buckets the backend may read image references from (IMAGE_REFERENCE_BUCKETS, comma-separated)"""
+    return {bucket.strip() for bucket in os.getenv("IMAGE_REFERENCE_BUCKETS", "").split(",") if bucket.strip()}
+
+
+def s3_client_factory():
+    import boto3
+    from botocore.config import Config
+
+    return boto3.session.Session().client("s3", region_name=os.getenv("REGION_NAME"),
+                                          endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+                                          config=Config(max_pool_connections=int(os.getenv("S3_MAX_POOL_CONNECTIONS") or 50)))
+
+
+def _s3_client_from_env():
+    if os.getenv("S3_BACKEND", "s3").lower() == "fake":
+        from fake_s3 import FakeS3Client
+        return FakeS3Client.from_env()
+    return s3_client_factory()
+
+
+_client = Lazy(_s3_client_from_env)
+
+
+def get_s3_client():
+    """Shared S3 client; S3_BACKEND=fake uses the in-process FakeS3Client, S3_ENDPOINT_URL a local S3 stand-in"""
+    return _client.get()
+
+
+def set_s3_client(client) -> None:
+    """Swap the S3 client, e.g. for a FakeS3Client; None rebuilds it from env on next use"""
+    if client is None:
+        _client.reset()
+    else:
+        _client.set(client)
+
+
+def read_image_reference(uri: str, max_bytes: Optional[int] = None) -> bytes:
+    """Raw bytes of a referenced image. The bucket must be allowed, and objects over
+    max_bytes are rejected from their Content-Length before the body is read."""
+    bucket, key = parse_s3_uri(uri)
+    if bucket not in allowed_buckets():
+        raise ValueError(f"Image references to bucket {bucket!r} are not allowed (see IMAGE_REFERENCE_BUCKETS)")
+    response = get_s3_client().get_object(Bucket=bucket, Key=key)
+    if max_bytes is not None and response.get("ContentLength", 0) > max_bytes:
+        response["Body"].close()
+        raise ValueError(f"Image exceeds the {max_bytes} byte upload limit")
+    return response["Body"].read()
+
+
+def upload_image(image_bytes: bytes, bucket: str, prefix: str = "alt-text/", content_type: str = None) -> str:
+    """Upload raw image bytes under a content-addressed key and return the s3:// reference
+    (the same image uploaded twice lands on the same key)"""
+    key = f"{prefix}{hashlib.sha256(image_bytes).hexdigest()}"
+    get_s3_client().put_object(Bucket=bucket, Key=key, Body=image_bytes,
+                               ContentType=content_type or "application/octet-stream")
+    return f"s3://{bucket}/{key}"
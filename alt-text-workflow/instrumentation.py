@@ -0,0 +1,135 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+from singletons import Lazy
+
+USAGE_FIELDS = ("inputTokens", "outputTokens", "cacheReadInputTokens", "cacheWriteInputTokens")
+
+metrics_logger = logging.getLogger("alt_text.metrics")
+
+# Model-call spans of the node currently running in this context.
+_node_spans = contextvars.ContextVar("alt_text_node_spans", default=None)
+
+
+class JsonLogSink:
+    """Writes every span as one JSON line to the alt_text.metrics logger"""
+
+    def emit(self, span: dict) -> None:
+        if metrics_logger.isEnabledFor(logging.INFO):
+            metrics_logger.info(json.dumps(span))
+
+
+class PrometheusSink:
+    """Aggregates spans into counters, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._nodes = {}
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def emit(self, span: dict) -> None:
+        with self._lock:
+            if span["span"] == "node":
+                totals = self._nodes.setdefault(span["name"], {"count": 0, "seconds": 0.0})
+            else:
+                totals = self._models.setdefault(span["model"], {"count": 0, "seconds": 0.0, **dict.fromkeys(USAGE_FIELDS, 0)})
+                for field in USAGE_FIELDS:
+                    totals[field] += span.get(field) or 0
+            totals["count"] += 1
+            totals["seconds"] += span["ms"] / 1000
+
+    def render(self) -> str:
+        lines = ["# TYPE alt_text_node_seconds summary"]
+        with self._lock:
+            for name, totals in sorted(self._nodes.items()):
+                lines.append(f'alt_text_node_seconds_count{{node="{name}"}} {totals["count"]}')
+                lines.append(f'alt_text_node_seconds_sum{{node="{name}"}} {totals["seconds"]:.6f}')
+            lines.append("# TYPE alt_text_model_call_seconds summary")
+            for model_id, totals in sorted(self._models.items()):
+                lines.append(f'alt_text_model_call_seconds_count{{model="{model_id}"}} {totals["count"]}')
+                lines.append(f'alt_text_model_call_seconds_sum{{model="{model_id}"}} {totals["seconds"]:.6f}')
+            lines.append("# TYPE alt_text_model_tokens_total counter")
+            for model_id, totals in sorted(self._models.items()):
+                for field in USAGE_FIELDS:
+                    lines.append(f'alt_text_model_tokens_total{{model="{model_id}",type="{field}"}} {totals[field]}')
+        return "\n".join(lines) + "\n"
+
+
+_sink = Lazy(lambda: {"log": JsonLogSink, "prometheus": PrometheusSink}.get(
+    os.getenv("METRICS_SINK", "off").lower(), lambda: None)())
+
+
+def get_sink():
+    """Process-wide span sink from METRICS_SINK (off, log or prometheus); None when off"""
+    return _sink.get()
+
+
+def set_sink(sink) -> None:
+    """Install any object with an `emit(span)` method, or None to disable exporting"""
+    _sink.set(sink)
+
+
+def record_model_call(model_id: str, started: float, usage: dict, metrics: dict = None) -> None:
+    """Span of one model call, with the token usage and server-side latency Bedrock reported"""
+    span = {"span": "model", "model": model_id, "ms": round((time.perf_counter() - started) * 1000, 2),
+            "latencyMs": (metrics or {}).get("latencyMs"), **{field: usage.get(field) or 0 for field in USAGE_FIELDS}}
+    spans = _node_spans.get()
+    if spans is not None:
+        spans.append(span)
+    sink = get_sink()
+    if sink is not None:
+        sink.emit(span)
+
+
+def _finish_node(name: str, started: float, spans: list, state: dict) -> None:
+    span = {"span": "node", "name": name, "ms": round((time.perf_counter() - started) * 1000, 2)}
+    sink = get_sink()
+    if sink is not None:
+        sink.emit(span)
+    if not isinstance(state, dict) or not state.get("include_metrics"):
+        return
+    metrics = state.get("metrics") or {"total_ms": 0.0, "spans": [], "models": {}}
+    metrics["spans"] += [*spans, span]
+    metrics["total_ms"] = round(metrics["total_ms"] + span["ms"], 2)
+    for model_span in spans:
+        totals = metrics["models"].setdefault(model_span["model"], {"calls": 0, "ms": 0.0, **dict.fromkeys(USAGE_FIELDS, 0)})
+        totals["calls"] += 1
+        totals["ms"] = round(totals["ms"] + model_span["ms"], 2)
+        for field in USAGE_FIELDS:
+            totals[field] += model_span[field]
+    state["metrics"] = metrics
+
+
+def instrument_node(name: str, func, afunc=None):
+    """Wrap a node (and its async variant) to time it and collect the model calls it makes"""
+
+    def run(state):
+        spans = []
+        token = _node_spans.set(spans)
+        started = time.perf_counter()
+        try:
+            result = func(state)
+        finally:
+            _node_spans.reset(token)
+        _finish_node(name, started, spans, result)
+        return result
+
+    if afunc is None:
+        return run, None
+
+    async def arun(state):
+        spans = []
+        token = _node_spans.set(spans)
+        started = time.perf_counter()
+        try:
+            result = await afunc(state)
+        finally:
+            _node_spans.reset(token)
+        _finish_node(name, started, spans, result)
+        return result
+
+    return run, arun
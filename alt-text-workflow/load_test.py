@@ -0,0 +1,348 @@
+"""Load-test the served entrypoint: start alt_text_main.py on the fake backend and drive it over HTTP.
+
+    python3 load_test.py --concurrency 1,8,32,64 --step-seconds 15 --latency-ms 300
+    python3 load_test.py --concurrency 32,128 --config default: --config threads8:BLOCKING_THREADS=8 --output load.json
+
+For each --config (a name, then comma-separated KEY=VALUE env vars for the server,
+e.g. BLOCKING_THREADS, SERVER_LIMIT_CONCURRENCY, RATE_LIMIT_MAX_CONCURRENCY) a fresh
+server process is started with MODEL_BACKEND=fake and --latency-ms per model call.
+It is then driven by closed-loop clients, one step per --concurrency value. Each
+client picks its next request from --mix:
+- new: an image from a pool of synthetic images of every --sizes size;
+- text: description only, no image;
+- revise / approve: feedback on the client's last alt-text, through the
+  feedback_routing paths (stateless state round-trip, or server-side sessions
+  with --sessions); without an alt-text awaiting feedback the client sends a new image.
+Every description is unique, so the result cache and request coalescing do not
+serve repeated work.
+
+Per step: throughput, latency p50/p95/p99 (overall and per request kind), error
+rate, and the server's CPU, resident memory and thread count sampled from /proc
+every --sample-seconds, and the blocking executor size and threads it started as
+the server reports them on /metrics. The full resource timeline is in the
+--output JSON. Exits non-zero when the server does not start, a step's error rate
+exceeds --max-error-rate, or the server's blocking executor does not have the
+size its BLOCKING_THREADS asked for.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from sample_images import synthetic_image, to_data_uri
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LEVELS = ("Simple", "Moderate", "Complex")
+FEEDBACK = ("make it more concise", "mention the colours", "make it more professional")
+
+
+def parse_config(spec: str) -> tuple[str, dict]:
+    name, _, assignments = spec.partition(":")
+    env = {}
+    for assignment in filter(None, assignments.split(",")):
+        key, _, value = assignment.partition("=")
+        env[key.strip()] = value.strip()
+    return name or "default", env
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("new", "text", "revise", "approve"):
+            raise ValueError(f"Unknown request kind in --mix: {kind}")
+        mix[kind] = float(weight)
+    return mix
+
+
+def percentile(ordered: list[float], q: float):
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1) if ordered else None
+
+
+class Server:
+    """alt_text_main.py in a child process, on the fake backend"""
+
+    def __init__(self, port: int, env: dict, latency_ms: float, log_path: str):
+        self.port = port
+        self.log_path = log_path
+        server_env = {**os.environ, "MODEL_BACKEND": "fake", "FAKE_BEDROCK_LATENCY_MS": str(latency_ms),
+                      "FAKE_BEDROCK_LATENCY_JITTER": "0.3", "LOG_LEVEL": "WARNING", "WARM_UP_ON_START": "true",
+                      "METRICS_SINK": "prometheus", "PORT": str(port), **env}
+        self._log = open(log_path, "w")
+        self.process = subprocess.Popen([sys.executable, os.path.join(HERE, "alt_text_main.py")], cwd=HERE,
+                                        env=server_env, stdout=self._log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout: float = 60) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=2)
+                connection.request("GET", "/ping")
+                if connection.getresponse().status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        with open(self.log_path) as f:
+            raise RuntimeError(f"Server did not start on port {self.port}:\n{f.read()[-2000:]}")
+
+    def metrics(self) -> dict:
+        """Unlabelled samples of the server's /metrics, by name"""
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        connection.request("GET", "/metrics")
+        response = connection.getresponse()
+        body = response.read().decode()
+        if response.status != 200:
+            return {}
+        samples = {}
+        for line in body.splitlines():
+            name, _, value = line.partition(" ")
+            if line and not line.startswith("#") and "{" not in name:
+                samples[name] = float(value)
+        return samples
+
+    def stop(self) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self._log.close()
+
+
+class ResourceSampler(threading.Thread):
+    """Samples CPU %, resident memory and threads of a process from /proc (Linux only)"""
+
+    def __init__(self, pid: int, interval: float):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.label = None
+        self._stopped = threading.Event()
+        self._ticks = os.sysconf("SC_CLK_TCK")
+
+    def _read(self) -> tuple[float, float, int]:
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu_s = (int(fields[11]) + int(fields[12])) / self._ticks
+        rss_mb, threads = 0.0, 0
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss_mb = int(line.split()[1]) / 1024
+                elif line.startswith("Threads:"):
+                    threads = int(line.split()[1])
+        return cpu_s, rss_mb, threads
+
+    def run(self) -> None:
+        try:
+            previous_cpu, _, _ = self._read()
+        except OSError:
+            return
+        previous = time.monotonic()
+        while not self._stopped.wait(self.interval):
+            try:
+                cpu_s, rss_mb, threads = self._read()
+            except OSError:
+                return
+            now = time.monotonic()
+            self.samples.append({"t": round(time.time(), 2), "step": self.label,
+                                 "cpu_percent": round((cpu_s - previous_cpu) / (now - previous) * 100, 1),
+                                 "rss_mb": round(rss_mb, 1), "threads": threads})
+            previous_cpu, previous = cpu_s, now
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+class Client:
+    """One closed-loop client: a kept-alive connection and the last alt-text awaiting feedback"""
+
+    def __init__(self, number: int, args, images: list[str], counter):
+        self.number = number
+        self.args = args
+        self.images = images
+        self.counter = counter
+        self.random = random.Random(args.seed * 100_003 + number)
+        self.kinds, self.weights = zip(*args.mix.items())
+        self.last_state = None
+        self.session_id = None
+        self.connection = None
+
+    def payload(self) -> tuple[str, dict]:
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        if kind in ("revise", "approve") and not (self.last_state or {}).get("waiting_for_feedback"):
+            kind = "new"
+        feedback = "approve" if kind == "approve" else self.random.choice(FEEDBACK)
+        if kind in ("revise", "approve"):
+            if self.args.sessions:
+                return kind, {"session_id": self.session_id, "feedback": feedback}
+            return kind, {**self.last_state, "user_input": feedback}
+        payload = {"user_input": f"Load test request {next(self.counter)}: a product on a table"}
+        if kind == "new":
+            payload["image_data"] = self.random.choice(self.images)
+        if self.args.sessions:
+            self.session_id = payload["session_id"] = f"load-{self.number}-{next(self.counter)}"
+        return kind, payload
+
+    def send(self, payload: dict) -> tuple[int, bytes]:
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection("127.0.0.1", self.args.port, timeout=self.args.timeout)
+            try:
+                self.connection.request("POST", "/invocations", json.dumps(payload),
+                                        {"Content-Type": "application/json"})
+                response = self.connection.getresponse()
+                return response.status, response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # A kept-alive connection the server closed: reconnect once.
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+    def run(self, deadline: float, results: list) -> None:
+        while time.monotonic() < deadline:
+            kind, payload = self.payload()
+            started = time.monotonic()
+            try:
+                status, body = self.send(payload)
+                ok = status == 200
+            except OSError:
+                ok = False
+                self.connection = None
+            finished = time.monotonic()
+            results.append((kind, started, finished - started, ok))
+            if ok and kind != "approve":
+                state = json.loads(body)
+                self.last_state = state if isinstance(state, dict) else None
+            elif kind == "approve":
+                self.last_state = None
+
+
+def run_step(args, images: list[str], concurrency: int, counter, sampler: ResourceSampler, server: Server,
+             config: str) -> dict:
+    sampler.label = f"{config}/{concurrency}"
+    results = []
+    started = time.monotonic()
+    measured_from = started + args.warmup_seconds
+    deadline = measured_from + args.step_seconds
+    clients = [Client(number, args, images, counter) for number in range(concurrency)]
+    threads = [threading.Thread(target=client.run, args=(deadline, results)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    window = [result for result in results if result[1] >= measured_from]
+    elapsed = max((started_at + latency for _, started_at, latency, _ in window), default=deadline) - measured_from
+    latencies = sorted(latency * 1000 for _, _, latency, ok in window if ok)
+    samples = [sample for sample in sampler.samples if sample["step"] == sampler.label]
+    step = {"config": config, "concurrency": concurrency, "requests": len(window),
+            "errors": sum(not ok for *_, ok in window),
+            "throughput_rps": round(sum(ok for *_, ok in window) / elapsed, 1),
+            "p50_ms": percentile(latencies, 0.5), "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+            "cpu_percent": round(sum(s["cpu_percent"] for s in samples) / len(samples), 1) if samples else None,
+            "peak_rss_mb": max((s["rss_mb"] for s in samples), default=None),
+            "peak_threads": max((s["threads"] for s in samples), default=None), "kinds": {}}
+    metrics = server.metrics()
+    for name in ("blocking_threads", "blocking_threads_started"):
+        value = metrics.get(f"alt_text_{name}")
+        step[name] = None if value is None else int(value)
+    step["error_rate"] = round(step["errors"] / step["requests"], 4) if step["requests"] else 0.0
+    for kind in args.mix:
+        kind_latencies = sorted(latency * 1000 for name, _, latency, ok in window if ok and name == kind)
+        if kind_latencies:
+            step["kinds"][kind] = {"requests": len(kind_latencies), "p50_ms": percentile(kind_latencies, 0.5),
+                                   "p95_ms": percentile(kind_latencies, 0.95)}
+    return step
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,32,64", help="clients per step, comma-separated")
+    parser.add_argument("--step-seconds", type=float, default=15)
+    parser.add_argument("--warmup-seconds", type=float, default=2, help="start of each step left out of the stats")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("new=60,text=20,revise=15,approve=5"))
+    parser.add_argument("--sizes", default="320x240,1024x768,3000x2000", help="sizes of the synthetic images")
+    parser.add_argument("--images-per-size", type=int, default=6)
+    parser.add_argument("--sessions", action="store_true", help="revise through server-side sessions (session_id)")
+    parser.add_argument("--latency-ms", type=float, default=300, help="fake backend latency per model call")
+    parser.add_argument("--config", action="append", type=parse_config, help="NAME:KEY=VALUE,... server env (repeatable)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60, help="client timeout per request, seconds")
+    parser.add_argument("--sample-seconds", type=float, default=1.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the steps and resource timeline as JSON to this path")
+    args = parser.parse_args()
+
+    images = []
+    for size in args.sizes.split(","):
+        width, height = (int(part) for part in size.split("x"))
+        images += [to_data_uri(synthetic_image(LEVELS[seed % 3], (width, height), seed=seed))
+                   for seed in range(args.images_per_size)]
+    counter = itertools.count(1)
+
+    steps, timeline, problems = [], [], []
+    print(f"{'config':<14}{'conc':>5}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+          f"{'cpu %':>8}{'rss MB':>8}{'threads':>8}")
+    for config, env in args.config or [("default", {})]:
+        with tempfile.NamedTemporaryFile(prefix="load_test_", suffix=".log", delete=False) as log:
+            log_path = log.name
+        server = Server(args.port, env, args.latency_ms, log_path)
+        try:
+            server.wait_ready()
+            sampler = ResourceSampler(server.process.pid, args.sample_seconds)
+            sampler.start()
+            for concurrency in (int(value) for value in args.concurrency.split(",")):
+                step = run_step(args, images, concurrency, counter, sampler, server, config)
+                steps.append(step)
+                print(f"{config:<14}{concurrency:>5}{step['throughput_rps']:>8}{step['p50_ms']!s:>9}{step['p95_ms']!s:>9}"
+                      f"{step['p99_ms']!s:>9}{step['error_rate']:>8.1%}{step['cpu_percent']!s:>8}"
+                      f"{step['peak_rss_mb']!s:>8}{step['peak_threads']!s:>8}")
+                if step["error_rate"] > args.max_error_rate:
+                    problems.append(f"{config} at concurrency {concurrency}: error rate {step['error_rate']:.1%}")
+                if "BLOCKING_THREADS" in env and step["blocking_threads"] != int(env["BLOCKING_THREADS"]):
+                    problems.append(f"{config}: blocking executor has {step['blocking_threads']} threads, "
+                                    f"BLOCKING_THREADS={env['BLOCKING_THREADS']}")
+                if (step["blocking_threads_started"] or 0) > (step["blocking_threads"] or 0):
+                    problems.append(f"{config}: {step['blocking_threads_started']} blocking threads started, "
+                                    f"over the executor's {step['blocking_threads']}")
+            sampler.stop()
+            timeline += sampler.samples
+        except RuntimeError as e:
+            problems.append(f"{config}: {e}")
+        finally:
+            server.stop()
+            os.unlink(log_path)
+        config_steps = [step for step in steps if step["config"] == config]
+        if config_steps:
+            best = max(config_steps, key=lambda step: step["throughput_rps"])
+            print(f"{config}: peak {best['throughput_rps']} req/s at concurrency {best['concurrency']} "
+                  f"(p95 {best['p95_ms']} ms), blocking executor {config_steps[-1]['blocking_threads']!s} threads "
+                  f"({config_steps[-1]['blocking_threads_started']!s} started)")
+
+    for problem in problems:
+        print(f"FAIL {problem}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "steps": steps, "timeline": timeline,
+                       "problems": problems}, f, indent=2)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
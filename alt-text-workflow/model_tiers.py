@@ -0,0 +1,49 @@
+import json
+import os
+from functools import lru_cache
+from typing import Optional
+
+# Converse inferenceConfig fields a tier may set.
+INFERENCE_FIELDS = ("maxTokens", "temperature", "topP", "stopSequences")
+
+
+def default_tiers() -> dict:
+    """Simple and Moderate images go to the lightweight model, Complex ones to the default model.
+    Token budgets follow the alt-text length limits of each level (125 / 200 / 300 characters)."""
+    light = os.getenv("LIGHT_WEIGHT_MODEL", "")
+    heavy = os.getenv("DEFAULT_MODEL", "")
+    return {
+        "Simple": {"model": light or heavy, "maxTokens": 100, "temperature": 0.3},
+        "Moderate": {"model": light or heavy, "maxTokens": 160, "temperature": 0.5},
+        "Complex": {"model": heavy, "maxTokens": 256, "temperature": 0.5},
+    }
+
+
+@lru_cache(maxsize=1)
+def load_tiers() -> dict:
+    """Routing table keyed on complexity level: the defaults, overridden per tier by
+    MODEL_TIERS (a JSON object, or the path of a JSON file)"""
+    tiers = default_tiers()
+    raw = os.getenv("MODEL_TIERS")
+    if raw:
+        if not raw.lstrip().startswith("{"):
+            with open(raw) as f:
+                raw = f.read()
+        for name, override in json.loads(raw).items():
+            unknown = set(override) - {"model", *INFERENCE_FIELDS}
+            if unknown:
+                raise ValueError(f"Unknown MODEL_TIERS settings for {name}: {', '.join(sorted(unknown))}")
+            tiers[name] = {**tiers.get(name, {}), **override}
+    return tiers
+
+
+def get_tier(complexity_level: Optional[str]) -> dict:
+    """Tier name, model id and inferenceConfig overrides for a complexity level (Moderate when unknown)"""
+    tiers = load_tiers()
+    name = complexity_level if complexity_level in tiers else "Moderate"
+    tier = tiers[name]
+    return {
+        "name": name,
+        "model": tier.get("model") or os.getenv("DEFAULT_MODEL", ""),
+        "inference_config": {field: tier[field] for field in INFERENCE_FIELDS if field in tier},
+    }
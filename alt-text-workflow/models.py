@@ -1,14 +1,454 @@
-import boto3
+import asyncio
+import contextvars
+import functools
+import inspect
+import itertools
 import os
 import json
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
-def call_claude(model_id: str, conversation: list[dict]) -> str:
-    client = boto3.client("bedrock-runtime", region_name=os.getenv("REGION_NAME"))
+from instrumentation import USAGE_FIELDS, record_model_call
+from rate_limiter import estimate_tokens, get_rate_limiter, rate_limiting_enabled
+from regions import get_router
+from singletons import Lazy
 
-    response = client.converse(
-        modelId=model_id,
-        messages=conversation,
-        inferenceConfig={"maxTokens": 512, "temperature": 0.5, "topP": 0.8},
+# One long-lived client per (region, model). boto3 clients are thread-safe once
+# built, so every node and worker in the process shares them (and their pooled
+# TLS connections) instead of paying client setup on each call.
+_clients = {}
+_clients_lock = threading.Lock()
+_client_factory = None
+# aiobotocore clients are bound to the event loop that created them.
+_async_clients = weakref.WeakKeyDictionary()
+
+INFERENCE_CONFIG = {"maxTokens": 512, "temperature": 0.5, "topP": 0.8}
+
+# Shortest prefix, in tokens, that Bedrock caches at a cachePoint, for the models that support
+# prompt caching. Matched on part of the model id (first match wins), so inference profiles match too.
+PROMPT_CACHE_MIN_TOKENS = {
+    "anthropic.claude-opus-4-5": 4096,
+    "anthropic.claude-haiku-4-5": 4096,
+    "anthropic.claude-3-5-haiku": 2048,
+    "anthropic.claude-opus-4": 1024,
+    "anthropic.claude-sonnet-4": 1024,
+    "anthropic.claude-3-7-sonnet": 1024,
+    "amazon.nova": 1000,
+}
+
+# Token usage per model, as reported by Bedrock in each response.
+_usage = {}
+_usage_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return value.strip().lower() in ("1", "true", "yes", "on") if value else default
+
+
+def _client_config_kwargs() -> dict:
+    return dict(
+        max_pool_connections=_env_int("BEDROCK_MAX_POOL_CONNECTIONS", 50),
+        tcp_keepalive=_env_bool("BEDROCK_TCP_KEEPALIVE", True),
+        connect_timeout=_env_float("BEDROCK_CONNECT_TIMEOUT", 5.0),
+        read_timeout=_env_float("BEDROCK_READ_TIMEOUT", 60.0),
+        retries={
+            "mode": os.getenv("BEDROCK_RETRY_MODE") or "standard",
+            # Attempts including the first; botocore's own max_attempts counts retries only.
+            # With the rate limiter on it retries throttles and transient errors itself;
+            # botocore retrying them too would multiply the attempts per call (3 x 5 with the defaults).
+            "total_max_attempts": _env_int("BEDROCK_MAX_ATTEMPTS", 1 if rate_limiting_enabled() else 3),
+        },
     )
 
+
+def client_config():
+    """botocore config for the bedrock-runtime clients, tunable through env vars"""
+    from botocore.config import Config
+
+    return Config(**_client_config_kwargs())
+
+
+def bedrock_client_factory(region_name: str, model_id: str):
+    import boto3
+
+    # A private session per client: the default boto3 session is not thread-safe.
+    return boto3.session.Session().client("bedrock-runtime", region_name=region_name, config=client_config())
+
+
+def fake_client_factory(region_name: str, model_id: str):
+    from fake_bedrock import FakeBedrockClient
+    return FakeBedrockClient.from_env(region_name)
+
+
+def blocking_executor() -> ThreadPoolExecutor:
+    """Threads that async code blocks on: model calls without a native async path (no aiobotocore,
+    a blocking client, a bridged stream), image preparation and the session store. Sized by
+    BLOCKING_THREADS (default BEDROCK_MAX_POOL_CONNECTIONS) rather than the loop's default executor
+    of min(32, cpus + 4), which the server cannot resize: handlers run on the app's own loop."""
+    return _blocking_executor.get()
+
+
+_blocking_executor = Lazy(lambda: ThreadPoolExecutor(
+    _env_int("BLOCKING_THREADS", _env_int("BEDROCK_MAX_POOL_CONNECTIONS", 50)), thread_name_prefix="blocking-call"))
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Await func(*args, **kwargs) on the blocking executor, in a copy of the caller's context"""
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(blocking_executor(), call)
+
+
+def render_prometheus() -> str:
+    """Size of the blocking executor and the threads it has started, in the Prometheus text format"""
+    executor = blocking_executor()
+    return ("# TYPE alt_text_blocking_threads gauge\n"
+            f"alt_text_blocking_threads {executor._max_workers}\n"
+            "# TYPE alt_text_blocking_threads_started gauge\n"
+            f"alt_text_blocking_threads_started {len(executor._threads)}\n")
+
+
+def set_client_factory(factory) -> None:
+    """Swap the backend used to build model clients, e.g. a local fake for offline runs.
+
+    `factory(region_name, model_id)` must return an object with a bedrock-runtime
+    style `converse` method. Passing None restores the MODEL_BACKEND default.
+    """
+    global _client_factory
+    with _clients_lock:
+        _client_factory = factory
+        _clients.clear()
+        _async_clients.clear()
+
+
+def reset_clients() -> None:
+    with _clients_lock:
+        _clients.clear()
+        _async_clients.clear()
+
+
+def _resolve_factory():
+    if _client_factory is not None:
+        return _client_factory
+    if os.getenv("MODEL_BACKEND", "bedrock").lower() == "fake":
+        return fake_client_factory
+    return bedrock_client_factory
+
+
+def get_client(model_id: str, region_name: str = None):
+    """Return the shared client for (region, model), creating it on first use"""
+    key = (region_name or os.getenv("REGION_NAME"), model_id)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _resolve_factory()(key[0], model_id)
+                _clients[key] = client
+    return client
+
+
+async def _get_aiobotocore_client(model_id: str, region_name: str = None):
+    """Non-blocking bedrock-runtime client for the running loop, or None without aiobotocore"""
+    try:
+        from aiobotocore.config import AioConfig
+        from aiobotocore.session import get_session
+    except ImportError:
+        return None
+
+    key = (region_name or os.getenv("REGION_NAME"), model_id)
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(key)
+    if client is None:
+        context = get_session().create_client("bedrock-runtime", region_name=key[0],
+                                              config=AioConfig(**_client_config_kwargs()))
+        created = await context.__aenter__()
+        client = clients.setdefault(key, created)
+        if client is not created:
+            await created.close()
+    return client
+
+
+def prompt_cache_min_tokens(model_id: str) -> Optional[int]:
+    """Shortest prefix Bedrock caches for the model; None when it is not known to support prompt caching"""
+    for name, tokens in PROMPT_CACHE_MIN_TOKENS.items():
+        if name in (model_id or ""):
+            return tokens
+    return None
+
+
+def prompt_cacheable(model_id: str, system: str) -> bool:
+    """Whether a cachePoint after `system` can pay off: PROMPT_CACHE is not off, the model supports
+    prompt caching (any model with PROMPT_CACHE=on) and the prefix reaches its minimum length,
+    estimated at ~4 characters per token. A shorter prefix is never cached, only re-sent."""
+    mode = (os.getenv("PROMPT_CACHE") or "auto").strip().lower()
+    if mode in ("0", "off", "false", "no"):
+        return False
+    minimum = prompt_cache_min_tokens(model_id)
+    if minimum is None:
+        if mode not in ("1", "on", "true", "yes"):
+            return False
+        minimum = _env_int("PROMPT_CACHE_MIN_TOKENS", 1024)
+    return len(system) // 4 >= minimum
+
+
+def system_blocks(system: str, model_id: str = None) -> list[dict]:
+    """Static instructions as a system block, followed by a cache checkpoint when the model can
+    serve them as a cached prefix instead of re-processing them on every call"""
+    blocks = [{"text": system}]
+    if prompt_cacheable(model_id, system):
+        blocks.append({"cachePoint": {"type": "default"}})
+    return blocks
+
+
+def _request(model_id: str, conversation: list[dict], system: str = None, inference_config: dict = None) -> dict:
+    request = dict(messages=conversation, inferenceConfig={**INFERENCE_CONFIG, **(inference_config or {})})
+    if system:
+        request["system"] = system_blocks(system, model_id)
+    return request
+
+
+def record_usage(model_id: str, usage: dict) -> None:
+    with _usage_lock:
+        totals = _usage.setdefault(model_id, dict.fromkeys(("calls",) + USAGE_FIELDS, 0))
+        totals["calls"] += 1
+        for field in USAGE_FIELDS:
+            totals[field] += usage.get(field) or 0
+
+
+def usage_stats() -> dict:
+    """Token usage per model id, including prompt-cache reads and writes"""
+    with _usage_lock:
+        return {model_id: dict(totals) for model_id, totals in _usage.items()}
+
+
+def reset_usage_stats() -> None:
+    with _usage_lock:
+        _usage.clear()
+
+
+def _finish_call(model_id: str, started: float, response: dict, permit=None) -> None:
+    if permit is not None:
+        permit.release(response.get("usage", {}))
+    record_usage(model_id, response.get("usage", {}))
+    record_model_call(model_id, started, response.get("usage", {}), response.get("metrics"))
+
+
+def _stream_text(model_id: str, started: float, event: dict, permit=None):
+    """Text delta of a converse_stream event; the closing metadata event carries the usage"""
+    if "metadata" in event:
+        _finish_call(model_id, started, event["metadata"], permit)
+    return event.get("contentBlockDelta", {}).get("delta", {}).get("text")
+
+
+def _limiter_key(model_id: str, region_name: str = None) -> str:
+    """Quotas are per region: requests sent outside REGION_NAME get a limiter of their own"""
+    if region_name is None or region_name == os.getenv("REGION_NAME"):
+        return model_id
+    return f"{region_name}/{model_id}"
+
+
+def _limited(model_id: str, request: dict, call, region_name: str = None):
+    """Send a request through the model's shared rate limiter: (response, permit or None)"""
+    limiter = get_rate_limiter(_limiter_key(model_id, region_name))
+    if limiter is None:
+        return call(), None
+    return limiter.open(call, estimate_tokens(request))
+
+
+async def _alimited(model_id: str, request: dict, call, region_name: str = None):
+    """Async _limited: `call()` returns an awaitable"""
+    limiter = get_rate_limiter(_limiter_key(model_id, region_name))
+    if limiter is None:
+        return await call(), None
+    return await limiter.aopen(call, estimate_tokens(request))
+
+
+def _routed(model_id: str, operation: str, send, discard=None):
+    """send(region_name, model_id) to REGION_NAME, or hedged and failed over across
+    regions when BEDROCK_REGIONS is configured (see regions.py)"""
+    router = get_router()
+    if router is None:
+        return send(None, model_id)
+    return router.call(model_id, operation, send, discard)
+
+
+async def _arouted(model_id: str, operation: str, send, discard=None):
+    router = get_router()
+    if router is None:
+        return await send(None, model_id)
+    return await router.acall(model_id, operation, send, discard)
+
+
+def _discard_stream(opened: tuple) -> None:
+    """Close a stream opened by a hedged attempt that lost, and free its rate-limiter slot"""
+    response, permit = opened[0], opened[1]
+    if permit is not None:
+        permit.release(cancelled=True)
+    stream = response.get("stream")
+    close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+    closing = close() if close is not None else None
+    if inspect.isawaitable(closing):
+        asyncio.ensure_future(closing)
+
+
+async def _aconverse(model_id: str, region_name: str = None, **kwargs) -> dict:
+    if _resolve_factory() is bedrock_client_factory:
+        async_client = await _get_aiobotocore_client(model_id, region_name)
+        if async_client is not None:
+            return await async_client.converse(modelId=model_id, **kwargs)
+    client = get_client(model_id, region_name)
+    if hasattr(client, "aconverse"):
+        return await client.aconverse(modelId=model_id, **kwargs)
+    # No native async backend available: keep the event loop free by blocking a worker thread instead.
+    return await run_blocking(client.converse, modelId=model_id, **kwargs)
+
+
+def call_claude(model_id: str, conversation: list[dict], system: str = None, inference_config: dict = None) -> str:
+    """Converse with the model: `system` holds the static instructions, `conversation` the per-request content,
+    `inference_config` overrides INFERENCE_CONFIG"""
+    request = _request(model_id, conversation, system, inference_config)
+
+    def send(region_name: str, target_model: str) -> dict:
+        client = get_client(target_model, region_name)
+        started = time.perf_counter()
+        response, permit = _limited(target_model, request, lambda: client.converse(modelId=target_model, **request),
+                                    region_name)
+        _finish_call(target_model, started, response, permit)
+        return response
+
+    response = _routed(model_id, "converse", send)
     return response["output"]["message"]["content"][0]["text"]
+
+
+async def acall_claude(model_id: str, conversation: list[dict], system: str = None, inference_config: dict = None) -> str:
+    """Async call_claude: awaits the model without holding a thread per request"""
+    request = _request(model_id, conversation, system, inference_config)
+
+    async def send(region_name: str, target_model: str) -> dict:
+        started = time.perf_counter()
+        response, permit = await _alimited(target_model, request, lambda: _aconverse(target_model, region_name, **request),
+                                           region_name)
+        _finish_call(target_model, started, response, permit)
+        return response
+
+    response = await _arouted(model_id, "converse", send)
+    return response["output"]["message"]["content"][0]["text"]
+
+
+def stream_claude(model_id: str, conversation: list[dict], system: str = None, inference_config: dict = None):
+    """Yield the response text incrementally as converse_stream produces it"""
+    request = _request(model_id, conversation, system, inference_config)
+
+    def send(region_name: str, target_model: str) -> tuple:
+        client = get_client(target_model, region_name)
+        started = time.perf_counter()
+        response, permit = _limited(target_model, request,
+                                    lambda: client.converse_stream(modelId=target_model, **request), region_name)
+        events = iter(response["stream"])
+        try:
+            # Waiting for the first event makes the hedge act on time to first token.
+            first = next(events, None)
+        except BaseException as e:
+            if permit is not None:
+                permit.release(cancelled=not isinstance(e, Exception))
+            raise
+        return response, permit, started, target_model, events, first
+
+    response, permit, started, target_model, events, first = _routed(model_id, "converse_stream", send,
+                                                                     _discard_stream)
+    try:
+        for event in itertools.chain([first] if first is not None else [], events):
+            text = _stream_text(target_model, started, event, permit)
+            if text:
+                yield text
+    finally:
+        # Frees the slot when the stream ends without a metadata event (error or early close).
+        if permit is not None:
+            permit.release()
+
+
+async def _athread_stream(model_id: str, conversation: list[dict], system: str = None, inference_config: dict = None):
+    """Bridge the blocking stream_claude onto the event loop through a worker thread"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+
+    def produce():
+        try:
+            for text in stream_claude(model_id, conversation, system, inference_config):
+                loop.call_soon_threadsafe(queue.put_nowait, text)
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    # Run in a copy of this context so the model-call span lands in the calling node.
+    producer = loop.run_in_executor(blocking_executor(), contextvars.copy_context().run, produce)
+    while True:
+        item = await queue.get()
+        if item is done:
+            break
+        if isinstance(item, Exception):
+            raise item
+        yield item
+    await producer
+
+
+async def astream_claude(model_id: str, conversation: list[dict], system: str = None, inference_config: dict = None):
+    """Async stream_claude: yield response text deltas without blocking the event loop"""
+    request = _request(model_id, conversation, system, inference_config)
+    async_client = None
+    if _resolve_factory() is bedrock_client_factory:
+        async_client = await _get_aiobotocore_client(model_id)
+    client = async_client or get_client(model_id)
+    if async_client is None and not hasattr(client, "aconverse_stream"):
+        async for text in _athread_stream(model_id, conversation, system, inference_config):
+            yield text
+        return
+
+    async def send(region_name: str, target_model: str) -> tuple:
+        target_client = client
+        if async_client is not None:
+            target_client = await _get_aiobotocore_client(target_model, region_name)
+        elif (region_name, target_model) != (None, model_id):
+            target_client = get_client(target_model, region_name)
+        open_stream = target_client.converse_stream if async_client is not None else target_client.aconverse_stream
+        started = time.perf_counter()
+        response, permit = await _alimited(target_model, request, lambda: open_stream(modelId=target_model, **request),
+                                           region_name)
+        events = aiter(response["stream"])
+        try:
+            first = await anext(events, None)
+        except BaseException as e:
+            if permit is not None:
+                permit.release(cancelled=not isinstance(e, Exception))
+            raise
+        return response, permit, started, target_model, events, first
+
+    response, permit, started, target_model, events, first = await _arouted(model_id, "converse_stream", send,
+                                                                            _discard_stream)
+    try:
+        if first is not None:
+            text = _stream_text(target_model, started, first, permit)
+            if text:
+                yield text
+        async for event in events:
+            text = _stream_text(target_model, started, event, permit)
+            if text:
+                yield text
+    finally:
+        if permit is not None:
+            permit.release()
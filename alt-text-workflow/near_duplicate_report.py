@@ -0,0 +1,160 @@
+"""Check the perceptual-hash near-duplicate index: hash robustness and lookup speed at scale.
+
+    python3 near_duplicate_report.py --entries 1000000 --lookups 2000
+
+Robustness: every sample image (images/ plus synthetic ones) is resized,
+recompressed and converted PNG <-> JPEG; the report shows the Hamming distance
+between each image's dHash (and fine hash) and its variants, and the smallest
+distance between different images, to help pick NEAR_DUPLICATE_MAX_DISTANCE and
+NEAR_DUPLICATE_MAX_FINE_DISTANCE. Low-information images, which the index
+leaves out, are counted but not compared.
+
+Scale: --entries random hashes are loaded into an index, then queried with
+hashes a few bits away from stored ones (hits) and with random hashes (misses).
+Reports load time, lookup p50/p99 and checks a sample of answers against a
+brute-force scan. Exits non-zero when a lookup disagrees with the scan.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from near_duplicates import NearDuplicateIndex, fine_distance, fingerprint, hamming, informative
+from sample_images import DEFAULT_IMAGE_DIR, iter_image_files, synthetic_image
+
+
+def encode(image: Image.Image, image_format: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def variants(image_bytes: bytes) -> dict:
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    return {
+        "half size": encode(image.resize((width // 2, height // 2)), "PNG"),
+        "double size": encode(image.resize((width * 2, height * 2)), "PNG"),
+        "jpeg q40": encode(image, "JPEG", quality=40),
+        "jpeg q90": encode(image, "JPEG", quality=90),
+        "png": encode(image, "PNG"),
+    }
+
+
+def robustness(image_paths: list[str], synthetic: int) -> dict:
+    images = {}
+    for path in iter_image_files(image_paths):
+        with open(path, "rb") as f:
+            images[os.path.basename(path)] = f.read()
+    for seed in range(synthetic):
+        images[f"synthetic-{seed}"] = synthetic_image(("Simple", "Moderate", "Complex")[seed % 3], seed=seed)
+
+    hashes = {name: fingerprint(image_bytes) for name, image_bytes in images.items()}
+    low_information = [name for name, value in hashes.items() if not informative(value)]
+    variant_distances, fine_distances = {}, {}
+    for name, image_bytes in images.items():
+        if name in low_information:
+            continue
+        for variant, variant_bytes in variants(image_bytes).items():
+            variant_hashes = fingerprint(variant_bytes)
+            variant_distances.setdefault(variant, []).append(hamming(hashes[name]["dhash"], variant_hashes["dhash"]))
+            fine_distances.setdefault(variant, []).append(fine_distance(hashes[name]["fine_hash"],
+                                                                        variant_hashes["fine_hash"]))
+    pairs = list(itertools.combinations([value for name, value in hashes.items() if name not in low_information], 2))
+    return {"images": len(images), "low_information": low_information,
+            "variant_max_distance": {name: max(values) for name, values in variant_distances.items()},
+            "variant_max_fine_distance": {name: max(values) for name, values in fine_distances.items()},
+            "different_min_distance": min((hamming(a["dhash"], b["dhash"]) for a, b in pairs), default=None),
+            "different_min_fine_distance": min((fine_distance(a["fine_hash"], b["fine_hash"]) for a, b in pairs),
+                                               default=None)}
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 4)
+
+
+def scale(entries: int, lookups: int, max_distance: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    hashes = rng.integers(-2 ** 63, 2 ** 63 - 1, entries, dtype=np.int64, endpoint=True).view(np.uint64)
+    stored = [int(value) for value in hashes]
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "near_duplicates.sqlite3")
+        started = time.perf_counter()
+        NearDuplicateIndex(path, max_distance).add_many((value, f"alt-text {i}", "Simple", None)
+                                                        for i, value in enumerate(stored))
+        load_s = time.perf_counter() - started
+        started = time.perf_counter()
+        index = NearDuplicateIndex(path, max_distance)
+        reopen_s = time.perf_counter() - started
+
+        randomness = random.Random(seed)
+        timings = {"hit": [], "miss": []}
+        for number in range(lookups):
+            kind = "hit" if number % 2 == 0 else "miss"
+            if kind == "hit":
+                query = randomness.choice(stored)
+                for bit in randomness.sample(range(64), randomness.randint(0, max_distance)):
+                    query ^= 1 << bit
+            else:
+                query = randomness.getrandbits(64)
+            started = time.perf_counter()
+            match = index.lookup(query)
+            timings[kind].append(time.perf_counter() - started)
+            if number < 200:
+                nearest = int(np.bitwise_count(hashes ^ np.uint64(query)).min())
+                found = match["distance"] if match else None
+                if found != (nearest if nearest <= max_distance else None):
+                    problems.append(f"lookup {query:016x}: index found {found}, scan found {nearest}")
+
+    result = {"entries": entries, "load_s": round(load_s, 2), "reopen_s": round(reopen_s, 2), "problems": problems}
+    for kind, values in timings.items():
+        values.sort()
+        result[f"{kind}_ms"] = {"p50": percentile(values, 0.5), "p99": percentile(values, 0.99)}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--max-distance", type=int, default=6)
+    parser.add_argument("--images", nargs="*", default=[DEFAULT_IMAGE_DIR], help="image files or directories")
+    parser.add_argument("--synthetic", type=int, default=12, help="synthetic images added to the robustness check")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON to this path")
+    args = parser.parse_args()
+
+    report = {"robustness": robustness(args.images, args.synthetic),
+              "scale": scale(args.entries, args.lookups, args.max_distance, args.seed)}
+
+    check = report["robustness"]
+    print(f"Robustness over {check['images']} images, {len(check['low_information'])} low-information "
+          f"(max distance to each variant, dHash / fine hash):")
+    for name, distance in check["variant_max_distance"].items():
+        print(f"   {name:<12}{distance:>3}{check['variant_max_fine_distance'][name]:>5}")
+    print(f"   closest pair of different images: {check['different_min_distance']} / "
+          f"{check['different_min_fine_distance']}")
+    result = report["scale"]
+    print(f"Index of {result['entries']:,} entries: loaded in {result['load_s']}s, reopened in {result['reopen_s']}s")
+    print(f"   hit lookups  p50 {result['hit_ms']['p50']} ms  p99 {result['hit_ms']['p99']} ms")
+    print(f"   miss lookups p50 {result['miss_ms']['p50']} ms  p99 {result['miss_ms']['p99']} ms")
+    for problem in result["problems"]:
+        print(f"FAIL {problem}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if result["problems"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import io
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from singletons import Lazy
+
+HASH_BITS = 64
+# Multi-index hashing: the 64-bit hash is split into CHUNKS substrings of CHUNK_BITS.
+# Two hashes within distance r agree to within r // CHUNKS bits on at least one chunk
+# (pigeonhole), so probing each chunk's table with those few neighbours finds every match.
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# New hashes are scanned linearly until this many have accumulated, then merged into the sorted arrays.
+PENDING_LIMIT = 1024
+# Grey levels between neighbouring thumbnail pixels that count as an edge. Flat and low-detail
+# images (solid colours, a few lines of text) have few edges, and their dHash is mostly noise or 0.
+EDGE_THRESHOLD = 4
+# Second, finer hash checked before an alt-text is reused: a 17x16 dHash, 256 bits.
+FINE_SIZE = (17, 16)
+
+
+def near_duplicate_mode() -> str:
+    """off, reuse (serve a near-duplicate's alt-text without a model call) or seed
+    (skip the complexity call and hand its alt-text to generation as a starting point)"""
+    mode = os.getenv("NEAR_DUPLICATES", "off").lower()
+    return mode if mode in ("reuse", "seed") else "off"
+
+
+def _gradients(image: Image.Image, size: tuple[int, int]) -> np.ndarray:
+    pixels = np.asarray(image.resize(size, Image.LANCZOS), dtype=np.int16)
+    return pixels[:, 1:] - pixels[:, :-1]
+
+
+def fingerprint(image_bytes: bytes) -> dict:
+    """dhash (64-bit difference hash: the signs of horizontal brightness gradients on a 9x8
+    grayscale thumbnail, stable under resizing, recompression and format conversion), the
+    finer 256-bit fine_hash of a 17x16 thumbnail, and the number of edges on the 9x8 one"""
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft("L", (64, 64))
+    image = image.convert("L")
+    gradients = _gradients(image, (9, 8))
+    return {"dhash": int.from_bytes(np.packbits(gradients.ravel() > 0).tobytes(), "big"),
+            "fine_hash": np.packbits(_gradients(image, FINE_SIZE).ravel() > 0).tobytes(),
+            "edges": int((np.abs(gradients) > EDGE_THRESHOLD).sum())}
+
+
+def dhash(image_bytes: bytes) -> int:
+    """64-bit difference hash of the image (see fingerprint)"""
+    return fingerprint(image_bytes)["dhash"]
+
+
+def informative(fingerprint: dict) -> bool:
+    """Enough edges (NEAR_DUPLICATE_MIN_EDGES of 64) for the hash to tell images apart: a solid
+    colour hashes to 0 whatever its colour, and two text slides differ in only a few bits"""
+    return fingerprint["edges"] >= int(os.getenv("NEAR_DUPLICATE_MIN_EDGES") or 12)
+
+
+def fine_distance(a: bytes, b: bytes) -> int:
+    return int(np.bitwise_count(np.frombuffer(a, np.uint8) ^ np.frombuffer(b, np.uint8)).sum())
+
+
+def _same_description(a: Optional[str], b: Optional[str]) -> bool:
+    return " ".join(a.casefold().split()) == " ".join(b.casefold().split())
+
+
+def reusable(match: dict, fingerprint: dict, description: Optional[str] = None) -> bool:
+    """Whether a match is close enough to serve its alt-text unchanged: its fine hash is within
+    NEAR_DUPLICATE_MAX_FINE_DISTANCE bits (of 256), and when both images came with a
+    description, the descriptions are the same"""
+    if match.get("fine_hash") is None:
+        return False
+    if fine_distance(match["fine_hash"], fingerprint["fine_hash"]) > int(os.getenv("NEAR_DUPLICATE_MAX_FINE_DISTANCE") or 10):
+        return False
+    return not (description and match.get("description")) or _same_description(description, match["description"])
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _to_signed(value: int) -> int:
+    """SQLite integers are signed 64-bit"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def _neighbours(value: int, radius: int) -> list[int]:
+    """Every chunk value within `radius` bits of `value`"""
+    values = [value]
+    for distance in range(1, radius + 1):
+        for bits in itertools.combinations(range(CHUNK_BITS), distance):
+            flipped = value
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+
+class NearDuplicateIndex:
+    """Perceptual hashes of approved alt-texts, searchable by Hamming distance.
+
+    Entries persist in SQLite (keyed on the hash, so re-approving a duplicate
+    replaces its record). Lookups run on an in-memory multi-index: per chunk, the
+    hashes sorted by that chunk with offsets per chunk value, so a lookup is a few
+    dozen array slices plus a vectorised popcount over the candidates. New entries
+    go to a small pending list that is merged into the sorted arrays once it grows;
+    the merge sorts outside the lock, while lookups keep using the old arrays.
+    """
+
+    def __init__(self, sqlite_path: str = ":memory:", max_distance: int = 6):
+        self.sqlite_path = sqlite_path
+        self.max_distance = max_distance
+        self._db = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS near_duplicates (hash INTEGER PRIMARY KEY, alt_text TEXT NOT NULL, "
+                         "complexity_level TEXT, complexity_reasoning TEXT, created_at REAL NOT NULL, "
+                         "fine_hash BLOB, description TEXT)")
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(near_duplicates)")}
+        for column, kind in (("fine_hash", "BLOB"), ("description", "TEXT")):
+            if column not in columns:
+                # Entries of an index created before the column cannot be reused, only seeded.
+                self._db.execute(f"ALTER TABLE near_duplicates ADD COLUMN {column} {kind}")
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "adds": 0, "rebuilds": 0}
+        hashes = [row[0] for row in self._db.execute("SELECT hash FROM near_duplicates")]
+        self._hashes = np.array(hashes, dtype=np.int64).view(np.uint64)
+        self._order, self._starts = _sorted_chunks(self._hashes)
+        self._pending = []
+        self._merging = False
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            sqlite_path=os.getenv("NEAR_DUPLICATE_SQLITE_PATH") or "near_duplicates.sqlite3",
+            max_distance=int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE") or 6),
+        )
+
+    def _merge(self, hashes: np.ndarray, pending: list[int], bulk: list[int]) -> None:
+        """Merge a snapshot of the pending hashes (and a bulk load) into the sorted arrays without
+        holding the lock; hashes added meanwhile stay pending"""
+        merged = np.unique(np.concatenate((hashes, np.array(pending + bulk, dtype=np.uint64))))
+        order, starts = _sorted_chunks(merged)
+        with self._lock:
+            self._hashes, self._order, self._starts = merged, order, starts
+            del self._pending[:len(pending)]
+            self._merging = False
+            self._stats["rebuilds"] += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._hashes) + len(self._pending)
+
+    def _nearest(self, value: int, max_distance: int) -> Optional[tuple[int, int]]:
+        """(hash, distance) of the closest entry within max_distance, under the lock"""
+        best = None
+        radius = max_distance // CHUNKS
+        slices = []
+        for chunk in range(CHUNKS):
+            order, starts = self._order[chunk], self._starts[chunk]
+            for neighbour in _neighbours((value >> (chunk * CHUNK_BITS)) & CHUNK_MASK, radius):
+                start, end = starts[neighbour], starts[neighbour + 1]
+                if end > start:
+                    slices.append(order[start:end])
+        if slices:
+            candidates = self._hashes[np.concatenate(slices)]
+            distances = np.bitwise_count(candidates ^ np.uint64(value))
+            position = int(np.argmin(distances))
+            if distances[position] <= max_distance:
+                best = (int(candidates[position]), int(distances[position]))
+        for pending in self._pending:
+            distance = hamming(pending, value)
+            if distance <= max_distance and (best is None or distance < best[1]):
+                best = (pending, distance)
+        return best
+
+    def lookup(self, value: int, max_distance: int = None) -> Optional[dict]:
+        """Record of the nearest entry within max_distance (default self.max_distance), with its distance"""
+        max_distance = self.max_distance if max_distance is None else max_distance
+        with self._lock:
+            self._stats["lookups"] += 1
+            nearest = self._nearest(value, max_distance)
+            if nearest is None:
+                return None
+            self._stats["hits"] += 1
+            row = self._db.execute("SELECT alt_text, complexity_level, complexity_reasoning, fine_hash, description "
+                                   "FROM near_duplicates WHERE hash = ?", (_to_signed(nearest[0]),)).fetchone()
+        if row is None:
+            return None
+        return {"alt_text": row[0], "complexity_level": row[1], "complexity_reasoning": row[2], "fine_hash": row[3],
+                "description": row[4], "hash": f"{nearest[0]:016x}", "distance": nearest[1]}
+
+    def add(self, value: int, alt_text: str, complexity_level: str = None, complexity_reasoning: str = None,
+            fine_hash: bytes = None, description: str = None) -> None:
+        self.add_many([(value, alt_text, complexity_level, complexity_reasoning, fine_hash, description)])
+
+    def add_many(self, entries) -> None:
+        """Insert (hash, alt_text, complexity_level, complexity_reasoning[, fine_hash, description]) tuples;
+        an existing hash is overwritten"""
+        entries = [(*entry, None, None)[:6] for entry in entries]
+        now = time.time()
+        rows = [(_to_signed(value), alt_text, level, reasoning, now, fine_hash, description)
+                for value, alt_text, level, reasoning, fine_hash, description in entries]
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT OR REPLACE INTO near_duplicates "
+                                 "(hash, alt_text, complexity_level, complexity_reasoning, created_at, fine_hash, "
+                                 "description) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._stats["adds"] += len(rows)
+            values = [value for value, *_ in entries]
+            # A bulk load goes straight into the merge, never through the linear pending scan.
+            bulk = values if len(values) > PENDING_LIMIT and not self._merging else []
+            if not bulk:
+                for value in values:
+                    if self._nearest(value, 0) is None:
+                        self._pending.append(value)
+            merge = bool(bulk or len(self._pending) > PENDING_LIMIT) and not self._merging
+            if merge:
+                self._merging = True
+                snapshot = (self._hashes, list(self._pending), bulk)
+        if merge:
+            try:
+                self._merge(*snapshot)
+            except BaseException:
+                with self._lock:
+                    self._merging = False
+                raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._hashes) + len(self._pending), "max_distance": self.max_distance}
+
+
+def _sorted_chunks(hashes: np.ndarray) -> tuple[list, list]:
+    """Per chunk: the hash positions sorted by that chunk, and where each chunk value starts"""
+    orders, starts = [], []
+    for chunk in range(CHUNKS):
+        values = ((hashes >> np.uint64(chunk * CHUNK_BITS)) & np.uint64(CHUNK_MASK)).astype(np.int64)
+        orders.append(np.argsort(values, kind="stable").astype(np.int64))
+        starts.append(np.concatenate(([0], np.cumsum(np.bincount(values, minlength=1 << CHUNK_BITS)))))
+    return orders, starts
+
+
+_index = Lazy(lambda: NearDuplicateIndex.from_env() if near_duplicate_mode() != "off" else None)
+
+
+def get_near_duplicate_index() -> Optional[NearDuplicateIndex]:
+    """Process-wide index built from env on first use; None when NEAR_DUPLICATES=off"""
+    return _index.get()
+
+
+def set_near_duplicate_index(index: Optional[NearDuplicateIndex]) -> None:
+    _index.set(index)
@@ -0,0 +1,101 @@
+"""Check the prompt-cache layout of the model requests and report cache token usage.
+
+    MODEL_BACKEND=fake python3 prompt_cache_report.py --requests 20
+
+Runs generation and revision requests through the workflow (result cache off, so
+every request reaches the model) and prints the input, cache-read and
+cache-write tokens per model. With the fake backend it also checks every
+recorded request: static instructions in a system block, identical across
+requests, with the per-request description only in the messages, and a
+cachePoint after them exactly when models.prompt_cacheable says the model can
+cache a prefix that long. Bedrock caches nothing shorter than the model's
+minimum (1,024 tokens for most Claude models), and the fake backend enforces
+the same minimum, so prompts below it report no cache tokens.
+"""
+import argparse
+import json
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from alt_text_langgraph import create_alt_text_workflow
+from fake_bedrock import FakeBedrockClient
+from models import get_client, prompt_cacheable, reset_usage_stats, usage_stats
+from result_cache import set_result_cache
+from sample_images import synthetic_image, to_data_uri
+
+LEVELS = ("Simple", "Moderate", "Complex")
+
+
+def check_layout(calls: list[dict], descriptions: list[str]) -> list[str]:
+    problems = []
+    systems = {}
+    for call in calls:
+        system = call.get("system") or []
+        text = "".join(block.get("text", "") for block in system)
+        if not text:
+            problems.append(f"{call['modelId']}: no system prompt")
+            continue
+        cache_point = "cachePoint" in system[-1]
+        if cache_point != prompt_cacheable(call["modelId"], text):
+            problems.append(f"{call['modelId']}: cachePoint {'sent' if cache_point else 'missing'} "
+                            f"after a ~{len(text) // 4}-token system prompt")
+        if any(description in text for description in descriptions):
+            problems.append(f"{call['modelId']}: request content in the system prompt")
+        # Same leading instruction line = same prompt; its text must never vary.
+        systems.setdefault(text.strip().splitlines()[0], set()).add(text)
+    problems += [f"system prompt varies between requests: {first!r}" for first, texts in systems.items() if len(texts) > 1]
+    return problems
+
+
+def run_requests(requests: int) -> list[str]:
+    """Generation requests, every third one revised once; returns the descriptions and feedback sent"""
+    set_result_cache(None)
+    reset_usage_stats()
+    workflow = create_alt_text_workflow()
+    descriptions = []
+    for index in range(requests):
+        descriptions.append(f"Sample request {index}: a scene for alt-text")
+        state = workflow.invoke({"image_data": to_data_uri(synthetic_image(LEVELS[index % 3], seed=index)),
+                                 "user_input": descriptions[-1]})
+        if index % 3 == 0:
+            state["user_input"] = f"Feedback {index}: mention the colours"
+            descriptions.append(state["user_input"])
+            workflow.invoke(state)
+    return descriptions
+
+
+def recorded_calls(model_ids) -> list[dict]:
+    """Requests the fake backend recorded for these models (none against Bedrock)"""
+    clients = {get_client(model_id) for model_id in model_ids}
+    return [call for client in clients if isinstance(client, FakeBedrockClient) for call in client.calls]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=12, help="number of generation requests")
+    parser.add_argument("--output", help="write the usage report as JSON to this path")
+    args = parser.parse_args()
+
+    descriptions = run_requests(args.requests)
+    report = {"usage": usage_stats()}
+    print(f"{'model':<48}{'calls':>6}{'input':>9}{'cache read':>12}{'cache write':>13}")
+    for model_id, totals in report["usage"].items():
+        print(f"{model_id or '(unset)':<48}{totals['calls']:>6}{totals['inputTokens']:>9}"
+              f"{totals['cacheReadInputTokens']:>12}{totals['cacheWriteInputTokens']:>13}")
+
+    calls = recorded_calls(report["usage"])
+    if calls:
+        report["layout_problems"] = check_layout(calls, descriptions)
+        print(f"Checked {len(calls)} requests: {len(report['layout_problems'])} layout problems")
+        for problem in report["layout_problems"]:
+            print(f"   {problem}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Check the adaptive rate limiter against a fake Bedrock backend that throttles.
+
+    python3 rate_limit_report.py --requests 300 --concurrency 100 --throttle-rps 40 --latency-ms 100
+
+Sends --requests model calls, --concurrency at a time, to a fake backend that
+rejects calls beyond --throttle-rps per second with a ThrottlingException. Each
+run uses fresh limiters and a fresh backend; the async run goes through
+`models.acall_claude` on one event loop, the sync run through `models.call_claude`
+on a thread pool, and the mixed run through both at once, sharing one limiter.
+For comparison the same load is also sent with the limiter off.
+
+Reported per run: calls that succeeded and that failed, throttles the backend
+returned, throughput and the limiter's final state.
+
+A last run checks how the limiter's retries combine with botocore's: one call
+through a real bedrock-runtime client (default retry settings, no network) whose
+every HTTP attempt is answered with a ThrottlingException. With the limiter on,
+botocore should make one attempt per limiter attempt, --max-retries + 1 in all.
+
+Exits non-zero when a limited run lost a call, its throughput stayed far below
+the throttle rate, or the throttled call was attempted more than --max-retries + 1 times.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import models
+from fake_bedrock import FakeBedrockClient
+from rate_limiter import AdaptiveRateLimiter, get_rate_limiter, is_throttling, reset_rate_limiters, set_rate_limiter
+
+MODEL_ID = "fake.throttled-model"
+
+
+def conversation(index: int) -> list[dict]:
+    return [{"role": "user", "content": [{"text": f"Image description: request {index}, a heron on a jetty"}]}]
+
+
+def count(outcomes: list) -> dict:
+    return {"ok": outcomes.count("ok"), "throttled_errors": outcomes.count("throttled"),
+            "other_errors": outcomes.count("error")}
+
+
+def outcome(error: Exception = None) -> str:
+    if error is None:
+        return "ok"
+    return "throttled" if is_throttling(error) else "error"
+
+
+async def async_calls(indexes, concurrency: int) -> list:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        async with slots:
+            try:
+                await models.acall_claude(MODEL_ID, conversation(index))
+                return outcome()
+            except Exception as e:
+                return outcome(e)
+
+    return await asyncio.gather(*(one(index) for index in indexes))
+
+
+def sync_calls(indexes, threads: int) -> list:
+    def one(index: int):
+        try:
+            models.call_claude(MODEL_ID, conversation(index))
+            return outcome()
+        except Exception as e:
+            return outcome(e)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(one, indexes))
+
+
+async def mixed_calls(requests: int, concurrency: int) -> list:
+    half = requests // 2
+    sync_run = asyncio.to_thread(sync_calls, range(half), max(1, concurrency // 2))
+    results = await asyncio.gather(sync_run, async_calls(range(half, requests), max(1, concurrency // 2)))
+    return [*results[0], *results[1]]
+
+
+def run(name: str, limited: bool, args) -> dict:
+    fake = FakeBedrockClient(latency_ms=args.latency_ms, throttle_rps=args.throttle_rps)
+    models.set_client_factory(lambda region_name, model_id: fake)
+    reset_rate_limiters()
+    set_rate_limiter(MODEL_ID, AdaptiveRateLimiter(MODEL_ID, max_concurrency=args.concurrency,
+                                                   max_retries=args.max_retries) if limited else None)
+    mode = name.split()[0]
+    started = time.perf_counter()
+    if mode == "async":
+        outcomes = asyncio.run(async_calls(range(args.requests), args.concurrency))
+    elif mode == "sync":
+        outcomes = sync_calls(range(args.requests), args.concurrency)
+    else:
+        outcomes = asyncio.run(mixed_calls(args.requests, args.concurrency))
+    elapsed = time.perf_counter() - started
+    limiter = get_rate_limiter(MODEL_ID)
+    return {"run": name, **count(outcomes), "backend_throttles": fake.throttled, "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(count(outcomes)["ok"] / elapsed, 1),
+            "limiter": limiter.stats() if limiter is not None else None}
+
+
+class ThrottledBody:
+    def stream(self):
+        yield json.dumps({"message": "Too many requests, please wait before trying again."}).encode()
+
+
+def botocore_attempts(args) -> dict:
+    """HTTP attempts botocore and the limiter make together for one call that is always throttled"""
+    from botocore.awsrequest import AWSResponse
+
+    for name in ("BEDROCK_MAX_ATTEMPTS", "BEDROCK_RETRY_MODE"):
+        os.environ.pop(name, None)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    attempts = []
+
+    def throttle(request, **kwargs):
+        attempts.append(request.url)
+        return AWSResponse(request.url, 429, {"x-amzn-ErrorType": "ThrottlingException:"}, ThrottledBody())
+
+    def factory(region_name, model_id):
+        client = models.bedrock_client_factory(region_name or "us-east-1", model_id)
+        client.meta.events.register("before-send.bedrock-runtime.Converse", throttle)
+        return client
+
+    models.set_client_factory(factory)
+    reset_rate_limiters()
+    limiter = AdaptiveRateLimiter(MODEL_ID, max_retries=args.max_retries, base_backoff=0.01)
+    set_rate_limiter(MODEL_ID, limiter)
+    try:
+        models.call_claude(MODEL_ID, conversation(0))
+        error = None
+    except Exception as e:
+        error = type(e).__name__
+    return {"run": "botocore retries", "http_attempts": len(attempts), "limiter_retries": limiter.stats()["retries"],
+            "botocore_max_attempts": models.client_config().retries["total_max_attempts"], "error": error}
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=100, help="calls in flight (threads for the sync run)")
+    parser.add_argument("--throttle-rps", type=float, default=40, help="backend quota in requests per second")
+    parser.add_argument("--latency-ms", type=float, default=100, help="simulated latency of every model call")
+    parser.add_argument("--max-retries", type=int, default=4, help="limiter retries of a throttled call")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    return parser.parse_args(argv)
+
+
+def run_all(args) -> list[dict]:
+    results = [run(name, limited, args) for name, limited in
+               (("async unlimited", False), ("async limited", True), ("sync limited", True), ("mixed limited", True))]
+    return results + [botocore_attempts(args)]
+
+
+def find_problems(results: list[dict], args) -> list[str]:
+    problems = []
+    for result in results[:-1]:
+        limiter = result["limiter"]
+        if limiter is None:
+            continue
+        failed = result["throttled_errors"] + result["other_errors"]
+        if failed:
+            problems.append(f"{result['run']}: {failed} calls failed")
+        if result["throughput_rps"] < args.throttle_rps / 2:
+            problems.append(f"{result['run']}: {result['throughput_rps']} req/s, under half the {args.throttle_rps} req/s quota")
+        if limiter["in_flight"] or limiter["queued"]:
+            problems.append(f"{result['run']}: limiter left {limiter['in_flight']} in flight, {limiter['queued']} queued")
+    retries = results[-1]
+    if retries["error"] != "ThrottlingException" or retries["http_attempts"] != args.max_retries + 1:
+        problems.append(f"botocore retries: {retries['http_attempts']} HTTP attempts, expected {args.max_retries + 1}")
+    return problems
+
+
+def main():
+    args = parse_args()
+    results = run_all(args)
+
+    print(f"{'run':<18}{'ok':>6}{'failed':>8}{'throttles':>11}{'req/s':>8}{'limit':>7}{'retries':>9}{'max wait s':>12}")
+    for result in results[:-1]:
+        limiter = result["limiter"] or {}
+        failed = result["throttled_errors"] + result["other_errors"]
+        print(f"{result['run']:<18}{result['ok']:>6}{failed:>8}{result['backend_throttles']:>11}"
+              f"{result['throughput_rps']:>8.1f}{limiter.get('concurrency_limit', '-'):>7}{limiter.get('retries', '-'):>9}"
+              f"{limiter.get('max_wait_seconds', '-'):>12}")
+    retries = results[-1]
+    print(f"botocore retries: {retries['http_attempts']} HTTP attempts for one throttled call "
+          f"({retries['limiter_retries']} limiter retries, botocore total_max_attempts={retries['botocore_max_attempts']}), "
+          f"raised {retries['error']}")
+
+    problems = find_problems(results, args)
+    for problem in problems:
+        print(f"FAIL {problem}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results, "problems": problems}, f, indent=2)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from singletons import LazyMap
+
+# Error codes Bedrock uses when a caller exceeds its request or token quota.
+THROTTLING_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException"}
+# Transient failures botocore's standard mode would retry: the limiter retries them
+# too, since botocore makes a single attempt while the limiter is on.
+TRANSIENT_CODES = {"InternalServerException", "ModelNotReadyException", "ModelTimeoutException",
+                   "RequestTimeout", "RequestTimeoutException"}
+
+# Tokens charged for an image block before the real usage is known (Claude bills roughly
+# width * height / 750 tokens, capped around 1,600 for images within the size limits).
+IMAGE_TOKENS = 1600
+
+_limiters = LazyMap(lambda model_id: AdaptiveRateLimiter.from_env(model_id) if rate_limiting_enabled() else None)
+
+
+def is_throttling(error: Exception) -> bool:
+    """True for a botocore ClientError (or look-alike) carrying a throttling error code"""
+    response = getattr(error, "response", None)
+    return isinstance(response, dict) and response.get("Error", {}).get("Code") in THROTTLING_CODES
+
+
+def is_transient(error: Exception) -> bool:
+    """True for a server-side failure, a model that is still loading, or a connection or read timeout"""
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code") in TRANSIENT_CODES
+    try:
+        from botocore.exceptions import ConnectionError, HTTPClientError
+    except ImportError:
+        return False
+    return isinstance(error, (ConnectionError, HTTPClientError))
+
+
+def estimate_tokens(request: dict) -> int:
+    """Upper estimate of the tokens a Converse request uses: ~4 characters per prompt
+    token, a flat charge per image, plus the maxTokens the response may use"""
+    characters = 0
+    images = 0
+    blocks = [*(request.get("system") or []),
+              *(block for message in request.get("messages", []) for block in message.get("content", []))]
+    for block in blocks:
+        if "text" in block:
+            characters += len(block["text"])
+        elif "image" in block:
+            images += 1
+    return characters // 4 + images * IMAGE_TOKENS + (request.get("inferenceConfig") or {}).get("maxTokens", 0)
+
+
+def used_tokens(usage: dict) -> int:
+    return usage.get("totalTokens") or sum(usage.get(field) or 0 for field in ("inputTokens", "outputTokens",
+                                                                                "cacheReadInputTokens",
+                                                                                "cacheWriteInputTokens"))
+
+
+class TokenBucket:
+    """Refills at `rate` per second up to `capacity`; a rate of 0 means unlimited.
+    Not thread-safe on its own: the limiter calls it under its lock."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken, 0 if it can be taken now"""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        """Remove `amount`; a negative amount refunds. The level may go below zero when
+        a request used more than it reserved, which delays the next ones."""
+        if self.rate:
+            self.level = min(self.capacity, self.level - min(amount, self.capacity))
+
+
+class _Waiter:
+    """A queued caller: a thread blocked on an Event, or a coroutine awaiting a Future on its loop"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop = None):
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = None
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if self.future is not None and not self.future.done():
+            self.future.set_result(None)
+
+
+class Permit:
+    """One admitted request. Release it once, with the response usage when there is one,
+    or as cancelled when the caller gave up on it."""
+
+    def __init__(self, limiter: "AdaptiveRateLimiter", tokens: int):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.acquired_at = time.monotonic()
+        self.released = False
+
+    def release(self, usage: dict = None, throttled: bool = False, cancelled: bool = False) -> None:
+        if not self.released:
+            self.released = True
+            self.limiter.release(self, usage, throttled, cancelled)
+
+
+class AdaptiveRateLimiter:
+    """Client-side limits for one model, shared by every thread and event loop in the process.
+
+    Requests wait in a FIFO queue until three limits allow them: a token bucket of
+    requests per second, a token bucket of model tokens per minute (charged with an
+    estimate up front and corrected with the reported usage) and a concurrency limit.
+    The concurrency limit adapts AIMD-style: a throttled response halves it and
+    pauses new requests with exponential backoff, while each success raises it by
+    1 / limit, so it grows by about one per round of successful calls. Throttles of
+    requests admitted before the last decrease count once, so a burst of them does
+    not collapse the limit. Transient errors (see is_transient) are retried after a
+    backoff of their own without touching the limit.
+    """
+
+    def __init__(self, model_id: str = "", requests_per_second: float = 0, tokens_per_minute: float = 0,
+                 max_concurrency: int = 256, min_concurrency: int = 1, initial_concurrency: int = None,
+                 decrease_factor: float = 0.5, max_retries: int = 4, max_error_retries: int = 2,
+                 base_backoff: float = 0.1, max_backoff: float = 5.0):
+        self.model_id = model_id
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.decrease_factor = decrease_factor
+        self.max_retries = max_retries
+        self.max_error_retries = max_error_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._requests = TokenBucket(requests_per_second, max(1.0, requests_per_second))
+        self._tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+        self._limit = float(initial_concurrency or max_concurrency)
+        self._in_flight = 0
+        self._queue = deque()
+        self._paused_until = 0.0
+        self._throttle_streak = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "succeeded": 0, "throttled": 0, "failed": 0, "cancelled": 0, "retries": 0,
+                       "error_retries": 0, "decreases": 0,
+                       "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    @classmethod
+    def from_env(cls, model_id: str = ""):
+        max_concurrency = int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY") or 256)
+        return cls(
+            model_id=model_id,
+            requests_per_second=float(os.getenv("RATE_LIMIT_REQUESTS_PER_SECOND") or 0),
+            tokens_per_minute=float(os.getenv("RATE_LIMIT_TOKENS_PER_MINUTE") or 0),
+            max_concurrency=max_concurrency,
+            min_concurrency=int(os.getenv("RATE_LIMIT_MIN_CONCURRENCY") or 1),
+            initial_concurrency=int(os.getenv("RATE_LIMIT_INITIAL_CONCURRENCY") or max_concurrency),
+            max_retries=int(os.getenv("RATE_LIMIT_MAX_RETRIES") or 4),
+            max_error_retries=int(os.getenv("RATE_LIMIT_MAX_ERROR_RETRIES") or 2),
+        )
+
+    def _try_admit(self, waiter: _Waiter, tokens: int) -> Optional[float]:
+        """Under the lock: 0 once admitted, else seconds to wait (None: until woken)"""
+        if self._queue[0] is not waiter or self._in_flight >= int(self._limit):
+            return None
+        now = time.monotonic()
+        wait = max(self._paused_until - now, self._requests.wait_time(1, now), self._tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+        self._requests.take(1)
+        self._tokens.take(tokens)
+        self._in_flight += 1
+        self._stats["admitted"] += 1
+        self._queue.popleft()
+        # Let the next caller check too: more than one slot may be free.
+        self._wake_head()
+        return 0.0
+
+    def _wake_head(self) -> None:
+        if self._queue:
+            self._queue[0].wake()
+
+    def _leave(self, waiter: _Waiter) -> None:
+        with self._lock:
+            if waiter in self._queue:
+                head = self._queue[0] is waiter
+                self._queue.remove(waiter)
+                if head:
+                    self._wake_head()
+
+    def _admitted(self, tokens: int, queued_at: float) -> Permit:
+        waited = time.monotonic() - queued_at
+        with self._lock:
+            self._stats["wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        return Permit(self, tokens)
+
+    def acquire(self, tokens: int = 0) -> Permit:
+        """Block the calling thread until the request may be sent"""
+        waiter = _Waiter()
+        queued_at = time.monotonic()
+        with self._lock:
+            self._queue.append(waiter)
+        try:
+            while True:
+                waiter.event.clear()
+                with self._lock:
+                    wait = self._try_admit(waiter, tokens)
+                if wait == 0:
+                    return self._admitted(tokens, queued_at)
+                waiter.event.wait(wait)
+        except BaseException:
+            self._leave(waiter)
+            raise
+
+    async def aacquire(self, tokens: int = 0) -> Permit:
+        """Wait on the event loop until the request may be sent"""
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(loop)
+        queued_at = time.monotonic()
+        with self._lock:
+            self._queue.append(waiter)
+        try:
+            while True:
+                waiter.future = loop.create_future()
+                with self._lock:
+                    wait = self._try_admit(waiter, tokens)
+                if wait == 0:
+                    return self._admitted(tokens, queued_at)
+                await asyncio.wait({waiter.future}, timeout=wait)
+        except BaseException:
+            self._leave(waiter)
+            raise
+
+    def release(self, permit: Permit, usage: dict = None, throttled: bool = False, cancelled: bool = False) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if usage:
+                self._tokens.take(used_tokens(usage) - permit.tokens)
+            elif throttled:
+                # A throttled request used nothing: refund its reservation.
+                self._tokens.take(-permit.tokens)
+            if throttled:
+                self._on_throttle(permit)
+            elif usage is not None:
+                self._stats["succeeded"] += 1
+                self._throttle_streak = 0
+                self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+            elif cancelled:
+                # Neither a success nor a throttle: the caller stopped waiting for the response.
+                self._stats["cancelled"] += 1
+            else:
+                self._stats["failed"] += 1
+            self._wake_head()
+
+    def _on_throttle(self, permit: Permit) -> None:
+        self._stats["throttled"] += 1
+        now = time.monotonic()
+        if permit.acquired_at < self._last_decrease:
+            return
+        self._last_decrease = now
+        self._stats["decreases"] += 1
+        self._limit = max(self.min_concurrency, self._limit * self.decrease_factor)
+        self._throttle_streak += 1
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** (self._throttle_streak - 1))
+        self._paused_until = max(self._paused_until, now + backoff * random.uniform(0.5, 1.0))
+
+    def open(self, call, tokens: int = 0):
+        """Run `call()` once admitted, retrying throttled attempts and transient errors. Returns
+        (result, permit); release the permit with the response usage once the response has been consumed."""
+        retries = {"throttles": 0, "errors": 0}
+        while True:
+            permit = self.acquire(tokens)
+            try:
+                return call(), permit
+            except Exception as e:
+                backoff = self._failed(permit, e, retries)
+                if backoff is None:
+                    raise
+            except BaseException:
+                permit.release(cancelled=True)
+                raise
+            time.sleep(backoff)
+
+    async def aopen(self, call, tokens: int = 0):
+        """Async open: `call()` returns an awaitable. A cancelled call releases its permit as cancelled."""
+        retries = {"throttles": 0, "errors": 0}
+        while True:
+            permit = await self.aacquire(tokens)
+            try:
+                return await call(), permit
+            except Exception as e:
+                backoff = self._failed(permit, e, retries)
+                if backoff is None:
+                    raise
+            except BaseException:
+                permit.release(cancelled=True)
+                raise
+            await asyncio.sleep(backoff)
+
+    def _failed(self, permit: Permit, error: Exception, retries: dict) -> Optional[float]:
+        """Release the permit of a failed attempt: seconds to wait before retrying it, None to give up"""
+        throttled = is_throttling(error)
+        permit.release(throttled=throttled)
+        if throttled and retries["throttles"] < self.max_retries:
+            retries["throttles"] += 1
+            self._count_retry("retries")
+            # The pause the throttle started spaces out the retry.
+            return 0.0
+        if not throttled and is_transient(error) and retries["errors"] < self.max_error_retries:
+            retries["errors"] += 1
+            self._count_retry("error_retries")
+            return min(self.max_backoff, self.base_backoff * 2 ** (retries["errors"] - 1)) * random.uniform(0.5, 1.0)
+        return None
+
+    def _count_retry(self, counter: str) -> None:
+        with self._lock:
+            self._stats[counter] += 1
+
+    def stats(self) -> dict:
+        """Current limits, queue depth and counters"""
+        with self._lock:
+            return {
+                "concurrency_limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "queued": len(self._queue),
+                "requests_per_second": self._requests.rate,
+                "tokens_per_minute": self._tokens.rate * 60,
+                "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 3),
+                **{name: round(value, 3) if isinstance(value, float) else value for name, value in self._stats.items()},
+            }
+
+
+def rate_limiting_enabled() -> bool:
+    return os.getenv("RATE_LIMIT", "on").strip().lower() not in ("0", "off", "false", "no")
+
+
+def get_rate_limiter(model_id: str) -> Optional[AdaptiveRateLimiter]:
+    """Process-wide limiter of a model, built from the RATE_LIMIT_* env vars on first use; None when RATE_LIMIT=off"""
+    return _limiters.get(model_id)
+
+
+def set_rate_limiter(model_id: str, limiter: Optional[AdaptiveRateLimiter]) -> None:
+    """Install a limiter for a model, or None to send its requests unlimited"""
+    _limiters.set(model_id, limiter)
+
+
+def reset_rate_limiters() -> None:
+    _limiters.clear()
+
+
+def rate_limiter_stats() -> dict:
+    """stats() of every model's limiter"""
+    return {model_id: limiter.stats() for model_id, limiter in _limiters.items() if limiter is not None}
+
+
+def render_prometheus() -> str:
+    """Limiter gauges and counters in the Prometheus text format"""
+    stats = rate_limiter_stats()
+    lines = []
+    counters = ("throttled", "cancelled", "retries", "error_retries")
+    for name in ("concurrency_limit", "in_flight", "queued", *counters):
+        lines.append(f"# TYPE alt_text_rate_limit_{name} {'counter' if name in counters else 'gauge'}")
+        for model_id, values in sorted(stats.items()):
+            lines.append(f'alt_text_rate_limit_{name}{{model="{model_id}"}} {values[name]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,373 @@
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+
+from rate_limiter import is_throttling
+from singletons import Lazy
+
+# Error codes that point at the region rather than the request: another region may succeed.
+REGION_FAULT_CODES = {"InternalServerException", "ServiceUnavailableException", "ModelTimeoutException",
+                      "ModelNotReadyException", "ModelStreamErrorException", "ServiceQuotaExceededException"}
+
+
+def is_region_fault(error: Exception) -> bool:
+    """Throttling, 5xx, model timeouts and transport errors (timeouts, connection failures);
+    not validation or access errors, which every region would return"""
+    response = getattr(error, "response", None)
+    if isinstance(response, dict) and "Error" in response:
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return is_throttling(error) or response["Error"].get("Code") in REGION_FAULT_CODES or status >= 500
+    return True
+
+
+class RegionHealth:
+    """Recent latencies and error streak of one (region, model) target. After
+    `failure_threshold` region faults in a row the target is skipped for
+    `cooldown_s`; the next request after that probes it again."""
+
+    def __init__(self, window: int = 200, failure_threshold: int = 3, cooldown_s: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self._latencies = {}
+        self._window = window
+        self._consecutive_errors = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+        self.counts = {"calls": 0, "errors": 0, "hedges": 0, "hedges_skipped": 0, "wins": 0, "failovers": 0,
+                       "opened": 0}
+
+    def available(self) -> bool:
+        return time.monotonic() >= self._open_until
+
+    def success(self, operation: str, seconds: float) -> None:
+        with self._lock:
+            self.counts["calls"] += 1
+            self._latencies.setdefault(operation, deque(maxlen=self._window)).append(seconds)
+            self._consecutive_errors = 0
+
+    def failure(self) -> None:
+        with self._lock:
+            self.counts["calls"] += 1
+            self.counts["errors"] += 1
+            self._consecutive_errors += 1
+            if self._consecutive_errors >= self.failure_threshold:
+                if self.available():
+                    self.counts["opened"] += 1
+                self._open_until = time.monotonic() + self.cooldown_s
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def percentile(self, operation: str, q: float, min_samples: int) -> Optional[float]:
+        """Latency percentile in seconds, None with fewer than min_samples successes"""
+        with self._lock:
+            samples = sorted(self._latencies.get(operation, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(value for values in self._latencies.values() for value in values)
+            stats = dict(self.counts, healthy=self.available(), consecutive_errors=self._consecutive_errors)
+        if latencies:
+            stats["p50_ms"] = round(latencies[len(latencies) // 2] * 1000, 1)
+            stats["p99_ms"] = round(latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000, 1)
+        return stats
+
+
+class RegionRouter:
+    """Sends model calls to a primary (region, model) target, hedged and failed over to others.
+
+    A call that has not answered within the `hedge_percentile` latency of its
+    target (or `hedge_delay_s` until `min_samples` are known) gets one duplicate on
+    the next target; the first response wins and the other is cancelled (async) or
+    discarded when it lands (sync). At most `max_hedges` duplicates are in flight;
+    past that a slow call waits on its own. A region fault moves the call straight on
+    to the next target. Targets in cooldown are tried last. `alternate_models` maps a
+    model id to the one used outside the primary region, e.g. a cross-region inference profile.
+
+    Sync attempts run on a pool so the caller can return on the first response:
+    `max_workers` threads for primary and failover attempts plus `max_hedges` for
+    hedges. The hedge delay counts from when the primary attempt starts running. When
+    the primary threads are all busy the call runs on the caller's thread instead,
+    unhedged, failing over in turn; so the pool bounds the attempts that are left
+    running after losing.
+    """
+
+    def __init__(self, regions: list[str], alternate_models: dict = None, hedge_percentile: float = 95,
+                 hedge_delay_s: float = 1.0, min_samples: int = 20, failure_threshold: int = 3,
+                 cooldown_s: float = 30.0, max_workers: int = 64, max_hedges: int = 16):
+        self.regions = regions
+        self.alternate_models = alternate_models or {}
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay_s = hedge_delay_s
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.max_workers = max_workers
+        self.max_hedges = max_hedges
+        self._health = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._running = 0
+        self._hedging = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            regions=[region.strip() for region in os.getenv("BEDROCK_REGIONS", "").split(",") if region.strip()],
+            alternate_models=json.loads(os.getenv("BEDROCK_ALTERNATE_MODELS") or "{}"),
+            hedge_percentile=float(os.getenv("BEDROCK_HEDGE_PERCENTILE") or 95),
+            hedge_delay_s=float(os.getenv("BEDROCK_HEDGE_DELAY_MS") or 1000) / 1000,
+            min_samples=int(os.getenv("BEDROCK_HEDGE_MIN_SAMPLES") or 20),
+            failure_threshold=int(os.getenv("BEDROCK_FAILOVER_ERRORS") or 3),
+            cooldown_s=float(os.getenv("BEDROCK_FAILOVER_COOLDOWN_SECONDS") or 30),
+            max_workers=int(os.getenv("BEDROCK_HEDGE_THREADS") or 64),
+            max_hedges=int(os.getenv("BEDROCK_MAX_HEDGES") or 16),
+        )
+
+    def health(self, target: tuple[str, str]) -> RegionHealth:
+        health = self._health.get(target)
+        if health is None:
+            with self._lock:
+                health = self._health.setdefault(target, RegionHealth(failure_threshold=self.failure_threshold,
+                                                                      cooldown_s=self.cooldown_s))
+        return health
+
+    def targets(self, model_id: str) -> list[tuple[str, str]]:
+        """(region, model id) in order of preference: configured order, targets in cooldown last"""
+        targets = [(self.regions[0], model_id)] if self.regions else []
+        alternate = self.alternate_models.get(model_id)
+        if alternate and len(self.regions) == 1:
+            targets.append((self.regions[0], alternate))
+        targets += [(region, alternate or model_id) for region in self.regions[1:]]
+        return sorted(targets, key=lambda target: not self.health(target).available())
+
+    def hedge_delay(self, target: tuple[str, str], operation: str) -> Optional[float]:
+        """Seconds to wait on a target before hedging; None when hedging is off"""
+        if not self.hedge_percentile:
+            return None
+        measured = self.health(target).percentile(operation, self.hedge_percentile, self.min_samples)
+        return self.hedge_delay_s if measured is None else measured
+
+    def _attempt(self, target: tuple[str, str], operation: str, send):
+        started = time.perf_counter()
+        try:
+            result = send(*target)
+        except Exception as e:
+            if is_region_fault(e):
+                self.health(target).failure()
+            raise
+        self.health(target).success(operation, time.perf_counter() - started)
+        return result
+
+    def _reserve_hedge(self, target: tuple[str, str]) -> bool:
+        """Take one of the max_hedges slots; counted as skipped on the target when none is free"""
+        with self._lock:
+            if self._hedging < self.max_hedges:
+                self._hedging += 1
+                return True
+        self.health(target).count("hedges_skipped")
+        return False
+
+    def _release_hedge(self) -> None:
+        with self._lock:
+            self._hedging -= 1
+
+    def _submit(self, target: tuple[str, str], operation: str, send, hedge: bool = False,
+                started: threading.Event = None):
+        """Run the attempt on the pool; None when all max_workers threads are taken. A hedge
+        runs on a slot taken with _reserve_hedge instead, which it holds until it finishes.
+        `started` is set once the attempt is running."""
+        with self._lock:
+            if not hedge:
+                if self._running >= self.max_workers:
+                    return None
+                self._running += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers + self.max_hedges, thread_name_prefix="hedge")
+
+        def attempt():
+            if started is not None:
+                started.set()
+            try:
+                return self._attempt(target, operation, send)
+            finally:
+                if hedge:
+                    self._release_hedge()
+                else:
+                    with self._lock:
+                        self._running -= 1
+
+        return self._executor.submit(contextvars.copy_context().run, attempt)
+
+    def _call_inline(self, targets: list[tuple[str, str]], operation: str, send, failover: bool = False):
+        """Attempts on the caller's thread, one target after another on region faults"""
+        for position, target in enumerate(targets):
+            if position or failover:
+                self.health(target).count("failovers")
+            try:
+                return self._attempt(target, operation, send)
+            except Exception as e:
+                if not is_region_fault(e) or position == len(targets) - 1:
+                    raise
+
+    def call(self, model_id: str, operation: str, send, discard=None):
+        """send(region, model_id) on the best target, hedged and failed over; `discard(result)`
+        receives the result of an attempt that landed after another one won"""
+        targets = self.targets(model_id)
+        started = threading.Event()
+        first = self._submit(targets[0], operation, send, started=started) if len(targets) > 1 else None
+        if first is None:
+            return self._call_inline(targets, operation, send)
+        primary = targets.pop(0)
+        pending = {first: primary}
+        hedged = False
+        error = None
+        # Time spent waiting for a pool thread does not count towards the hedge delay.
+        started.wait()
+        while pending:
+            delay = self.hedge_delay(primary, operation) if targets and not hedged else None
+            done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                if self._reserve_hedge(targets[0]):
+                    target = targets.pop(0)
+                    self.health(target).count("hedges")
+                    pending[self._submit(target, operation, send, hedge=True)] = target
+                continue
+            for future in done:
+                target = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if not is_region_fault(e):
+                        self._abandon(pending, discard)
+                        raise
+                    error = e
+                    if targets:
+                        failover = self._submit(targets[0], operation, send)
+                        if failover is not None:
+                            self.health(targets[0]).count("failovers")
+                            pending[failover] = targets.pop(0)
+                        elif not pending:
+                            # Pool full and nothing else in flight: try the rest on this thread.
+                            return self._call_inline(targets, operation, send, failover=True)
+                    continue
+                self.health(target).count("wins")
+                self._abandon(pending, discard)
+                return result
+        raise error
+
+    @staticmethod
+    def _abandon(pending: dict, discard) -> None:
+        for future in pending:
+            if not future.cancel() and discard is not None:
+                future.add_done_callback(lambda landed: landed.exception() is None and discard(landed.result()))
+
+    async def acall(self, model_id: str, operation: str, send, discard=None):
+        """Async call: `send(region, model_id)` returns an awaitable; losing attempts are cancelled"""
+        targets = self.targets(model_id)
+        if len(targets) == 1:
+            return await self._aattempt(targets[0], operation, send)
+        pending = {}
+        hedged = False
+        error = None
+
+        def launch(reason: str = None):
+            target = targets.pop(0)
+            if reason:
+                self.health(target).count(reason)
+            task = asyncio.ensure_future(self._aattempt(target, operation, send))
+            if reason == "hedges":
+                task.add_done_callback(lambda _: self._release_hedge())
+            pending[task] = target
+
+        launch()
+        primary = next(iter(pending.values()))
+        try:
+            while pending:
+                delay = self.hedge_delay(primary, operation) if targets and not hedged else None
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    if self._reserve_hedge(targets[0]):
+                        launch("hedges")
+                    continue
+                for task in done:
+                    target = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        if not is_region_fault(e):
+                            raise
+                        error = e
+                        if targets:
+                            launch("failovers")
+                        continue
+                    self.health(target).count("wins")
+                    return result
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(lambda landed: landed.cancelled() or landed.exception() is not None
+                                       or discard is None or discard(landed.result()))
+
+    async def _aattempt(self, target: tuple[str, str], operation: str, send):
+        started = time.perf_counter()
+        try:
+            result = await send(*target)
+        except Exception as e:
+            if is_region_fault(e):
+                self.health(target).failure()
+            raise
+        self.health(target).success(operation, time.perf_counter() - started)
+        return result
+
+    def stats(self) -> dict:
+        """Per "region/model" target: calls, errors, hedges sent to it, wins, failovers, health and latency"""
+        with self._lock:
+            health = dict(self._health)
+        return {f"{region}/{model_id}": values.stats() for (region, model_id), values in health.items()}
+
+
+def render_prometheus() -> str:
+    """Per-target counters in the Prometheus text format (empty without multi-region routing)"""
+    router = get_router()
+    if router is None:
+        return ""
+    stats = router.stats()
+    lines = []
+    for name in ("calls", "errors", "hedges", "hedges_skipped", "wins", "failovers", "healthy"):
+        lines.append(f"# TYPE alt_text_region_{name} {'gauge' if name == 'healthy' else 'counter'}")
+        for target, values in sorted(stats.items()):
+            region, _, model_id = target.partition("/")
+            lines.append(f'alt_text_region_{name}{{region="{region}",model="{model_id}"}} {int(values[name])}')
+    return "\n".join(lines) + "\n"
+
+
+def _router_from_env() -> Optional[RegionRouter]:
+    router = RegionRouter.from_env()
+    return router if router.regions and (len(router.regions) > 1 or router.alternate_models) else None
+
+
+_router = Lazy(_router_from_env)
+
+
+def get_router() -> Optional[RegionRouter]:
+    """Process-wide router; None unless BEDROCK_REGIONS lists more than one region or
+    BEDROCK_ALTERNATE_MODELS is set (the first region is the primary)"""
+    return _router.get()
+
+
+def set_router(router: Optional[RegionRouter]) -> None:
+    _router.set(router)
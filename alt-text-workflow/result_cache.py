@@ -0,0 +1,140 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from singletons import Lazy
+
+def make_key(*parts: str) -> str:
+    """Content address for a model response: sha256 over the given parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part or "").encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache of model responses.
+
+    Tier 1 is an in-process LRU bounded by entry count and TTL. Tier 2 is an
+    optional SQLite file that several worker processes can share; its hits are
+    promoted into tier 1.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400, sqlite_path: str = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.sqlite_path = sqlite_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "writes": 0, "evictions": 0}
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES") or 1024),
+            ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS") or 86400),
+            sqlite_path=os.getenv("RESULT_CACHE_SQLITE_PATH") or None,
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._entries[key]
+
+        # SQLite I/O happens outside the LRU lock, so memory hits never wait on the disk.
+        row = None
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute("SELECT value, expires_at FROM results WHERE key = ? AND expires_at > ?",
+                                       (key, now)).fetchone()
+        with self._lock:
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            # A set() that raced this read holds the newer value: keep it.
+            if key not in self._entries:
+                self._put(key, row[0], row[1])
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._stats["writes"] += 1
+            self._put(key, value, expires_at)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                                 (key, value, expires_at))
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    def purge_expired(self) -> None:
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]:
+                del self._entries[key]
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries)}
+
+    def _put(self, key: str, value: str, expires_at: float) -> None:
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+
+_cache = Lazy(lambda: ResultCache.from_env()
+               if os.getenv("RESULT_CACHE", "on").lower() not in ("off", "false", "0") else None)
+
+
+def render_prometheus() -> str:
+    """Cache counters in the Prometheus text format (empty when RESULT_CACHE=off or before first use)"""
+    cache = _cache.peek()
+    if cache is None:
+        return ""
+    stats = cache.stats()
+    lines = ["# TYPE alt_text_result_cache_hits counter"]
+    for tier in ("memory", "disk"):
+        lines.append(f'alt_text_result_cache_hits{{tier="{tier}"}} {stats[tier + "_hits"]}')
+    for name in ("misses", "bypassed", "writes", "evictions"):
+        lines.append(f"# TYPE alt_text_result_cache_{name} counter")
+        lines.append(f"alt_text_result_cache_{name} {stats[name]}")
+    lines.append("# TYPE alt_text_result_cache_entries gauge")
+    lines.append(f"alt_text_result_cache_entries {stats['entries']}")
+    return "\n".join(lines) + "\n"
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Process-wide cache built from env on first use; None when RESULT_CACHE=off"""
+    return _cache.get()
+
+
+def set_result_cache(cache: Optional[ResultCache]) -> None:
+    _cache.set(cache)
@@ -0,0 +1,47 @@
+import base64
+import io
+import os
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+DEFAULT_IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "images")
+
+
+def iter_image_files(paths: list[str]):
+    """Image files under the given files/directories, in sorted order"""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(path, name)
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            yield path
+
+
+def to_data_uri(image_bytes: bytes) -> str:
+    image_format = (Image.open(io.BytesIO(image_bytes)).format or "JPEG").lower()
+    return f"data:image/{image_format};base64,{base64.b64encode(image_bytes).decode()}"
+
+
+def synthetic_image(complexity: str, size: tuple[int, int] = (800, 600), seed: int = 0, image_format: str = "JPEG") -> bytes:
+    """Encoded test image whose visual busyness roughly follows the complexity level"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    image = Image.new("RGB", size, tuple(int(c) for c in rng.integers(180, 256, 3)))
+    draw = ImageDraw.Draw(image)
+    shapes = {"Simple": 1, "Moderate": 4, "Complex": 40}[complexity]
+    for _ in range(shapes):
+        x0, y0 = int(rng.integers(0, width * 3 // 4)), int(rng.integers(0, height * 3 // 4))
+        x1 = x0 + int(rng.integers(width // 10, width // 3))
+        y1 = y0 + int(rng.integers(height // 10, height // 3))
+        fill = tuple(int(c) for c in rng.integers(0, 256, 3))
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)((x0, y0, x1, y1), fill=fill)
+    if complexity == "Complex":
+        noise = rng.normal(0, 25, (height, width, 3))
+        image = Image.fromarray(np.clip(np.asarray(image, dtype=np.float32) + noise, 0, 255).astype(np.uint8))
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
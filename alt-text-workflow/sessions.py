@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+from models import run_blocking
+from singletons import Lazy
+
+
+
+class SessionExpiry:
+    """Mixin for checkpoint savers: a session (thread) and all its checkpoints
+    are deleted ttl_seconds after its last write. A session read after it expired
+    is deleted then; the others are purged at most once per purge_interval_seconds,
+    by whichever read or write comes first after the interval."""
+
+    ttl_seconds: float
+    purge_interval_seconds: float
+
+    def _init_expiry(self, ttl_seconds: float, purge_interval_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval_seconds = purge_interval_seconds
+        self._next_purge = 0.0
+        self._purge_lock = threading.Lock()
+
+    def _purge_due(self) -> None:
+        now = time.monotonic()
+        if now < self._next_purge or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_purge = now + self.purge_interval_seconds
+            self.purge_expired()
+        finally:
+            self._purge_lock.release()
+
+    def get_tuple(self, config):
+        self._purge_due()
+        thread_id = config["configurable"]["thread_id"]
+        expires_at = self._expiry(thread_id)
+        if expires_at is not None and expires_at <= time.time():
+            self.delete_thread(thread_id)
+            return None
+        return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        self._purge_due()
+        self._set_expiry(config["configurable"]["thread_id"], time.time() + self.ttl_seconds)
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self._clear_expiry(thread_id)
+        super().delete_thread(thread_id)
+
+    def purge_expired(self) -> int:
+        expired = self._expired_threads(time.time())
+        for thread_id in expired:
+            self.delete_thread(thread_id)
+        return len(expired)
+
+
+class MemorySessionSaver(SessionExpiry, InMemorySaver):
+    """Sessions held in this process; lost when the worker restarts"""
+
+    def __init__(self, ttl_seconds: float = 3600, purge_interval_seconds: float = 60):
+        super().__init__()
+        self._init_expiry(ttl_seconds, purge_interval_seconds)
+        self._expires_at = {}
+        self._expiry_lock = threading.Lock()
+
+    def _expiry(self, thread_id: str) -> Optional[float]:
+        with self._expiry_lock:
+            return self._expires_at.get(thread_id)
+
+    def _set_expiry(self, thread_id: str, expires_at: float) -> None:
+        with self._expiry_lock:
+            self._expires_at[thread_id] = expires_at
+
+    def _clear_expiry(self, thread_id: str) -> None:
+        with self._expiry_lock:
+            self._expires_at.pop(thread_id, None)
+
+    def _expired_threads(self, now: float) -> list[str]:
+        with self._expiry_lock:
+            return [thread_id for thread_id, expires_at in self._expires_at.items() if expires_at <= now]
+
+
+def _sqlite_saver_class():
+    # Optional dependency: only needed with SESSION_STORE=sqlite.
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    class SqliteSessionSaver(SessionExpiry, SqliteSaver):
+        """Sessions in a SQLite file shared by worker processes, surviving restarts.
+
+        SqliteSaver is synchronous; its async methods run it on a worker thread.
+        """
+
+        def __init__(self, sqlite_path: str, ttl_seconds: float = 3600, purge_interval_seconds: float = 60):
+            super().__init__(sqlite3.connect(sqlite_path, check_same_thread=False, timeout=5))
+            self._init_expiry(ttl_seconds, purge_interval_seconds)
+            with self.cursor() as cur:
+                cur.execute("CREATE TABLE IF NOT EXISTS session_expiry (thread_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+                cur.execute("CREATE INDEX IF NOT EXISTS session_expiry_expires_at ON session_expiry (expires_at)")
+
+        def _expiry(self, thread_id: str) -> Optional[float]:
+            with self.cursor(transaction=False) as cur:
+                cur.execute("SELECT expires_at FROM session_expiry WHERE thread_id = ?", (thread_id,))
+                row = cur.fetchone()
+            return row[0] if row else None
+
+        def _set_expiry(self, thread_id: str, expires_at: float) -> None:
+            with self.cursor() as cur:
+                cur.execute("INSERT OR REPLACE INTO session_expiry (thread_id, expires_at) VALUES (?, ?)",
+                            (thread_id, expires_at))
+
+        def _clear_expiry(self, thread_id: str) -> None:
+            with self.cursor() as cur:
+                cur.execute("DELETE FROM session_expiry WHERE thread_id = ?", (thread_id,))
+
+        def _expired_threads(self, now: float) -> list[str]:
+            with self.cursor(transaction=False) as cur:
+                cur.execute("SELECT thread_id FROM session_expiry WHERE expires_at <= ?", (now,))
+                return [row[0] for row in cur.fetchall()]
+
+        async def aget_tuple(self, config):
+            return await run_blocking(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None):
+            for item in await run_blocking(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+                yield item
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await run_blocking(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes, task_id, task_path=""):
+            return await run_blocking(self.put_writes, config, writes, task_id, task_path)
+
+        async def adelete_thread(self, thread_id: str) -> None:
+            return await run_blocking(self.delete_thread, thread_id)
+
+    return SqliteSessionSaver
+
+
+def create_checkpointer(store: str = "memory", ttl_seconds: float = 3600, sqlite_path: Optional[str] = None,
+                        purge_interval_seconds: float = 60):
+    if store == "sqlite":
+        return _sqlite_saver_class()(sqlite_path or "sessions.sqlite", ttl_seconds, purge_interval_seconds)
+    if store == "memory":
+        return MemorySessionSaver(ttl_seconds, purge_interval_seconds)
+    raise ValueError(f"Unknown SESSION_STORE: {store}")
+
+
+_checkpointer = Lazy(lambda: create_checkpointer(
+    os.getenv("SESSION_STORE", "memory").lower(),
+    float(os.getenv("SESSION_TTL_SECONDS") or 3600),
+    os.getenv("SESSION_SQLITE_PATH") or None,
+    float(os.getenv("SESSION_PURGE_INTERVAL_SECONDS") or 60),
+))
+
+
+def get_checkpointer():
+    """Process-wide session store built from env on first use"""
+    return _checkpointer.get()
+
+
+def session_config(session_id: str) -> dict:
+    return {"configurable": {"thread_id": session_id}}
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import threading
+from typing import Optional
+
+from singletons import Lazy
+
+
+
+class _Flight:
+    """One in-flight computation and the callers waiting for it"""
+
+    def __init__(self):
+        self.landed = threading.Event()
+        self.futures = []
+        self.result = None
+        self.error = None
+        self.abandoned = False
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls: the first caller for a key runs the call,
+    callers arriving while it runs wait for it and receive the same result or
+    exception. Nothing is kept once the call returns.
+
+    Works across threads and event loops. If the leading caller is cancelled, the
+    waiting callers start over and one of them runs the call instead.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _stage_stats(self, stage: str) -> dict:
+        return self._stats.setdefault(stage, {"flights": 0, "coalesced": 0, "shared_errors": 0})
+
+    def _join(self, stage: str, key: str) -> tuple[_Flight, bool]:
+        """The flight for key and whether this caller leads it"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            self._stage_stats(stage)["flights"] += 1
+            return flight, True
+
+    def _land(self, key: str, flight: _Flight, result=None, error: BaseException = None) -> None:
+        with self._lock:
+            del self._flights[key]
+            flight.result = result
+            flight.error = error if isinstance(error, Exception) else None
+            flight.abandoned = error is not None and flight.error is None
+            flight.landed.set()
+            futures, flight.futures = flight.futures, []
+        for loop, future in futures:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_resolve, future)
+
+    def _shared(self, stage: str, flight: _Flight):
+        with self._lock:
+            stats = self._stage_stats(stage)
+            stats["coalesced"] += 1
+            if flight.error is not None:
+                stats["shared_errors"] += 1
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def do(self, stage: str, key: str, call) -> tuple[object, bool]:
+        """(result of call(), whether it was shared from another caller's flight)"""
+        while True:
+            flight, leader = self._join(stage, key)
+            if leader:
+                try:
+                    result = call()
+                except BaseException as e:
+                    self._land(key, flight, error=e)
+                    raise
+                self._land(key, flight, result)
+                return result, False
+            flight.landed.wait()
+            if not flight.abandoned:
+                return self._shared(stage, flight), True
+
+    async def ado(self, stage: str, key: str, call) -> tuple[object, bool]:
+        """Async do: `call()` returns an awaitable"""
+        while True:
+            flight, leader = self._join(stage, key)
+            if leader:
+                try:
+                    result = await call()
+                except BaseException as e:
+                    self._land(key, flight, error=e)
+                    raise
+                self._land(key, flight, result)
+                return result, False
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            with self._lock:
+                if flight.landed.is_set():
+                    future.set_result(None)
+                else:
+                    flight.futures.append((loop, future))
+            await future
+            if not flight.abandoned:
+                return self._shared(stage, flight), True
+
+    def stats(self) -> dict:
+        """Flights run and requests that shared one, per stage; every shared request saved a model call"""
+        with self._lock:
+            stages = {stage: dict(values) for stage, values in self._stats.items()}
+            in_flight = len(self._flights)
+        return {"in_flight": in_flight, "model_calls_saved": sum(values["coalesced"] for values in stages.values()),
+                "stages": stages}
+
+
+def render_prometheus() -> str:
+    """Flight counters in the Prometheus text format (empty when coalescing is off)"""
+    single_flight = get_single_flight()
+    if single_flight is None:
+        return ""
+    lines = []
+    stages = single_flight.stats()["stages"]
+    for name in ("flights", "coalesced", "shared_errors"):
+        lines.append(f"# TYPE alt_text_single_flight_{name} counter")
+        for stage, values in sorted(stages.items()):
+            lines.append(f'alt_text_single_flight_{name}{{stage="{stage}"}} {values[name]}')
+    return "\n".join(lines) + "\n"
+
+
+_single_flight = Lazy(lambda: SingleFlight()
+                      if os.getenv("SINGLE_FLIGHT", "on").lower() not in ("off", "false", "0") else None)
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Process-wide coalescer; None when SINGLE_FLIGHT=off"""
+    return _single_flight.get()
+
+
+def set_single_flight(single_flight: Optional[SingleFlight]) -> None:
+    _single_flight.set(single_flight)
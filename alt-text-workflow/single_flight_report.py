@@ -0,0 +1,116 @@
+"""Check request coalescing: identical concurrent requests share one model call per stage.
+
+    python3 single_flight_report.py --requests 40 --distinct 4 --latency-ms 200
+
+Sends --requests workflow requests at once, spread over --distinct images, to the
+fake Bedrock backend with the result cache off, first through `ainvoke()` on one
+event loop and then through `invoke()` on a thread pool. Each run should make one
+model call per stage and distinct image; the rest are served by the in-flight
+call. A last run makes the backend fail and checks that every coalesced request
+receives the error. Exits non-zero when a check fails.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import models
+from alt_text_langgraph import create_alt_text_workflow
+from fake_bedrock import FakeBedrockClient
+from result_cache import set_result_cache
+from sample_images import synthetic_image, to_data_uri
+from single_flight import SingleFlight, set_single_flight
+
+
+class FailingClient(FakeBedrockClient):
+    def _response(self, messages, kwargs, started):
+        raise RuntimeError("backend unavailable")
+
+
+def payloads(requests: int, distinct: int, mode: str) -> list[dict]:
+    images = [to_data_uri(synthetic_image("Moderate", seed=index)) for index in range(distinct)]
+    return [{"image_data": images[index % distinct], "user_input": f"Product photo {index % distinct}",
+             "generation_mode": mode} for index in range(requests)]
+
+
+async def run_async(workflow, items: list[dict]) -> list:
+    return await asyncio.gather(*(workflow.ainvoke(item) for item in items), return_exceptions=True)
+
+
+def run_sync(workflow, items: list[dict]) -> list:
+    def one(item):
+        try:
+            return workflow.invoke(item)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=len(items)) as pool:
+        return list(pool.map(one, items))
+
+
+def run(name: str, fake: FakeBedrockClient, items: list[dict], expected_calls: int) -> dict:
+    models.set_client_factory(lambda region_name, model_id: fake)
+    flights = SingleFlight()
+    set_single_flight(flights)
+    workflow = create_alt_text_workflow()
+    results = asyncio.run(run_async(workflow, items)) if name.startswith("async") else run_sync(workflow, items)
+    errors = [result for result in results if isinstance(result, Exception)]
+    return {"run": name, "requests": len(items), "model_calls": fake.call_count, "expected_calls": expected_calls,
+            "errors": len(errors), **flights.stats()}
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--distinct", type=int, default=4, help="distinct images among the requests")
+    parser.add_argument("--latency-ms", type=float, default=200, help="simulated latency of every model call")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    return parser.parse_args(argv)
+
+
+def run_all(args) -> list[dict]:
+    set_result_cache(None)
+    two_stage = payloads(args.requests, args.distinct, "two_stage")
+    return [
+        run("async two_stage", FakeBedrockClient(latency_ms=args.latency_ms), two_stage, 2 * args.distinct),
+        run("sync two_stage", FakeBedrockClient(latency_ms=args.latency_ms), two_stage, 2 * args.distinct),
+        run("async fused", FakeBedrockClient(latency_ms=args.latency_ms),
+            payloads(args.requests, args.distinct, "fused"), args.distinct),
+        run("async failing", FailingClient(latency_ms=args.latency_ms), two_stage, args.distinct),
+    ]
+
+
+def find_problems(results: list[dict]) -> list[str]:
+    problems = []
+    for result in results:
+        if result["model_calls"] != result["expected_calls"]:
+            problems.append(f"{result['run']}: {result['model_calls']} model calls, expected {result['expected_calls']}")
+        expected_errors = result["requests"] if result["run"].endswith("failing") else 0
+        if result["errors"] != expected_errors:
+            problems.append(f"{result['run']}: {result['errors']} requests failed, expected {expected_errors}")
+        if result["in_flight"]:
+            problems.append(f"{result['run']}: {result['in_flight']} flights left open")
+    return problems
+
+
+def main():
+    args = parse_args()
+    results = run_all(args)
+
+    print(f"{'run':<18}{'requests':>9}{'model calls':>13}{'expected':>10}{'saved':>7}{'errors':>8}")
+    for result in results:
+        print(f"{result['run']:<18}{result['requests']:>9}{result['model_calls']:>13}{result['expected_calls']:>10}"
+              f"{result['model_calls_saved']:>7}{result['errors']:>8}")
+
+    problems = find_problems(results)
+    for problem in problems:
+        print(f"FAIL {problem}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results, "problems": problems}, f, indent=2)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import threading
+import weakref
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Lazy(Generic[T]):
+    """A process-wide object, built by `build()` on first use and shared by every thread.
+
+    `build` may return None for a feature that is switched off; that answer is kept
+    too. `set(value)` installs an object instead (None turns the feature off), and
+    `reset()` makes the next `get()` build again from env.
+    """
+
+    def __init__(self, build: Callable[[], Optional[T]]):
+        self._build = build
+        self._value = None
+        self._configured = False
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[T]:
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    self._value = self._build()
+                    self._configured = True
+        return self._value
+
+    def peek(self) -> Optional[T]:
+        """The object if it has been built or set, without building it"""
+        return self._value
+
+    def set(self, value: Optional[T]) -> None:
+        with self._lock:
+            self._value = value
+            self._configured = True
+
+    def reset(self) -> None:
+        with self._lock:
+            self._value = None
+            self._configured = False
+
+
+class LazyMap(Generic[T]):
+    """Lazy objects by key, e.g. one rate limiter per model: `build(key)` on first use of a key.
+    With weak_keys an entry goes away with its key, e.g. per-event-loop objects."""
+
+    def __init__(self, build: Callable[[object], Optional[T]], weak_keys: bool = False):
+        self._build = build
+        self._values = weakref.WeakKeyDictionary() if weak_keys else {}
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[T]:
+        value = self._values.get(key)
+        if value is None and key not in self._values:
+            with self._lock:
+                if key not in self._values:
+                    self._values[key] = self._build(key)
+                value = self._values[key]
+        return value
+
+    def set(self, key, value: Optional[T]) -> None:
+        with self._lock:
+            self._values[key] = value
+
+    def items(self) -> list[tuple[object, Optional[T]]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
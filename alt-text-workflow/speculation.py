@@ -0,0 +1,119 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from singletons import Lazy
+
+COMPLEXITY_LEVELS = ("Simple", "Moderate", "Complex")
+
+
+def predict_level(image_bytes: Optional[bytes]) -> str:
+    """Complexity level to speculate on: SPECULATIVE_LEVEL (default Moderate), or with
+    SPECULATIVE_LEVEL=local the local classifier's guess at any confidence"""
+    level = os.getenv("SPECULATIVE_LEVEL") or "Moderate"
+    if level.lower() == "local":
+        if image_bytes is None:
+            return "Moderate"
+        from complexity_classifier import classify_image
+        return classify_image(image_bytes)["complexity_level"]
+    return level if level in COMPLEXITY_LEVELS else "Moderate"
+
+
+class Speculator:
+    """Admission and outcome counters for speculative generation.
+
+    A speculation that misses costs one generation call on top of the two-stage
+    path. `max_extra_ratio` caps those extra calls at a fraction of requests: every
+    request earns that fraction of a credit (up to `burst`), each speculation
+    reserves a whole credit and a hit gives it back. Without credit the request
+    runs the plain two-stage path. None leaves speculation uncapped.
+    """
+
+    def __init__(self, max_extra_ratio: Optional[float] = None, burst: float = 20, max_workers: int = 32):
+        self.max_extra_ratio = max_extra_ratio
+        self.burst = burst
+        self.max_workers = max_workers
+        self._credit = burst
+        self._lock = threading.Lock()
+        self._executor = None
+        self._stats = {"requests": 0, "speculated": 0, "hits": 0, "misses": 0, "skipped": 0,
+                       "latency_saved_ms": 0.0}
+
+    @classmethod
+    def from_env(cls):
+        ratio = os.getenv("SPECULATIVE_MAX_EXTRA_RATIO")
+        return cls(max_extra_ratio=float(ratio) if ratio else None,
+                   burst=float(os.getenv("SPECULATIVE_BURST") or 20),
+                   max_workers=int(os.getenv("SPECULATIVE_THREADS") or 32))
+
+    def admit(self) -> bool:
+        """Whether this request may speculate; counts the request either way"""
+        with self._lock:
+            self._stats["requests"] += 1
+            if self.max_extra_ratio is not None:
+                self._credit = min(self.burst, self._credit + self.max_extra_ratio)
+                if self._credit < 1:
+                    self._stats["skipped"] += 1
+                    return False
+                self._credit -= 1
+            self._stats["speculated"] += 1
+            return True
+
+    def record(self, hit: bool, saved_ms: float) -> None:
+        """Outcome of an admitted speculation; `saved_ms` is the sequential latency minus the actual one"""
+        with self._lock:
+            self._stats["hits" if hit else "misses"] += 1
+            self._stats["latency_saved_ms"] += saved_ms
+            if hit and self.max_extra_ratio is not None:
+                self._credit = min(self.burst, self._credit + 1)
+
+    def submit(self, call) -> Future:
+        """Run call() on the speculation thread pool, in a copy of the caller's context"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="speculative")
+        return self._executor.submit(contextvars.copy_context().run, call)
+
+    def stats(self) -> dict:
+        """Counters plus hit rate, extra generation calls per request and mean latency saved per speculation"""
+        with self._lock:
+            stats = dict(self._stats)
+        decided = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / decided if decided else None
+        stats["extra_call_ratio"] = stats["misses"] / stats["requests"] if stats["requests"] else None
+        stats["mean_latency_saved_ms"] = stats["latency_saved_ms"] / decided if decided else None
+        stats["max_extra_ratio"] = self.max_extra_ratio
+        return stats
+
+
+def render_prometheus() -> str:
+    """Speculation counters in the Prometheus text format (empty before any speculative request)"""
+    speculator = _speculator.peek()
+    if speculator is None:
+        return ""
+    stats = speculator.stats()
+    lines = []
+    for name in ("requests", "speculated", "hits", "misses", "skipped"):
+        lines.append(f"# TYPE alt_text_speculative_{name} counter")
+        lines.append(f"alt_text_speculative_{name} {stats[name]}")
+    lines.append("# TYPE alt_text_speculative_latency_saved_seconds counter")
+    lines.append(f"alt_text_speculative_latency_saved_seconds {stats['latency_saved_ms'] / 1000:.6f}")
+    return "\n".join(lines) + "\n"
+
+
+_speculator = Lazy(Speculator.from_env)
+
+
+def get_speculator() -> Speculator:
+    """Process-wide speculator built from env on first use"""
+    return _speculator.get()
+
+
+def set_speculator(speculator: Optional[Speculator]) -> None:
+    """Swap the speculator; None rebuilds it from env on next use"""
+    if speculator is None:
+        _speculator.reset()
+    else:
+        _speculator.set(speculator)
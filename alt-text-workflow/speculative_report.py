@@ -0,0 +1,169 @@
+"""Measure speculative generation against the two-stage path: hit rate, latency saved, extra calls.
+
+    python3 speculative_report.py --requests 60 --concurrency 8 --latency-ms 300 --weights 1,2,1
+
+Sends --requests distinct images through the workflow on the fake Bedrock backend
+(result cache and coalescing off), --concurrency at a time:
+- two_stage: complexity analysis, then generation;
+- speculative: generation for the predicted level (--predict) alongside the
+  analysis, via ainvoke() and via invoke() on a thread pool;
+- capped: speculative with SPECULATIVE_MAX_EXTRA_RATIO=--max-extra-ratio.
+The fake backend labels complexity from a hash of the request, distributed by
+--weights (Simple,Moderate,Complex), so the hit rate of a fixed prediction
+follows the weights; the local classifier's guess is not meaningful against it.
+
+Exits non-zero when a speculative run returns a different alt-text than the
+two-stage run, makes other than 2 model calls per request plus one per miss,
+leaves rate-limiter slots in flight after it finishes (a cancelled speculation
+that kept its slot), or the capped run exceeds its budget of extra calls.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import models
+from alt_text_langgraph import create_alt_text_workflow
+from fake_bedrock import FakeBedrockClient
+from rate_limiter import rate_limiter_stats
+from result_cache import set_result_cache
+from sample_images import synthetic_image, to_data_uri
+from single_flight import set_single_flight
+from speculation import Speculator, set_speculator
+
+LEVELS = ("Simple", "Moderate", "Complex")
+
+
+def payloads(requests: int, mode: str) -> list[dict]:
+    return [{"image_data": to_data_uri(synthetic_image(LEVELS[index % 3], seed=index)),
+             "user_input": f"Product photo {index}", "generation_mode": mode} for index in range(requests)]
+
+
+async def run_async(workflow, items: list[dict], concurrency: int) -> list[tuple[dict, float]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(item):
+        async with semaphore:
+            started = time.perf_counter()
+            result = await workflow.ainvoke(item)
+            return result, (time.perf_counter() - started) * 1000
+
+    return await asyncio.gather(*(one(item) for item in items))
+
+
+def run_sync(workflow, items: list[dict], concurrency: int) -> list[tuple[dict, float]]:
+    def one(item):
+        started = time.perf_counter()
+        result = workflow.invoke(item)
+        return result, (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, items))
+
+
+def settled_in_flight(timeout_s: float) -> int:
+    """Rate-limiter slots in flight once calls left running (the speculation of a sync miss) have had time to end"""
+    deadline = time.monotonic() + timeout_s
+    while True:
+        in_flight = sum(limiter["in_flight"] for limiter in rate_limiter_stats().values())
+        if not in_flight or time.monotonic() > deadline:
+            return in_flight
+        time.sleep(0.01)
+
+
+def run(name: str, args, mode: str, max_extra_ratio: float = None) -> dict:
+    fake = FakeBedrockClient(latency_ms=args.latency_ms, latency_jitter=args.latency_jitter,
+                             complexity_weights=[float(weight) for weight in args.weights.split(",")], seed=0)
+    models.set_client_factory(lambda region_name, model_id: fake)
+    speculator = Speculator(max_extra_ratio=max_extra_ratio, burst=args.burst)
+    set_speculator(speculator)
+    workflow = create_alt_text_workflow()
+    items = payloads(args.requests, mode)
+    started = time.perf_counter()
+    if name.startswith("sync"):
+        results = run_sync(workflow, items, args.concurrency)
+    else:
+        results = asyncio.run(run_async(workflow, items, args.concurrency))
+    wall_s = time.perf_counter() - started
+    latencies = sorted(ms for _, ms in results)
+    stats = speculator.stats()
+    return {"run": name, "requests": len(items), "model_calls": fake.call_count, "wall_s": round(wall_s, 2),
+            "p50_ms": round(statistics.median(latencies), 1),
+            "p95_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 1),
+            "alt_texts": [result["generated_alt_text"] for result, _ in results],
+            "speculation": stats if mode == "speculative" else None,
+            "limiter_in_flight": settled_in_flight(1 + 5 * args.latency_ms / 1000)}
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=300, help="median simulated latency of every model call")
+    parser.add_argument("--latency-jitter", type=float, default=0.3, help="log-normal sigma of the latency")
+    parser.add_argument("--weights", default="1,2,1", help="fake complexity distribution (Simple,Moderate,Complex)")
+    parser.add_argument("--predict", default="Moderate", help="SPECULATIVE_LEVEL: a complexity level or 'local'")
+    parser.add_argument("--max-extra-ratio", type=float, default=0.1, help="extra-call cap of the capped run")
+    parser.add_argument("--burst", type=float, default=2, help="speculation credit the capped run starts with")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    return parser.parse_args(argv)
+
+
+def run_all(args) -> list[dict]:
+    os.environ["SPECULATIVE_LEVEL"] = args.predict
+    set_result_cache(None)
+    set_single_flight(None)
+    return [run("async two_stage", args, "two_stage"), run("async speculative", args, "speculative"),
+            run("sync speculative", args, "speculative"),
+            run("async capped", args, "speculative", max_extra_ratio=args.max_extra_ratio)]
+
+
+def find_problems(results: list[dict], args) -> list[str]:
+    baseline = results[0]
+    problems = []
+    for result in results:
+        speculation = result["speculation"]
+        if result["alt_texts"] != baseline["alt_texts"]:
+            problems.append(f"{result['run']}: alt-texts differ from the two-stage run")
+        expected_calls = 2 * result["requests"] + (speculation["misses"] if speculation else 0)
+        if result["model_calls"] != expected_calls:
+            problems.append(f"{result['run']}: {result['model_calls']} model calls, expected {expected_calls}")
+        if result["limiter_in_flight"]:
+            problems.append(f"{result['run']}: {result['limiter_in_flight']} rate-limiter slots still in flight")
+        if result["run"] == "async capped":
+            budget = args.max_extra_ratio * result["requests"] + args.burst
+            if speculation["misses"] > budget:
+                problems.append(f"{result['run']}: {speculation['misses']} extra calls over the budget of {budget:.0f}")
+    return problems
+
+
+def main():
+    args = parse_args()
+    results = run_all(args)
+
+    print(f"{'run':<19}{'p50 ms':>8}{'p95 ms':>8}{'wall s':>8}{'calls':>7}{'hit rate':>10}{'skipped':>9}"
+          f"{'extra/req':>11}{'saved ms':>10}")
+    for result in results:
+        speculation = result["speculation"]
+        row = f"{result['run']:<19}{result['p50_ms']:>8}{result['p95_ms']:>8}{result['wall_s']:>8}{result['model_calls']:>7}"
+        if speculation:
+            row += (f"{speculation['hit_rate'] or 0:>10.1%}{speculation['skipped']:>9}"
+                    f"{speculation['extra_call_ratio']:>11.2f}{speculation['mean_latency_saved_ms'] or 0:>10.0f}")
+        print(row)
+
+    problems = find_problems(results, args)
+    for problem in problems:
+        print(f"FAIL {problem}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": [{**result, "alt_texts": None} for result in results],
+                       "problems": problems}, f, indent=2)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+
 from alt_text_langgraph import create_alt_text_workflow
 
 if __name__ == "__main__":
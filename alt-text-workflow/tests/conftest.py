@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import models
+from rate_limiter import reset_rate_limiters
+from regions import set_router
+from speculation import set_speculator
+
+
+@pytest.fixture(autouse=True)
+def fresh_backend():
+    """Undo the client factory, router, limiters and speculator a test or report installed"""
+    yield
+    models.set_client_factory(None)
+    set_router(None)
+    set_speculator(None)
+    reset_rate_limiters()
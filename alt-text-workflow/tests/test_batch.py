@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+import alt_text_main
+import batch
+
+
+@pytest.mark.parametrize("max_concurrency", ["4", 2.5, True, 0, -1])
+def test_invalid_max_concurrency_is_an_error_response(max_concurrency):
+    with pytest.raises(ValueError):
+        batch.batch_limit(max_concurrency)
+    response = asyncio.run(alt_text_main.agent_invocation(
+        {"items": [{"user_input": "A red apple"}], "max_concurrency": max_concurrency}, None))
+    assert response["status"] == "error" and response["error_type"] == "ValueError"
+
+
+def test_concurrent_batches_share_one_limit(monkeypatch):
+    monkeypatch.setenv("BATCH_MAX_CONCURRENCY", "3")
+    in_flight, peak = 0, 0
+
+    async def process(item):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return {"generated_alt_text": item["user_input"]}
+
+    monkeypatch.setattr(batch, "aprocess_item", process)
+
+    async def batches():
+        return await asyncio.gather(*(batch.arun_batch([{"user_input": f"Item {n} of batch {b}"} for n in range(6)], 3)
+                                      for b in range(4)))
+
+    results = asyncio.run(batches())
+    assert peak == 3
+    assert all(result["status"] == "ok" for results_of_batch in results for result in results_of_batch)
@@ -0,0 +1,57 @@
+import asyncio
+import json
+
+import bulk_alt_text
+from sample_images import synthetic_image
+
+
+def write_rows(path, rows, partial=""):
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows) + partial)
+
+
+def read_rows(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_resume_skips_ok_items_and_retries_failed_ones(tmp_path):
+    output = tmp_path / "alt_text.jsonl"
+    write_rows(output, [{"id": "a", "status": "ok"}, {"id": "b", "status": "error"}])
+    assert bulk_alt_text.load_completed(str(output), skip_failed=False) == {"a"}
+    assert bulk_alt_text.load_completed(str(output), skip_failed=True) == {"a", "b"}
+
+
+def test_a_partial_last_line_is_truncated(tmp_path):
+    output = tmp_path / "alt_text.jsonl"
+    write_rows(output, [{"id": "a", "status": "ok"}], partial='{"id": "b", "sta')
+    assert bulk_alt_text.load_completed(str(output), skip_failed=False) == {"a"}
+    assert read_rows(output) == [{"id": "a", "status": "ok"}]
+
+
+def test_the_last_row_for_an_id_wins_and_superseded_rows_are_compacted(tmp_path):
+    output = tmp_path / "alt_text.jsonl"
+    write_rows(output, [{"id": "a", "status": "error"}, {"id": "b", "status": "ok"},
+                        {"id": "a", "status": "ok"}, {"id": "c", "status": "error"}])
+    assert bulk_alt_text.load_completed(str(output), skip_failed=False) == {"a", "b"}
+    assert read_rows(output) == [{"id": "b", "status": "ok"}, {"id": "a", "status": "ok"}, {"id": "c", "status": "error"}]
+
+
+def test_run_resumes_from_the_output_file(tmp_path):
+    for number in range(3):
+        (tmp_path / f"{number}.png").write_bytes(synthetic_image("Simple", seed=number))
+    output = tmp_path / "alt_text.jsonl"
+    write_rows(output, [{"id": "0.png", "status": "ok"}, {"id": "1.png", "status": "error"}])
+    completed = bulk_alt_text.load_completed(str(output), skip_failed=False)
+    with open(output, "a") as f:
+        counts = asyncio.run(bulk_alt_text.run(bulk_alt_text.iter_items(str(tmp_path)), completed, f, 2, None, 0, 0))
+    assert (counts["ok"], counts["error"], counts["skipped"]) == (2, 0, 1)
+    bulk_alt_text.compact_output(str(output))
+    rows = read_rows(output)
+    assert sorted(row["id"] for row in rows) == ["0.png", "1.png", "2.png"]
+    assert all(row["status"] == "ok" for row in rows)
+
+
+def test_images_are_passed_as_raw_bytes(tmp_path):
+    image = synthetic_image("Moderate", seed=4)
+    (tmp_path / "photo.png").write_bytes(image)
+    state = bulk_alt_text.read_state({"image": str(tmp_path / "photo.png"), "user_input": "A chart"}, None)
+    assert state["image_bytes"] == image and state["image_data"] is None
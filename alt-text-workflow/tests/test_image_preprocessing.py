@@ -0,0 +1,47 @@
+import io
+
+import pytest
+from PIL import Image
+
+from image_preprocessing import decode_data_uri, prepare_image
+from sample_images import synthetic_image, to_data_uri
+
+
+def encode(image: Image.Image, image_format: str) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def test_an_image_that_fits_is_passed_through_untouched():
+    image = synthetic_image("Moderate", (800, 600))
+    prepared = prepare_image(image)
+    assert prepared["bytes"] is image and not prepared["resized"]
+
+
+def test_a_large_image_is_downscaled_to_the_dimension_limit(monkeypatch):
+    monkeypatch.setenv("MAX_IMAGE_DIMENSION", "400")
+    prepared = prepare_image(synthetic_image("Complex", (1600, 900)))
+    assert prepared["resized"] and prepared["size"] == [400, 225]
+    assert Image.open(io.BytesIO(prepared["bytes"])).size == (400, 225)
+
+
+def test_an_image_over_the_byte_budget_is_reencoded_within_it(monkeypatch):
+    monkeypatch.setenv("MAX_IMAGE_BYTES", "40000")
+    prepared = prepare_image(encode(Image.effect_noise((900, 900), 64).convert("RGB"), "PNG"))
+    assert prepared["resized"] and prepared["format"] == "jpeg" and len(prepared["bytes"]) <= 40000
+
+
+def test_oversized_uploads_are_rejected_before_decoding(monkeypatch):
+    image = synthetic_image("Simple", (800, 600))
+    monkeypatch.setenv("MAX_INPUT_IMAGE_BYTES", str(len(image) - 1))
+    with pytest.raises(ValueError, match="byte upload limit"):
+        prepare_image(image)
+    with pytest.raises(ValueError, match="byte upload limit"):
+        decode_data_uri(to_data_uri(image * 2))
+
+
+def test_images_over_the_pixel_limit_are_rejected(monkeypatch):
+    monkeypatch.setenv("MAX_INPUT_IMAGE_PIXELS", "10000")
+    with pytest.raises(ValueError, match="pixel limit"):
+        prepare_image(encode(Image.new("RGB", (200, 200), "white"), "PNG"))
@@ -0,0 +1,49 @@
+import pytest
+
+import image_store
+from fake_s3 import FakeS3Client
+from image_preprocessing import preprocess_image_reference
+from sample_images import synthetic_image
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("IMAGE_REFERENCE_BUCKETS", "uploads, other-uploads")
+    client = FakeS3Client()
+    image_store.set_s3_client(client)
+    yield client
+    image_store.set_s3_client(None)
+
+
+def test_an_allowed_reference_is_read(s3):
+    image = synthetic_image("Simple")
+    uri = image_store.upload_image(image, "uploads")
+    assert uri.startswith("s3://uploads/alt-text/")
+    assert image_store.read_image_reference(uri) == image
+    assert preprocess_image_reference(uri)["bytes"] == image
+
+
+@pytest.mark.parametrize("uri", ["s3://foreign-bucket/alt-text/key", "s3://upload/alt-text/key", "s3://uploads-x/key"])
+def test_references_to_other_buckets_are_rejected_before_any_read(s3, uri):
+    with pytest.raises(ValueError, match="not allowed"):
+        image_store.read_image_reference(uri)
+    assert s3.bytes_out == 0
+
+
+@pytest.mark.parametrize("uri", ["https://uploads.s3.amazonaws.com/key", "s3://uploads", "s3://uploads/"])
+def test_malformed_references_are_rejected(s3, uri):
+    with pytest.raises(ValueError):
+        image_store.read_image_reference(uri)
+
+
+def test_no_bucket_is_allowed_by_default(s3, monkeypatch):
+    uri = image_store.upload_image(synthetic_image("Simple"), "uploads")
+    monkeypatch.delenv("IMAGE_REFERENCE_BUCKETS")
+    with pytest.raises(ValueError, match="not allowed"):
+        image_store.read_image_reference(uri)
+
+
+def test_objects_over_the_size_limit_are_rejected(s3):
+    uri = image_store.upload_image(synthetic_image("Complex"), "uploads")
+    with pytest.raises(ValueError, match="byte upload limit"):
+        image_store.read_image_reference(uri, max_bytes=100)
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+import model_tiers
+import models
+from alt_text_langgraph import get_alt_text_workflow
+from batch import initial_state
+from fake_bedrock import FakeBedrockClient
+
+
+@pytest.fixture
+def tiers(monkeypatch):
+    monkeypatch.setenv("LIGHT_WEIGHT_MODEL", "light-model")
+    monkeypatch.setenv("DEFAULT_MODEL", "heavy-model")
+    monkeypatch.delenv("MODEL_TIERS", raising=False)
+    model_tiers.load_tiers.cache_clear()
+    yield monkeypatch
+    model_tiers.load_tiers.cache_clear()
+
+
+def test_levels_route_to_their_tier(tiers):
+    assert model_tiers.get_tier("Simple") == {"name": "Simple", "model": "light-model",
+                                              "inference_config": {"maxTokens": 100, "temperature": 0.3}}
+    assert model_tiers.get_tier("Complex")["model"] == "heavy-model"
+    assert model_tiers.get_tier(None)["name"] == "Moderate"
+
+
+def test_model_tiers_overrides_a_tier(tiers):
+    tiers.setenv("MODEL_TIERS", json.dumps({"Complex": {"model": "other-model", "stopSequences": ["</alt>"]}}))
+    model_tiers.load_tiers.cache_clear()
+    complex_tier = model_tiers.get_tier("Complex")
+    assert complex_tier["model"] == "other-model"
+    assert complex_tier["inference_config"] == {"maxTokens": 256, "temperature": 0.5, "stopSequences": ["</alt>"]}
+
+
+def test_unknown_tier_settings_are_rejected(tiers):
+    tiers.setenv("MODEL_TIERS", json.dumps({"Simple": {"max_tokens": 10}}))
+    model_tiers.load_tiers.cache_clear()
+    with pytest.raises(ValueError, match="max_tokens"):
+        model_tiers.load_tiers()
+
+
+@pytest.mark.parametrize("level, weights, model, max_tokens", [
+    ("Simple", [1, 0, 0], "light-model", 100),
+    ("Complex", [0, 0, 1], "heavy-model", 256),
+])
+def test_generation_runs_on_the_tier_of_the_analysed_level(tiers, level, weights, model, max_tokens):
+    fake = FakeBedrockClient(complexity_weights=weights)
+    models.set_client_factory(lambda region_name, model_id: fake)
+    state = get_alt_text_workflow().invoke(initial_state({"user_input": f"A {level.lower()} scene"}) | {
+        "bypass_cache": True, "generation_mode": "two_stage"})
+    assert state["complexity_level"] == level
+    assert (state["model_tier"], state["tier_model"]) == (level, model)
+    generation = fake.calls[-1]
+    assert generation["modelId"] == model and generation["inferenceConfig"]["maxTokens"] == max_tokens
@@ -0,0 +1,31 @@
+import models
+from fake_bedrock import FakeBedrockClient
+
+
+def test_the_fake_backend_is_shared_per_region_and_model(monkeypatch):
+    monkeypatch.setenv("MODEL_BACKEND", "fake")
+    models.set_client_factory(None)
+    client = models.get_client("model-a", "us-east-1")
+    assert isinstance(client, FakeBedrockClient)
+    assert models.get_client("model-a", "us-east-1") is client
+    assert models.get_client("model-a", "us-west-2") is not client
+    assert models.get_client("model-b", "us-east-1") is not client
+
+
+def test_call_claude_goes_through_the_installed_factory():
+    fake = FakeBedrockClient()
+    built = []
+    models.set_client_factory(lambda region_name, model_id: built.append(model_id) or fake)
+    text = models.call_claude("model-a", [{"role": "user", "content": [{"text": "Image description: A red apple"}]}])
+    assert "A red apple" in text
+    assert built == ["model-a"] and fake.call_count == 1
+
+
+def test_client_config_comes_from_env(monkeypatch):
+    monkeypatch.setenv("BEDROCK_MAX_POOL_CONNECTIONS", "7")
+    monkeypatch.setenv("BEDROCK_READ_TIMEOUT", "12.5")
+    monkeypatch.setenv("RATE_LIMIT", "off")
+    kwargs = models._client_config_kwargs()
+    assert kwargs["max_pool_connections"] == 7 and kwargs["read_timeout"] == 12.5
+    # Without the limiter's retries botocore retries on its own.
+    assert kwargs["retries"]["total_max_attempts"] == 3
@@ -0,0 +1,90 @@
+import io
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import alt_text_langgraph
+import near_duplicate_report
+from batch import initial_state
+from near_duplicates import PENDING_LIMIT, NearDuplicateIndex, fingerprint, informative, reusable, \
+    set_near_duplicate_index
+from sample_images import synthetic_image, to_data_uri
+
+# Default NEAR_DUPLICATE_MAX_DISTANCE
+MAX_DISTANCE = 6
+
+
+def encode(image: Image.Image, image_format: str = "PNG", **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def slide(*lines: str) -> bytes:
+    image = Image.new("RGB", (800, 600), "white")
+    draw = ImageDraw.Draw(image)
+    for number, line in enumerate(lines):
+        draw.text((60, 80 + number * 60), line, fill="black", font_size=36)
+    return encode(image)
+
+
+def test_hash_survives_resizing_and_recompression():
+    check = near_duplicate_report.robustness([near_duplicate_report.DEFAULT_IMAGE_DIR], 6)
+    assert max(check["variant_max_distance"].values()) <= MAX_DISTANCE < check["different_min_distance"]
+    assert max(check["variant_max_fine_distance"].values()) <= 10 < check["different_min_fine_distance"]
+
+
+def test_index_lookups_match_a_linear_scan():
+    assert near_duplicate_report.scale(20_000, 200, MAX_DISTANCE, seed=0)["problems"] == []
+
+
+def test_flat_and_low_detail_images_are_low_information():
+    red, blue = fingerprint(encode(Image.new("RGB", (400, 300), "red"))), fingerprint(encode(Image.new("RGB", (400, 300), "blue")))
+    assert red["dhash"] == blue["dhash"] == 0
+    assert not informative(red) and not informative(blue)
+    assert not informative(fingerprint(slide("Quarterly results", "Revenue up 12%")))
+    assert informative(fingerprint(synthetic_image("Complex", seed=1)))
+
+
+def test_reuse_needs_a_close_fine_hash_and_the_same_description():
+    image = synthetic_image("Moderate", seed=4)
+    hashes = fingerprint(image)
+    variant = fingerprint(encode(Image.open(io.BytesIO(image)).resize((400, 300)), "JPEG", quality=60))
+    other = fingerprint(synthetic_image("Moderate", seed=7))
+    match = {"fine_hash": hashes["fine_hash"], "description": "A bar chart of sales"}
+    assert reusable(match, variant) and reusable(match, variant, "a bar chart  of SALES")
+    assert not reusable(match, variant, "A line chart of costs")
+    assert not reusable(match, other)
+    assert not reusable({"fine_hash": None, "description": None}, variant)
+
+
+def test_merge_keeps_every_entry_findable():
+    rng = np.random.default_rng(0)
+    values = [int(value) for value in rng.integers(0, 2 ** 63, PENDING_LIMIT * 3)]
+    index = NearDuplicateIndex()
+    for start in range(0, len(values), 100):
+        index.add_many((value, f"alt-text {value}", "Simple", None) for value in values[start:start + 100])
+    stats = index.stats()
+    assert stats["rebuilds"] >= 2 and stats["entries"] == len(values) and len(index._pending) <= PENDING_LIMIT
+    assert all(index.lookup(value, 0)["alt_text"] == f"alt-text {value}" for value in values[::50])
+
+
+def test_reuse_mode_serves_only_a_verified_match(monkeypatch):
+    monkeypatch.setenv("NEAR_DUPLICATES", "reuse")
+    index = NearDuplicateIndex()
+    set_near_duplicate_index(index)
+    try:
+        image = synthetic_image("Complex", seed=3)
+        hashes = fingerprint(image)
+        index.add(hashes["dhash"], "Approved alt-text", "Complex", "Busy", hashes["fine_hash"], "A busy street")
+        same = alt_text_langgraph.preprocess_node(initial_state({"image_data": to_data_uri(image),
+                                                                 "user_input": "A busy street"}))
+        assert same["generated_alt_text"] == "Approved alt-text" and same["waiting_for_feedback"]
+        described = alt_text_langgraph.preprocess_node(initial_state({"image_data": to_data_uri(image),
+                                                                      "user_input": "A quiet park"}))
+        assert described["similar_alt_text"] == "Approved alt-text" and not described.get("waiting_for_feedback")
+        flat = alt_text_langgraph.preprocess_node(initial_state({
+            "image_data": to_data_uri(encode(Image.new("RGB", (400, 300), "red"))), "user_input": "A busy street"}))
+        assert flat["image_phash"] is None and flat["similar_alt_text"] is None
+    finally:
+        set_near_duplicate_index(None)
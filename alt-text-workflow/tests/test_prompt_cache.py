@@ -0,0 +1,47 @@
+import alt_text_langgraph
+import prompt_cache_report
+from fake_bedrock import FakeBedrockClient
+from models import prompt_cacheable, system_blocks, usage_stats
+
+# ~1,250 tokens at ~4 characters per token.
+LONG_PROMPT = "Describe the image for a screen reader. " * 125
+CLAUDE = "us.anthropic.claude-sonnet-4-20250514-v1:0"
+HAIKU = "anthropic.claude-3-5-haiku-20241022-v1:0"
+
+
+def test_static_instructions_are_cacheable_and_requests_stay_in_messages():
+    descriptions = prompt_cache_report.run_requests(4)
+    calls = prompt_cache_report.recorded_calls(usage_stats())
+    assert calls
+    assert prompt_cache_report.check_layout(calls, descriptions) == []
+
+
+def test_workflow_prompts_are_too_short_to_cache(monkeypatch):
+    monkeypatch.delenv("PROMPT_CACHE", raising=False)
+    for prompt in ("COMPLEXITY_PROMPT", "GENERATION_PROMPT", "FUSED_PROMPT", "REVISION_PROMPT"):
+        assert not prompt_cacheable(CLAUDE, getattr(alt_text_langgraph, prompt))
+
+
+def test_cache_point_only_for_supporting_models_and_long_prefixes(monkeypatch):
+    monkeypatch.delenv("PROMPT_CACHE", raising=False)
+    monkeypatch.delenv("PROMPT_CACHE_MIN_TOKENS", raising=False)
+    assert system_blocks(LONG_PROMPT, CLAUDE)[-1] == {"cachePoint": {"type": "default"}}
+    assert len(system_blocks(LONG_PROMPT, HAIKU)) == 1  # 2,048-token minimum
+    assert len(system_blocks(LONG_PROMPT, "meta.llama3-70b-instruct-v1:0")) == 1
+    monkeypatch.setenv("PROMPT_CACHE", "on")
+    assert len(system_blocks(LONG_PROMPT, "meta.llama3-70b-instruct-v1:0")) == 2
+    monkeypatch.setenv("PROMPT_CACHE", "off")
+    assert len(system_blocks(LONG_PROMPT, CLAUDE)) == 1
+
+
+def test_fake_backend_caches_only_prefixes_above_the_model_minimum():
+    fake = FakeBedrockClient()
+    messages = [{"role": "user", "content": [{"text": "Image description: a red bicycle"}]}]
+    cache_point = {"cachePoint": {"type": "default"}}
+    for system, model_id, reads in (([{"text": LONG_PROMPT}, cache_point], CLAUDE, True),
+                                    ([{"text": LONG_PROMPT}, cache_point], HAIKU, False),
+                                    ([{"text": "Write alt-text."}, cache_point], CLAUDE, False)):
+        fake.converse(modelId=model_id, messages=messages, system=system)
+        usage = fake.converse(modelId=model_id, messages=messages, system=system)["usage"]
+        assert (usage["cacheReadInputTokens"] > 0) == reads
+        assert usage["cacheWriteInputTokens"] == 0
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+import models
+import rate_limit_report
+from fake_bedrock import server_error
+from rate_limiter import AdaptiveRateLimiter
+
+
+def test_botocore_makes_one_attempt_while_the_limiter_retries(monkeypatch):
+    monkeypatch.delenv("BEDROCK_MAX_ATTEMPTS", raising=False)
+    monkeypatch.setenv("RATE_LIMIT", "on")
+    assert models.client_config().retries["total_max_attempts"] == 1
+    monkeypatch.setenv("RATE_LIMIT", "off")
+    assert models.client_config().retries["total_max_attempts"] == 3
+    monkeypatch.setenv("BEDROCK_MAX_ATTEMPTS", "2")
+    assert models.client_config().retries["total_max_attempts"] == 2
+
+
+def test_limited_runs_lose_no_calls_and_throttles_are_retried_once_per_attempt(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    args = rate_limit_report.parse_args(["--requests", "80", "--concurrency", "30", "--latency-ms", "20",
+                                         "--max-retries", "3"])
+    results = rate_limit_report.run_all(args)
+    assert rate_limit_report.find_problems(results, args) == []
+    assert results[-1]["http_attempts"] == 4
+
+
+def test_cancelled_aopen_releases_its_permit():
+    limiter = AdaptiveRateLimiter("fake.model", max_concurrency=1)
+
+    async def cancel_in_flight():
+        started = asyncio.Event()
+
+        async def call():
+            started.set()
+            await asyncio.sleep(10)
+
+        task = asyncio.create_task(limiter.aopen(call))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The slot is free again: the next call is admitted at once.
+        result, permit = await asyncio.wait_for(limiter.aopen(lambda: asyncio.sleep(0, "ok")), 1)
+        permit.release({})
+        return result
+
+    assert asyncio.run(cancel_in_flight()) == "ok"
+    stats = limiter.stats()
+    assert (stats["in_flight"], stats["cancelled"], stats["throttled"], stats["failed"]) == (0, 1, 0, 0)
+    assert stats["concurrency_limit"] == 1
+
+
+def test_transient_errors_are_retried_without_lowering_the_limit():
+    limiter = AdaptiveRateLimiter("fake.model", max_concurrency=4, max_error_retries=2, base_backoff=0.001)
+    errors = [server_error("Converse"), server_error("Converse")]
+
+    def call():
+        if errors:
+            raise errors.pop()
+        return "ok"
+
+    result, permit = limiter.open(call)
+    permit.release({})
+    stats = limiter.stats()
+    assert result == "ok"
+    assert (stats["error_retries"], stats["failed"], stats["succeeded"], stats["throttled"]) == (2, 2, 1, 0)
+    assert stats["concurrency_limit"] == 4 and stats["in_flight"] == 0
+
+
+def test_transient_errors_give_up_after_max_error_retries():
+    limiter = AdaptiveRateLimiter("fake.model", max_error_retries=1, base_backoff=0.001)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        raise server_error("Converse")
+
+    with pytest.raises(Exception, match="InternalServerException"):
+        limiter.open(call)
+    assert len(attempts) == 2 and limiter.stats()["in_flight"] == 0
+
+
+def test_other_errors_are_not_retried():
+    limiter = AdaptiveRateLimiter("fake.model", base_backoff=0.001)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        limiter.open(call)
+    assert len(attempts) == 1
@@ -0,0 +1,31 @@
+import asyncio
+
+import hedge_report
+import models
+from fake_bedrock import FakeBedrockClient
+from rate_limiter import rate_limiter_stats
+from regions import RegionRouter, set_router
+
+PRIMARY, SECONDARY = hedge_report.PRIMARY, hedge_report.SECONDARY
+
+
+def test_hedging_lowers_p99_and_failover_loses_no_calls():
+    args = hedge_report.parse_args(["--calls", "200", "--concurrency", "16", "--latency-ms", "40",
+                                    "--slow-rate", "0.03", "--slow-ms", "600"])
+    results = hedge_report.run_all(args)
+    assert hedge_report.find_problems(results) == []
+
+
+def test_cancelled_async_hedge_losers_free_their_rate_limiter_slots():
+    fakes = {PRIMARY: FakeBedrockClient(latency_ms=1000), SECONDARY: FakeBedrockClient(latency_ms=10)}
+    models.set_client_factory(lambda region_name, model_id: fakes[region_name or PRIMARY])
+    set_router(RegionRouter([PRIMARY, SECONDARY], hedge_delay_s=0.05, min_samples=1000))
+
+    async def calls():
+        return await asyncio.gather(*(models.acall_claude(hedge_report.MODEL_ID, hedge_report.CONVERSATION)
+                                      for _ in range(5)))
+
+    assert len(asyncio.run(calls())) == 5
+    stats = rate_limiter_stats()
+    assert sum(limiter["cancelled"] for limiter in stats.values()) == 5
+    assert all(limiter["in_flight"] == 0 for limiter in stats.values())
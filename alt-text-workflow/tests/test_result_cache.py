@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+import models
+import result_cache
+from alt_text_langgraph import get_alt_text_workflow
+from batch import initial_state
+from fake_bedrock import FakeBedrockClient
+from result_cache import ResultCache
+from sample_images import synthetic_image, to_data_uri
+from singletons import Lazy
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(result_cache, "_cache", Lazy(ResultCache))
+    result_cache.set_result_cache(ResultCache())
+    return result_cache.get_result_cache()
+
+
+def test_entries_expire_after_the_ttl():
+    cache = ResultCache(ttl_seconds=0.1)
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    time.sleep(0.15)
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_the_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("1", None, "3")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_hits_are_promoted_and_memory_hits_do_not_wait_on_sqlite(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    ResultCache(sqlite_path=path).set("key", "value")
+    cache = ResultCache(sqlite_path=path)
+    assert cache.get("key") == "value" and cache.stats()["disk_hits"] == 1
+    with cache._db_lock:
+        # A memory hit returns while another thread holds the SQLite connection.
+        thread = threading.Thread(target=cache.get, args=("key",))
+        thread.start()
+        thread.join(timeout=1)
+        assert not thread.is_alive()
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_repeat_requests_are_cached_but_revisions_always_call_the_model(fresh_cache):
+    fake = FakeBedrockClient()
+    models.set_client_factory(lambda region_name, model_id: fake)
+    workflow = get_alt_text_workflow()
+    request = initial_state({"image_data": to_data_uri(synthetic_image("Moderate", seed=9)), "user_input": "A chart"})
+    first = workflow.invoke(dict(request))
+    calls = fake.call_count
+    assert workflow.invoke(dict(request))["generated_alt_text"] == first["generated_alt_text"]
+    assert fake.call_count == calls
+
+    for _ in range(2):
+        workflow.invoke({**first, "user_input": "Mention the trend"})
+    assert fake.call_count == calls + 2
+
+
+def test_render_prometheus_reports_the_counters(fresh_cache):
+    fresh_cache.get("missing")
+    fresh_cache.set("key", "value")
+    fresh_cache.get("key")
+    text = result_cache.render_prometheus()
+    assert 'alt_text_result_cache_hits{tier="memory"} 1' in text
+    assert "alt_text_result_cache_misses 1" in text and "alt_text_result_cache_evictions 0" in text
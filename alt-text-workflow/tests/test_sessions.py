@@ -0,0 +1,70 @@
+import asyncio
+import sqlite3
+import time
+import uuid
+
+import pytest
+
+from alt_text_main import agent_invocation
+from sample_images import synthetic_image, to_data_uri
+from sessions import MemorySessionSaver, create_checkpointer, session_config
+
+
+def invoke(payload: dict) -> dict:
+    return asyncio.run(agent_invocation(payload, None))
+
+
+def checkpoint(saver, session_id: str):
+    from langgraph.checkpoint.base import empty_checkpoint
+
+    config = {"configurable": {"thread_id": session_id, "checkpoint_ns": ""}}
+    return saver.put(config, empty_checkpoint(), {}, {})
+
+
+def test_feedback_resumes_the_session_from_the_server_side_state():
+    session_id = str(uuid.uuid4())
+    first = invoke({"session_id": session_id, "image_data": to_data_uri(synthetic_image("Moderate", seed=5)),
+                    "user_input": "A chart of monthly sales"})
+    assert first["waiting_for_feedback"] and first["generated_alt_text"]
+    revised = invoke({"session_id": session_id, "feedback": "Mention the upward trend"})
+    assert revised["revision_count"] == 1 and revised["feedback_history"] == ["Mention the upward trend"]
+    approved = invoke({"session_id": session_id, "feedback": "approve"})
+    assert not approved["waiting_for_feedback"] and approved["generated_alt_text"] == revised["generated_alt_text"]
+
+
+def test_feedback_on_an_unknown_session_is_an_error_payload():
+    response = invoke({"session_id": str(uuid.uuid4()), "feedback": "approve"})
+    assert response["status"] == "error" and response["error_type"] == "ValueError"
+
+
+@pytest.mark.parametrize("store", ["memory", "sqlite"])
+def test_an_expired_session_is_never_served(tmp_path, store):
+    saver = create_checkpointer(store, ttl_seconds=0.2, sqlite_path=str(tmp_path / "sessions.sqlite"),
+                                purge_interval_seconds=3600)
+    checkpoint(saver, "kept")
+    assert saver.get_tuple(session_config("kept")) is not None
+    time.sleep(0.3)
+    assert saver.get_tuple(session_config("kept")) is None
+
+
+def test_expired_sessions_are_purged_once_per_interval():
+    saver = MemorySessionSaver(ttl_seconds=0.05, purge_interval_seconds=0.2)
+    purges = []
+    purge_expired = saver.purge_expired
+    saver.purge_expired = lambda: purges.append(1) or purge_expired()
+    checkpoint(saver, "old")
+    time.sleep(0.1)
+    for _ in range(20):
+        checkpoint(saver, "new")
+    assert len(purges) == 1
+    time.sleep(0.2)
+    checkpoint(saver, "new")
+    assert len(purges) == 2 and "old" not in saver.storage and "new" in saver.storage
+
+
+def test_sqlite_store_indexes_expiry(tmp_path):
+    path = tmp_path / "sessions.sqlite"
+    create_checkpointer("sqlite", sqlite_path=str(path))
+    indexes = sqlite3.connect(path).execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                                            "AND tbl_name = 'session_expiry'").fetchall()
+    assert ("session_expiry_expires_at",) in indexes
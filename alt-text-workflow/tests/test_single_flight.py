@@ -0,0 +1,8 @@
+import single_flight_report
+
+
+def test_identical_requests_share_one_model_call_per_stage():
+    # Long enough calls that every thread joins the flight, however its image preparation is scheduled.
+    args = single_flight_report.parse_args(["--requests", "16", "--distinct", "4", "--latency-ms", "200"])
+    results = single_flight_report.run_all(args)
+    assert single_flight_report.find_problems(results) == []
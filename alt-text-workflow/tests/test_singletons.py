@@ -0,0 +1,55 @@
+import threading
+
+from singletons import Lazy, LazyMap
+
+
+def test_lazy_builds_once_across_threads():
+    builds = []
+    barrier = threading.Barrier(8)
+    lazy = Lazy(lambda: builds.append(1) or object())
+
+    def get():
+        barrier.wait()
+        return lazy.get()
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1
+
+
+def test_lazy_keeps_none_and_set_value_until_reset():
+    builds = []
+    lazy = Lazy(lambda: builds.append(1))
+    assert lazy.get() is None and lazy.get() is None
+    assert len(builds) == 1
+    lazy.set("installed")
+    assert lazy.get() == "installed" and lazy.peek() == "installed"
+    lazy.reset()
+    assert lazy.peek() is None
+    lazy.get()
+    assert len(builds) == 2
+
+
+def test_lazy_map_builds_per_key():
+    lazy = LazyMap(lambda key: f"limiter for {key}")
+    assert lazy.get("a") == "limiter for a"
+    lazy.set("b", None)
+    assert lazy.get("b") is None
+    assert dict(lazy.items()) == {"a": "limiter for a", "b": None}
+    lazy.clear()
+    assert lazy.items() == []
+
+
+def test_lazy_map_weak_keys_drop_with_their_key():
+    class Key:
+        pass
+
+    lazy = LazyMap(lambda key: object(), weak_keys=True)
+    key = Key()
+    lazy.get(key)
+    assert len(lazy.items()) == 1
+    del key
+    assert lazy.items() == []
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+import alt_text_langgraph
+import models
+import speculative_report
+from batch import initial_state
+from fake_bedrock import FakeBedrockClient
+from rate_limiter import rate_limiter_stats
+from sample_images import synthetic_image, to_data_uri
+from speculation import Speculator, set_speculator
+
+
+@pytest.mark.filterwarnings("error::RuntimeWarning")
+def test_speculation_returns_the_two_stage_alt_text_within_its_call_budget():
+    args = speculative_report.parse_args(["--requests", "12", "--concurrency", "4", "--latency-ms", "40",
+                                          "--max-extra-ratio", "0.1", "--burst", "1"])
+    results = speculative_report.run_all(args)
+    assert speculative_report.find_problems(results, args) == []
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_failed_analysis_cancels_and_records_the_speculation(monkeypatch, mode):
+    def fail(*args, **kwargs):
+        raise RuntimeError("complexity call failed")
+
+    async def afail(*args, **kwargs):
+        fail()
+
+    monkeypatch.setattr(alt_text_langgraph, "analyse_complexity", fail)
+    monkeypatch.setattr(alt_text_langgraph, "aanalyse_complexity", afail)
+    speculator = Speculator()
+    set_speculator(speculator)
+    state = alt_text_langgraph.preprocess_node(initial_state({
+        "image_data": to_data_uri(synthetic_image("Simple", seed=1)), "user_input": f"Failing analysis, {mode}"}))
+    with pytest.raises(RuntimeError):
+        if mode == "sync":
+            alt_text_langgraph.speculative_generation_node(state)
+        else:
+            asyncio.run(alt_text_langgraph.aspeculative_generation_node(state))
+    stats = speculator.stats()
+    assert stats["speculated"] == 1 and stats["misses"] == 1
+
+
+def test_async_miss_frees_the_rate_limiter_slot_of_the_cancelled_speculation(monkeypatch):
+    async def analysis(*args, **kwargs):
+        # Long enough for the speculative call to be waiting on the model.
+        await asyncio.sleep(0.05)
+        return "COMPLEXITY: Complex\nREASONING: Dense chart."
+
+    models.set_client_factory(lambda region_name, model_id: FakeBedrockClient(latency_ms=300))
+    monkeypatch.setattr(alt_text_langgraph, "predict_level", lambda image_bytes: "Simple")
+    monkeypatch.setattr(alt_text_langgraph, "aanalyse_complexity", analysis)
+    set_speculator(Speculator())
+    state = alt_text_langgraph.preprocess_node(initial_state({
+        "image_data": to_data_uri(synthetic_image("Simple", seed=2)), "user_input": "Speculation miss"}))
+    state = asyncio.run(alt_text_langgraph.aspeculative_generation_node(state))
+    assert state["speculation"] == "miss"
+    stats = rate_limiter_stats()
+    assert sum(limiter["cancelled"] for limiter in stats.values()) == 1
+    assert all(limiter["in_flight"] == 0 for limiter in stats.values())
@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+from alt_text_langgraph import visible_alt_text
+from alt_text_main import agent_invocation
+
+
+@pytest.mark.parametrize("partial, visible", [
+    ("ALT", ""),
+    ("ALT-TEXT:", ""),
+    ("ALT-TEXT: a red", "A red"),
+    ("COMPLEXITY: Simple\nREASONING: One object\nALT-TEXT: a red apple", "A red apple"),
+    ("A red apple", "A red apple"),
+])
+def test_visible_alt_text_holds_back_everything_before_the_marker(partial, visible):
+    assert visible_alt_text(partial) == visible
+
+
+def test_visible_alt_text_waits_for_the_marker_when_required():
+    assert visible_alt_text("COMPLEXITY: Simple", require_marker=True) == ""
+    assert visible_alt_text("COMPLEXITY: Simple\nALT-TEXT: an apple", require_marker=True) == "An apple"
+
+
+def test_streamed_tokens_add_up_to_the_final_alt_text():
+    async def events():
+        stream = await agent_invocation({"user_input": "A lighthouse on a rocky coast at dusk", "stream": True,
+                                         "bypass_cache": True}, None)
+        return [event async for event in stream]
+
+    events = asyncio.run(events())
+    tokens = "".join(event["text"] for event in events if event["event"] == "token")
+    assert events[-1]["event"] == "result"
+    assert tokens and tokens.strip() == events[-1]["state"]["generated_alt_text"]
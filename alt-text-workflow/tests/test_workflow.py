@@ -0,0 +1,13 @@
+from alt_text_langgraph import apply_fused_response
+
+
+def test_fused_response_with_marker():
+    state = apply_fused_response({}, "COMPLEXITY: Simple\nREASONING: One object\nALT-TEXT: a red bicycle.")
+    assert state["generated_alt_text"] == "A red bicycle."
+    assert state["complexity_level"] == "Simple"
+
+
+def test_fused_response_without_marker_drops_the_analysis_lines():
+    state = apply_fused_response({}, "COMPLEXITY: Moderate\nREASONING: Two objects\nA cat on a red sofa.")
+    assert state["generated_alt_text"] == "A cat on a red sofa."
+    assert state["complexity_level"] == "Moderate" and state["complexity_reasoning"] == "Two objects"
@@ -0,0 +1,101 @@
+"""Compare inline base64 image payloads with s3:// image references.
+
+    python3 transport_report.py --repeat 20 --s3-latency-ms 0 --output transport.json
+
+For each sample image (images/ plus synthetic images of --sizes) the request is
+built both ways, against the in-process FakeS3Client:
+- inline: base64 data-URI inside the JSON body, decoded again by the backend;
+- reference: raw bytes uploaded once, the JSON body carries only "s3://bucket/key"
+  and the backend reads the bytes back from the store.
+Reported per image: request body bytes, client time (encode or upload, plus JSON
+serialisation), backend time (JSON parsing plus `preprocess` image preparation),
+as medians over --repeat runs. Time spent sending the body over the network
+comes on top and grows with the body size.
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import statistics
+import time
+
+from PIL import Image
+
+from fake_s3 import FakeS3Client
+from image_preprocessing import preprocess_image_data, preprocess_image_reference
+from image_store import set_s3_client, upload_image
+from sample_images import DEFAULT_IMAGE_DIR, iter_image_files, synthetic_image
+
+BUCKET = "alt-text-transport-report"
+
+
+def inline_request(image_bytes: bytes, image_format: str) -> bytes:
+    data_uri = f"data:image/{image_format};base64,{base64.b64encode(image_bytes).decode()}"
+    return json.dumps({"image_data": data_uri, "user_input": "A sample image"}).encode("utf-8")
+
+
+def reference_request(image_bytes: bytes, image_format: str) -> bytes:
+    image_ref = upload_image(image_bytes, BUCKET, content_type=f"image/{image_format}")
+    return json.dumps({"image_ref": image_ref, "user_input": "A sample image"}).encode("utf-8")
+
+
+def serve(body: bytes) -> dict:
+    payload = json.loads(body)
+    if payload.get("image_ref"):
+        return preprocess_image_reference(payload["image_ref"])
+    return preprocess_image_data(payload["image_data"])
+
+
+def measure(image_bytes: bytes, build, repeat: int) -> dict:
+    image_format = (Image.open(io.BytesIO(image_bytes)).format or "JPEG").lower()
+    client_ms, backend_ms = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = build(image_bytes, image_format)
+        client_ms.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        serve(body)
+        backend_ms.append((time.perf_counter() - started) * 1000)
+    return {"request_bytes": len(body), "client_ms": round(statistics.median(client_ms), 2),
+            "backend_ms": round(statistics.median(backend_ms), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", nargs="*", default=[DEFAULT_IMAGE_DIR], help="image files or directories")
+    parser.add_argument("--sizes", default="640x480,1568x1176", help="synthetic image sizes")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--s3-latency-ms", type=float, default=0, help="simulated latency of every object-store call")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    args = parser.parse_args()
+
+    os.environ["IMAGE_REFERENCE_BUCKETS"] = BUCKET
+    set_s3_client(FakeS3Client(latency_ms=args.s3_latency_ms))
+
+    inputs = []
+    for path in iter_image_files(args.images):
+        with open(path, "rb") as f:
+            inputs.append((os.path.basename(path), f.read()))
+    for size in args.sizes.split(","):
+        width, height = (int(part) for part in size.split("x"))
+        inputs.append((f"synthetic {size}", synthetic_image("Complex", (width, height), seed=width)))
+
+    results = []
+    print(f"{'image':<22}{'mode':<11}{'body bytes':>12}{'client ms':>11}{'backend ms':>12}")
+    for name, image_bytes in inputs:
+        for mode, build in (("inline", inline_request), ("reference", reference_request)):
+            row = {"image": name, "mode": mode, "image_bytes": len(image_bytes), **measure(image_bytes, build, args.repeat)}
+            results.append(row)
+            print(f"{name:<22}{mode:<11}{row['request_bytes']:>12,}{row['client_ms']:>11.2f}{row['backend_ms']:>12.2f}")
+        inline, reference = results[-2], results[-1]
+        print(f"{'':<22}{'saved':<11}{1 - reference['request_bytes'] / inline['request_bytes']:>12.1%}"
+              f"{inline['client_ms'] - reference['client_ms']:>11.2f}{inline['backend_ms'] - reference['backend_ms']:>12.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()